@@ -43,6 +43,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'accounts.middleware.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -82,6 +83,107 @@ DATABASES = {
     }
 }
 
+# CASHLY_DB_MODE=production: WAL, настроенные PRAGMA (accounts/db.py) и постоянные соединения
+DB_MODE = os.environ.get('CASHLY_DB_MODE', 'default')
+
+# применяются только в режиме production
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': int(os.environ.get('CASHLY_SQLITE_BUSY_TIMEOUT_MS', '5000')),
+    'mmap_size': int(os.environ.get('CASHLY_SQLITE_MMAP_SIZE', str(256 * 1024 * 1024))),
+    'cache_size': int(os.environ.get('CASHLY_SQLITE_CACHE_SIZE', '-65536')),  # отрицательное значение в KiB
+    'temp_store': 'MEMORY',
+}
+
+if DB_MODE == 'production':
+    DATABASES['default'].update({
+        'CONN_MAX_AGE': int(os.environ.get('CASHLY_DB_CONN_MAX_AGE', '600')),
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            # сразу берём блокировку на запись, без взаимных SQLITE_BUSY при её повышении
+            'transaction_mode': 'IMMEDIATE',
+            'timeout': int(os.environ.get('CASHLY_SQLITE_BUSY_TIMEOUT_MS', '5000')) / 1000,
+        },
+    })
+
+DATABASE_ROUTERS = []
+
+# CASHLY_SHARDS=N: данные юзеров (профиль, операции, бюджеты, цели, итоги) раскладываются
+# по N файлам shard0..shardN-1, default хранит юзеров, сессии и таблицу размещения UserShard.
+# Базы создаются командой migrate_shards, юзер переносится командой move_user_shard
+SHARD_COUNT = int(os.environ.get('CASHLY_SHARDS', '0'))
+SHARD_DIR = Path(os.environ.get('CASHLY_SHARD_DIR', BASE_DIR))
+SHARD_DATABASES = [f'shard{i}' for i in range(SHARD_COUNT)]
+
+for i, alias in enumerate(SHARD_DATABASES):
+    DATABASES[alias] = {**DATABASES['default'], 'NAME': SHARD_DIR / f'shard{i}.sqlite3'}
+
+if SHARD_DATABASES:
+    DATABASE_ROUTERS.append('accounts.routers.ShardRouter')
+
+
+# Cache
+# https://docs.djangoproject.com/en/6.0/topics/cache/
+# для файлового кэша: CASHLY_CACHE_BACKEND=django.core.cache.backends.filebased.FileBasedCache
+# и CASHLY_CACHE_LOCATION=/path/to/cache/dir
+
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get('CASHLY_CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('CASHLY_CACHE_LOCATION', 'cashly'),
+    }
+}
+
+# с общим кэшем (файловый, memcached, redis) сессии читаются из него, в БД только запись и промах.
+# locmem у каждого воркера свой: logout чистил бы только кэш своего процесса, а остальные
+# продолжали бы пускать по старой куке — поэтому с ним сессии остаются в БД
+SHARED_CACHE = CACHES['default']['BACKEND'] != 'django.core.cache.backends.locmem.LocMemCache'
+SESSION_ENGINE = os.environ.get(
+    'CASHLY_SESSION_ENGINE',
+    'django.contrib.sessions.backends.cached_db' if SHARED_CACHE else 'django.contrib.sessions.backends.db',
+)
+
+
+# Authentication
+# ModelBackend остаётся для сессий, выданных до ProfileModelBackend, иначе их бы разлогинило
+
+AUTHENTICATION_BACKENDS = [
+    'accounts.backends.ProfileModelBackend',
+    'django.contrib.auth.backends.ModelBackend',
+]
+
+
+# метрики запросов: заголовок Server-Timing для devtools браузера
+SERVER_TIMING_HEADER = os.environ.get('CASHLY_SERVER_TIMING', '') == '1'
+
+
+# CASHLY_REPLICA_DB=/path/to/replica.sqlite3: сводки и отчёты читаются со снапшота
+# (обновляется командой snapshot_replica), запись всегда в default
+REPLICA_DB = os.environ.get('CASHLY_REPLICA_DB')
+REPLICA_PIN_SECONDS = int(os.environ.get('CASHLY_REPLICA_PIN_SECONDS', '60'))
+
+if REPLICA_DB:
+    REPLICA_DATABASE = 'replica'
+    DATABASES[REPLICA_DATABASE] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': f'file:{REPLICA_DB}?mode=ro',
+        'OPTIONS': {'uri': True},
+        'CONN_MAX_AGE': 0,
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_ROUTERS.append('accounts.routers.ReplicaRouter')
+    MIDDLEWARE.insert(
+        MIDDLEWARE.index('django.contrib.auth.middleware.AuthenticationMiddleware') + 1,
+        'accounts.middleware.ReplicaPinMiddleware',
+    )
+
+if SHARD_DATABASES:
+    MIDDLEWARE.insert(
+        MIDDLEWARE.index('django.contrib.auth.middleware.AuthenticationMiddleware') + 1,
+        'accounts.middleware.ShardMiddleware',
+    )
+
 
 # Password validation
 # https://docs.djangoproject.com/en/6.0/ref/settings/#auth-password-validators
@@ -0,0 +1,17 @@
+"""
+Settings for the test suite (manage.py test picks them up by default).
+"""
+
+from .settings import *  # noqa: F401,F403
+from .settings import BASE_DIR, DATABASES
+
+# тестовые базы в файлах: TransactionTestCase с командами шардирования и ASGI-обработчиком
+# ходят в базу из других соединений. Два шарда и отстающая реплика — отдельные базы,
+# роутеры включают сами тесты
+DATABASES['default']['TEST'] = {'NAME': BASE_DIR / 'test_db.sqlite3'}
+for alias in ('shard0', 'shard1', 'replica'):
+    DATABASES.setdefault(alias, {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / f'test_{alias}.sqlite3',
+        'TEST': {'NAME': BASE_DIR / f'test_{alias}.sqlite3'},
+    })
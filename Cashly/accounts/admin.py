@@ -1,5 +1,208 @@
+from django import forms
 from django.contrib import admin
-from .models import UserProfile, Expense, Income, Budget, FinancialGoal
+from django.contrib.admin.options import IncorrectLookupParameters
+from django.contrib.admin.widgets import AutocompleteSelect
+from django.contrib.auth.models import User
+from django.conf import settings
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Case, F, IntegerField, Max, Min, Q, QuerySet, When
+from django.utils import timezone
+from django.utils.functional import cached_property
+from datetime import date, datetime, time
+from .models import UserProfile, Expense, Income, Budget, FinancialGoal, MonthlyTotal, OutboundEmail, UserShard, AccountPurge
+from .routers import replica_reads
+from .search import matching_ids, search_available
+
+
+# списки в админке читаются с реплики (если она настроена), формы и сохранение идут в основную базу
+class ReplicaChangelistMixin:
+    def changelist_view(self, request, extra_context=None):
+        with replica_reads():
+            response = super().changelist_view(request, extra_context)
+            # TemplateResponse рендерится лениво, строки выбираются прямо в шаблоне
+            if hasattr(response, 'render'):
+                response.render()
+        return response
+
+
+# без фильтров на больших таблицах точный COUNT(*) медленнее самой страницы
+ESTIMATED_COUNT_THRESHOLD = 100000
+
+
+# число строк по статистике планировщика: sqlite_stat1 (появляется после ANALYZE) или pg_class
+def estimated_row_count(model, using):
+    connection = connections[using]
+    table = model._meta.db_table
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            # таблицы статистики нет, пока ни разу не запускали ANALYZE
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'sqlite_stat1'")
+            if cursor.fetchone() is None:
+                return None
+            cursor.execute('SELECT stat FROM sqlite_stat1 WHERE tbl = %s LIMIT 1', [table])
+            row = cursor.fetchone()
+            return int(row[0].split()[0]) if row else None
+        if connection.vendor == 'postgresql':
+            cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE oid = to_regclass(%s)', [table])
+            row = cursor.fetchone()
+            return row[0] if row and row[0] > 0 else None
+    return None
+
+
+class EstimatedCountPaginator(Paginator):
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not queryset.query.where:
+            estimate = estimated_row_count(queryset.model, queryset.db)
+            if estimate is not None and estimate >= ESTIMATED_COUNT_THRESHOLD:
+                return estimate
+        return super().count
+
+
+def _next_period(day, kind):
+    if kind == 'year':
+        return date(day.year + 1, 1, 1)
+    if kind == 'month':
+        return date(day.year + day.month // 12, day.month % 12 + 1, 1)
+    return date.fromordinal(day.toordinal() + 1)
+
+
+def _truncate(day, kind):
+    if kind == 'year':
+        return date(day.year, 1, 1)
+    if kind == 'month':
+        return day.replace(day=1)
+    return day
+
+
+# date_hierarchy на индексах: вместо DISTINCT date_trunc() по всей таблице (питоновская
+# функция на каждую строку) — по одному MIN(date) >= начала следующего периода
+class IndexedDateQuerySet(QuerySet):
+    # start_of(значение) -> (период, начало следующего периода в единицах поля)
+    def _seek_periods(self, field_name, start_of, order):
+        queryset = self.order_by()
+        found = []
+        value = queryset.aggregate(first=Min(field_name))['first']
+        while value is not None:
+            period, next_start = start_of(value)
+            found.append(period)
+            # новая граница должна стоять первой: из нескольких date >= ... sqlite ищет по индексу по первому
+            after = self.model._default_manager.using(queryset.db).filter(
+                **{f'{field_name}__gte': next_start}
+            ) & queryset
+            value = after.aggregate(first=Min(field_name))['first']
+        return found if order == 'ASC' else found[::-1]
+
+    def dates(self, field_name, kind, order='ASC'):
+        if kind not in ('year', 'month', 'day'):
+            return super().dates(field_name, kind, order)
+        return self._seek_periods(field_name, lambda day: (_truncate(day, kind), _next_period(day, kind)), order)
+
+    # DateTimeField (created_at у целей): периоды считаются в текущей таймзоне, как у QuerySet.datetimes
+    def datetimes(self, field_name, kind, order='ASC', tzinfo=None):
+        if kind not in ('year', 'month', 'day'):
+            return super().datetimes(field_name, kind, order, tzinfo)
+        tz = (tzinfo or timezone.get_current_timezone()) if settings.USE_TZ else None
+
+        def midnight(day):
+            moment = datetime.combine(day, time.min)
+            return timezone.make_aware(moment, tz) if tz else moment
+
+        def start_of(moment):
+            day = (timezone.localtime(moment, tz) if tz else moment).date()
+            return midnight(_truncate(day, kind)), midnight(_next_period(day, kind))
+
+        return self._seek_periods(field_name, start_of, order)
+
+    # sqlite берёт MIN/MAX из индекса, только если агрегат в запросе один
+    def aggregate(self, *args, **kwargs):
+        if args or len(kwargs) < 2 or not all(type(value) in (Min, Max) for value in kwargs.values()):
+            return super().aggregate(*args, **kwargs)
+        result = {}
+        for name, value in kwargs.items():
+            result.update(super().aggregate(**{name: value}))
+        return result
+
+
+# фильтр по юзеру через автодополнение: в сайдбар не грузится список всех юзеров
+class UserAutocompleteFilter(admin.SimpleListFilter):
+    title = 'user'
+    parameter_name = 'user__id__exact'
+    template = 'admin/accounts/user_autocomplete_filter.html'
+
+    def lookups(self, request, model_admin):
+        return ()
+
+    def has_output(self):
+        return True
+
+    def queryset(self, request, queryset):
+        if not self.value():
+            return queryset
+        if not self.value().isdigit():
+            raise IncorrectLookupParameters(f'Invalid user id: {self.value()}')
+        return queryset.filter(user_id=self.value())
+
+    def choices(self, changelist):
+        yield {
+            'selected': self.value() is None,
+            'query_string': changelist.get_query_string(remove=[self.parameter_name]),
+            'display': 'All',
+        }
+        field = forms.ModelChoiceField(
+            User.objects.all(), required=False,
+            widget=AutocompleteSelect(changelist.model._meta.get_field('user'), changelist.model_admin.admin_site),
+        )
+        # выбранный юзер подставляется в ссылку вместо __user__
+        yield {
+            'selected': self.value() is not None,
+            'query_string': changelist.get_query_string({self.parameter_name: '__user__'}),
+            'widget': field.widget.render('user', self.value(), attrs={'id': 'changelist-filter-user'}),
+        }
+
+
+# большие таблицы юзеров: юзер подгружается join'ом, выбирается автодополнением, счётчик примерный
+class LargeTableAdminMixin:
+    list_select_related = ('user',)
+    autocomplete_fields = ('user',)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    @property
+    def media(self):
+        return super().media + AutocompleteSelect(self.model._meta.get_field('user'), self.admin_site).media
+
+    def get_queryset(self, request):
+        queryset = super().get_queryset(request)
+        return IndexedDateQuerySet(queryset.model, queryset.query, queryset._db, queryset._hints)
+
+
+# бюджеты хранят категории расходов, фильтр без SELECT DISTINCT по таблице
+class BudgetCategoryFilter(admin.SimpleListFilter):
+    title = 'category'
+    parameter_name = 'category'
+
+    def lookups(self, request, model_admin):
+        return Expense.CATEGORIES
+
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(category=self.value())
+        return queryset
+
+
+# поиск по описанию через FTS5 вместо LIKE '%...%' по всей таблице, плюс точное имя юзера
+class FullTextSearchMixin:
+    def get_search_results(self, request, queryset, search_term):
+        term = search_term.strip()
+        ids = matching_ids(self.model, term) if search_available(connections[queryset.db]) else None
+        if ids is None:
+            return super().get_search_results(request, queryset, search_term)
+        users = User.objects.filter(username=term).values('pk')
+        return queryset.filter(Q(pk__in=ids) | Q(user__in=users)), False
+
 
 # профили юзеров
 @admin.register(UserProfile)
@@ -7,38 +210,104 @@ class UserProfileAdmin(admin.ModelAdmin):
     list_display = ('user', 'created_at', 'updated_at')
     search_fields = ('user__username', 'user__email')
     readonly_fields = ('created_at', 'updated_at')
+    autocomplete_fields = ('user',)
 
 
 # расходы
 @admin.register(Expense)
-class ExpenseAdmin(admin.ModelAdmin):
+class ExpenseAdmin(FullTextSearchMixin, LargeTableAdminMixin, ReplicaChangelistMixin, admin.ModelAdmin):
     list_display = ('user', 'description', 'category', 'amount', 'date')
-    list_filter = ('category', 'date', 'user')
+    list_filter = ('category', 'date', UserAutocompleteFilter)
     search_fields = ('description', 'user__username')
+    date_hierarchy = 'date'
     ordering = ('-date',)
 
 
 # доходы
 @admin.register(Income)
-class IncomeAdmin(admin.ModelAdmin):
+class IncomeAdmin(FullTextSearchMixin, LargeTableAdminMixin, ReplicaChangelistMixin, admin.ModelAdmin):
     list_display = ('user', 'description', 'source', 'amount', 'date')
-    list_filter = ('source', 'date', 'user')
+    list_filter = ('source', 'date', UserAutocompleteFilter)
     search_fields = ('description', 'user__username')
+    date_hierarchy = 'date'
     ordering = ('-date',)
 
 
 # бюджеты
 @admin.register(Budget)
-class BudgetAdmin(admin.ModelAdmin):
+class BudgetAdmin(LargeTableAdminMixin, ReplicaChangelistMixin, admin.ModelAdmin):
     list_display = ('user', 'category', 'limit', 'month')
-    list_filter = ('category', 'month', 'user')
+    list_filter = (BudgetCategoryFilter, 'month', UserAutocompleteFilter)
     search_fields = ('user__username',)
+    date_hierarchy = 'month'
 
 
 @admin.register(FinancialGoal)
-class FinancialGoalAdmin(admin.ModelAdmin):
+class FinancialGoalAdmin(LargeTableAdminMixin, ReplicaChangelistMixin, admin.ModelAdmin):
     list_display = ('user', 'name', 'target', 'saved', 'percent')
-    list_filter = ('created_at', 'user')
+    list_filter = ('created_at', UserAutocompleteFilter)
     search_fields = ('name', 'user__username')
     readonly_fields = ('created_at',)
+    date_hierarchy = 'created_at'
+
+    # процент считается в базе (целые центы, деление нацело как int() в модели), по нему можно сортировать
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(percent_value=Case(
+            When(target=0, then=0),
+            default=F('saved') * 100 / F('target'),
+            output_field=IntegerField(),
+        ))
+
+    @admin.display(description='Percent', ordering='percent_value')
+    def percent(self, goal):
+        return goal.percent_value
+
+
+
+# помесячные итоги
+@admin.register(MonthlyTotal)
+class MonthlyTotalAdmin(admin.ModelAdmin):
+    list_display = ('user', 'year_month', 'kind', 'category', 'total', 'count')
+    list_filter = ('kind', 'year_month')
+    search_fields = ('user__username',)
+    readonly_fields = ('user', 'year_month', 'kind', 'category', 'total', 'count')
+
+
+# очередь писем
+@admin.register(OutboundEmail)
+class OutboundEmailAdmin(admin.ModelAdmin):
+    list_display = ('to', 'subject', 'status', 'attempts', 'next_attempt_at', 'sent_at')
+    list_filter = ('status',)
+    search_fields = ('to', 'subject')
+    readonly_fields = ('created_at', 'sent_at')
+
+
+# размещение юзеров по шардам
+@admin.register(UserShard)
+class UserShardAdmin(admin.ModelAdmin):
+    list_display = ('user', 'database', 'locked', 'updated_at')
+    list_filter = ('database', 'locked')
+    search_fields = ('user__username',)
+    readonly_fields = ('user', 'database', 'locked', 'updated_at')
+
+
+# очередь удаления аккаунтов и прогресс
+@admin.register(AccountPurge)
+class AccountPurgeAdmin(admin.ModelAdmin):
+    list_display = ('username', 'user_id', 'status', 'attempts', 'rows_deleted', 'created_at', 'updated_at', 'finished_at')
+    list_filter = ('status',)
+    search_fields = ('username',)
+    readonly_fields = (
+        'user_id', 'username', 'status', 'rows_deleted', 'attempts', 'next_attempt_at', 'last_error',
+        'created_at', 'updated_at', 'finished_at',
+    )
+    actions = ['retry_purges']
 
+    # повторы кончились: после исправления причины удаление можно запустить заново
+    @admin.action(description='Retry selected failed purges')
+    def retry_purges(self, request, queryset):
+        count = queryset.filter(status=AccountPurge.FAILED).update(
+            status=AccountPurge.PENDING, attempts=0, next_attempt_at=timezone.now(), last_error='',
+            updated_at=timezone.now(),
+        )
+        self.message_user(request, f'{count} purges queued again')
@@ -0,0 +1,245 @@
+from django.http import JsonResponse
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition, require_GET, require_POST, require_http_methods
+from datetime import date
+from decimal import Decimal, InvalidOperation
+from functools import wraps
+import json
+
+from .models import Expense, Income, FinancialGoal
+from .importer import parse_transaction_row
+from .search import search_transactions, SEARCH_MAX_RESULTS
+from .services import build_api_summary, bulk_create_transactions, get_ledger_page, LEDGER_PAGE_SIZE
+from .summary_cache import cached_summary, get_data_version
+
+API_MAX_PAGE_SIZE = 200
+API_MAX_BATCH_SIZE = 5000
+
+
+# для API вместо редиректа на логин отдаём 401
+def api_login_required(view):
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if not request.user.is_authenticated:
+            return JsonResponse({'error': 'Authentication required'}, status=401)
+        return view(request, *args, **kwargs)
+    return wrapper
+
+
+# ETag из версии данных юзера: пока он ничего не записал, ответ не меняется и
+# повторный запрос с If-None-Match получает 304 без единого агрегата
+def data_etag(request, *args, **kwargs):
+    return f'{request.user.pk}-{get_data_version(request.user.pk)}-{date.today().isoformat()}'
+
+
+def _read_json(request, expected=dict):
+    try:
+        data = json.loads(request.body or b'{}')
+    except (UnicodeDecodeError, ValueError):
+        return None
+    return data if isinstance(data, expected) else None
+
+
+# значения из JSON приводим к строкам, как в CSV
+def _transaction_row(data, kind=None):
+    row = {key: '' if value is None else str(value) for key, value in data.items()}
+    if kind:
+        row['type'] = kind
+    return parse_transaction_row(row)
+
+
+def _error(message, status=400):
+    return JsonResponse({'error': message}, status=status)
+
+
+def transaction_json(entry, kind):
+    return {
+        'id': entry.pk,
+        'type': kind,
+        'date': entry.date,
+        'description': entry.description,
+        'category': entry.category if kind == 'expense' else entry.source,
+        'amount': entry.amount,
+    }
+
+
+def goal_json(goal):
+    return {
+        'id': goal.pk,
+        'name': goal.name,
+        'icon': goal.icon,
+        'target': goal.target,
+        'saved': goal.saved,
+        'percent': goal.percent,
+        'created_at': goal.created_at,
+    }
+
+
+@require_GET
+@api_login_required
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=data_etag)
+def summary_api(request):
+    return JsonResponse(cached_summary('api_summary', request.user, lambda: build_api_summary(request.user)))
+
+
+# лента операций с курсором, как на странице истории
+@require_GET
+@api_login_required
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=data_etag)
+def transactions_api(request):
+    try:
+        limit = min(max(int(request.GET.get('limit', LEDGER_PAGE_SIZE)), 1), API_MAX_PAGE_SIZE)
+    except ValueError:
+        return _error('limit must be a number')
+    try:
+        date_from = date.fromisoformat(request.GET['date_from']) if request.GET.get('date_from') else None
+        date_to = date.fromisoformat(request.GET['date_to']) if request.GET.get('date_to') else None
+    except ValueError:
+        return _error('dates must be in YYYY-MM-DD format')
+    with_balance = request.GET.get('balance') == '1'
+
+    entries, next_cursor = get_ledger_page(
+        request.user,
+        after=request.GET.get('after'),
+        limit=limit,
+        category=request.GET.get('category') or None,
+        source=request.GET.get('source') or None,
+        date_from=date_from,
+        date_to=date_to,
+        with_balance=with_balance,
+    )
+    results = []
+    for entry in entries:
+        result = transaction_json(entry, entry.kind)
+        if with_balance:
+            result['balance'] = entry.balance
+        results.append(result)
+    return JsonResponse({
+        'results': results,
+        'next': next_cursor,
+    })
+
+
+# поиск по описаниям операций: по релевантности, слова ищутся по префиксу
+@require_GET
+@api_login_required
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=data_etag)
+def search_api(request):
+    text = request.GET.get('q', '').strip()
+    if not text:
+        return _error('q is required')
+    try:
+        limit = min(max(int(request.GET.get('limit', 50)), 1), SEARCH_MAX_RESULTS)
+    except ValueError:
+        return _error('limit must be a number')
+
+    entries = search_transactions(request.user, text, limit=limit)
+    return JsonResponse({'results': [transaction_json(entry, entry.kind) for entry in entries]})
+
+
+def _create_transaction(request, kind):
+    data = _read_json(request)
+    if data is None:
+        return _error('Request body must be a JSON object')
+
+    try:
+        kind, day, description, category, amount = _transaction_row(data, kind)
+    except ValueError as e:
+        return _error(str(e))
+
+    if kind == 'expense':
+        entry = Expense.objects.create(
+            user=request.user, description=description, category=category, amount=amount, date=day
+        )
+    else:
+        entry = Income.objects.create(
+            user=request.user, description=description, source=category, amount=amount, date=day
+        )
+    return JsonResponse(transaction_json(entry, kind), status=201)
+
+
+@require_POST
+@api_login_required
+def expenses_api(request):
+    return _create_transaction(request, 'expense')
+
+
+@require_POST
+@api_login_required
+def incomes_api(request):
+    return _create_transaction(request, 'income')
+
+
+# много операций за один запрос: {"entries": [{"type": "expense", ...}, ...]}.
+# Ошибочные записи не мешают остальным, результат по каждой в том же порядке
+@require_POST
+@api_login_required
+def transactions_batch_api(request):
+    data = _read_json(request)
+    entries = data.get('entries') if data is not None else None
+    if not isinstance(entries, list):
+        return _error('Request body must be a JSON object with an "entries" list')
+    if len(entries) > API_MAX_BATCH_SIZE:
+        return _error(f'At most {API_MAX_BATCH_SIZE} entries per request', status=413)
+
+    results = [None] * len(entries)
+    parsed = []
+    positions = []
+    for index, entry in enumerate(entries):
+        try:
+            if not isinstance(entry, dict):
+                raise ValueError('entry must be an object')
+            parsed.append(_transaction_row(entry))
+            positions.append(index)
+        except ValueError as e:
+            results[index] = {'index': index, 'status': 'error', 'error': str(e)}
+
+    created = bulk_create_transactions(request.user, parsed)
+    for index, entry in zip(positions, created):
+        kind = 'expense' if isinstance(entry, Expense) else 'income'
+        results[index] = {'index': index, 'status': 'created', 'type': kind, 'id': entry.pk}
+
+    status = 201 if len(created) == len(entries) else 200 if created else 400
+    return JsonResponse({
+        'created': len(created),
+        'failed': len(entries) - len(created),
+        'results': results,
+    }, status=status)
+
+
+@require_http_methods(['GET', 'POST'])
+@api_login_required
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=data_etag)
+def goals_api(request):
+    if request.method == 'GET':
+        goals = cached_summary(
+            'api_goals', request.user,
+            lambda: [goal_json(goal) for goal in FinancialGoal.objects.filter(user=request.user).order_by('id')]
+        )
+        return JsonResponse({'results': goals})
+
+    data = _read_json(request)
+    if data is None:
+        return _error('Request body must be a JSON object')
+    name = str(data.get('name') or '').strip()
+    if not name or len(name) > 200:
+        return _error('name must be 1-200 characters')
+    icon = str(data.get('icon') or '🎯')
+    if len(icon) > 10:
+        return _error('icon is longer than 10 characters')
+    try:
+        target = Decimal(str(data.get('target'))).quantize(Decimal('0.01'))
+        saved = Decimal(str(data.get('saved') or 0)).quantize(Decimal('0.01'))
+    except InvalidOperation:
+        return _error('target and saved must be numbers')
+    if not (target.is_finite() and saved.is_finite()) or target < 0 or saved < 0:
+        return _error('target and saved must be non-negative numbers')
+    if max(target, saved) >= Decimal('10000000000000'):
+        return _error('target and saved are out of range')
+
+    goal = FinancialGoal.objects.create(user=request.user, name=name, icon=icon, target=target, saved=saved)
+    return JsonResponse(goal_json(goal), status=201)
@@ -0,0 +1,28 @@
+from django.contrib.auth.backends import ModelBackend
+from django.contrib.auth.models import User
+
+from .routers import shard_databases
+
+
+# юзер на каждый запрос грузится вместе с профилем одним join'ом, request.user.profile уже без запроса.
+# при шардировании профиль лежит в шарде, join между базами невозможен — он подгрузится отдельно
+class ProfileModelBackend(ModelBackend):
+    def users(self):
+        users = User._default_manager.all()
+        if not shard_databases():
+            users = users.select_related('profile')
+        return users
+
+    def get_user(self, user_id):
+        try:
+            user = self.users().get(pk=user_id)
+        except User.DoesNotExist:
+            return None
+        return user if self.user_can_authenticate(user) else None
+
+    async def aget_user(self, user_id):
+        try:
+            user = await self.users().aget(pk=user_id)
+        except User.DoesNotExist:
+            return None
+        return user if self.user_can_authenticate(user) else None
@@ -0,0 +1,51 @@
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.db.migrations.recorder import MigrationRecorder
+from django.db.models.signals import post_migrate
+from django.dispatch import receiver
+import logging
+
+from .metrics import tracked_execute
+
+logger = logging.getLogger(__name__)
+
+
+# учёт запросов для RequestMetricsMiddleware из любого потока
+@receiver(connection_created)
+def install_query_tracking(sender, connection, **kwargs):
+    if tracked_execute not in connection.execute_wrappers:
+        # в начало: execute_wrapper() снимает свою обёртку через pop(), а соединение открывается лениво внутри него
+        connection.execute_wrappers.insert(0, tracked_execute)
+
+
+# PRAGMA для каждого нового sqlite-соединения в режиме production (см. SQLITE_PRAGMAS в settings)
+@receiver(connection_created)
+def apply_sqlite_pragmas(sender, connection, **kwargs):
+    if connection.vendor != 'sqlite' or getattr(settings, 'DB_MODE', 'default') != 'production':
+        return
+    # снапшот открывается только на чтение, журнал у него не трогаем
+    if connection.alias == getattr(settings, 'REPLICA_DATABASE', None):
+        return
+    pragmas = getattr(settings, 'SQLITE_PRAGMAS', {})
+    if not pragmas:
+        return
+    with connection.cursor() as cursor:
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name} = {value}')
+
+
+# миграция, пересоздающая таблицу Expense или Income (так sqlite меняет столбцы), молча
+# удаляет триггеры FTS. После migrate возвращаем их, если индекс в этой базе вообще должен быть
+@receiver(post_migrate)
+def restore_search_triggers(sender, using='default', **kwargs):
+    if sender.name != 'accounts':
+        return
+    from .search import ensure_search_index
+
+    connection = connections[using]
+    if ('accounts', '0012_transaction_search') not in MigrationRecorder(connection).applied_migrations():
+        return
+    missing = ensure_search_index(connection)
+    if missing:
+        logger.warning(f"{using}: search index objects were missing after migrate and were recreated: {', '.join(missing)}")
@@ -0,0 +1,69 @@
+from asgiref.sync import sync_to_async
+from django.core.serializers.json import DjangoJSONEncoder
+from itertools import islice
+import csv
+import json
+
+from .models import Expense, Income, FinancialGoal
+
+EXPORT_CHUNK_SIZE = 2000
+
+# тот же формат, что и у импорта, плюс колонка saved для целей
+CSV_COLUMNS = ['type', 'date', 'description', 'category', 'amount', 'saved']
+
+
+# генератор дочитывается уже после выхода из вьюхи, поэтому шард юзера указываем явно
+def export_rows(user):
+    hints = {'user_id': user.pk}
+    expenses = Expense.objects.db_manager(hints=hints).filter(user=user).order_by('date', 'id').values_list(
+        'date', 'description', 'category', 'amount'
+    )
+    for day, description, category, amount in expenses.iterator(chunk_size=EXPORT_CHUNK_SIZE):
+        yield {'type': 'expense', 'date': day, 'description': description, 'category': category, 'amount': amount}
+
+    incomes = Income.objects.db_manager(hints=hints).filter(user=user).order_by('date', 'id').values_list(
+        'date', 'description', 'source', 'amount'
+    )
+    for day, description, source, amount in incomes.iterator(chunk_size=EXPORT_CHUNK_SIZE):
+        yield {'type': 'income', 'date': day, 'description': description, 'category': source, 'amount': amount}
+
+    goals = FinancialGoal.objects.db_manager(hints=hints).filter(user=user).order_by('id').values_list(
+        'created_at', 'name', 'icon', 'target', 'saved'
+    )
+    for created_at, name, icon, target, saved in goals.iterator(chunk_size=EXPORT_CHUNK_SIZE):
+        yield {
+            'type': 'goal', 'date': created_at.date(), 'description': name,
+            'category': icon, 'amount': target, 'saved': saved,
+        }
+
+
+class _Echo:
+    def write(self, value):
+        return value
+
+
+# строки отдаются по одной, файл целиком в памяти не собирается
+def export_csv(user):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(CSV_COLUMNS)
+    for row in export_rows(user):
+        yield writer.writerow([row.get(column, '') for column in CSV_COLUMNS])
+
+
+def export_ndjson(user):
+    for row in export_rows(user):
+        yield json.dumps(row, cls=DjangoJSONEncoder, ensure_ascii=False) + '\n'
+
+
+# под ASGI синхронный итератор Django собрал бы через sync_to_async(list) целиком до первого байта.
+# здесь в поток уходит по пачке строк; thread_sensitive — курсор .iterator() живёт в потоке запроса
+async def aexport_chunks(lines):
+    read = sync_to_async(lambda: ''.join(islice(lines, EXPORT_CHUNK_SIZE)))
+    while chunk := await read():
+        yield chunk
+
+
+EXPORT_FORMATS = {
+    'csv': (export_csv, 'text/csv'),
+    'ndjson': (export_ndjson, 'application/x-ndjson'),
+}
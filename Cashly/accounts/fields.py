@@ -0,0 +1,61 @@
+from django import forms
+from django.core import validators
+from django.core.exceptions import ValidationError
+from django.db import models
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+
+CENT = Decimal('0.01')
+
+
+# деньги в целых центах: в базе BIGINT (SUM считается целочисленно), в питоне и формах Decimal
+class MoneyField(models.BigIntegerField):
+    description = 'Money amount stored as integer cents'
+
+    def __init__(self, *args, max_digits=None, **kwargs):
+        self.max_digits = max_digits
+        super().__init__(*args, **kwargs)
+
+    def deconstruct(self):
+        name, path, args, kwargs = super().deconstruct()
+        if self.max_digits is not None:
+            kwargs['max_digits'] = self.max_digits
+        return name, path, args, kwargs
+
+    @property
+    def validators(self):
+        # границы BIGINT тут не к месту, значение в питоне в валюте, а не в центах
+        extra = [validators.DecimalValidator(self.max_digits, 2)] if self.max_digits else []
+        return [*self.default_validators, *self._validators, *extra]
+
+    def to_python(self, value):
+        if value is None or isinstance(value, Decimal) and value == value.quantize(CENT):
+            return value
+        try:
+            return Decimal(str(value)).quantize(CENT, rounding=ROUND_HALF_UP)
+        except (InvalidOperation, ValueError):
+            raise ValidationError(
+                self.error_messages['invalid'], code='invalid', params={'value': value},
+            )
+
+    def from_db_value(self, value, expression, connection):
+        if value is None:
+            return value
+        return Decimal(int(value)).scaleb(-2)
+
+    def get_prep_value(self, value):
+        value = models.Field.get_prep_value(self, value)
+        if value is None:
+            return None
+        return to_cents(self.to_python(value))
+
+    def formfield(self, **kwargs):
+        return super().formfield(**{
+            'form_class': forms.DecimalField,
+            'max_digits': self.max_digits,
+            'decimal_places': 2,
+            **kwargs,
+        })
+
+
+def to_cents(amount):
+    return int((Decimal(amount) * 100).quantize(Decimal('1'), rounding=ROUND_HALF_UP))
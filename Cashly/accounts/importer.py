@@ -0,0 +1,170 @@
+from django.db import transaction
+from django.db.models import Count
+from datetime import date
+from decimal import Decimal, InvalidOperation
+import csv
+
+from .models import Expense, Income, refuse_writes_while_moving, transaction_fingerprint
+from .services import apply_to_monthly_totals
+from .routers import user_database
+from .summary_cache import bump_data_version
+
+IMPORT_BATCH_SIZE = 1000
+MAX_REPORTED_ERRORS = 50
+
+# колонки CSV: type,date,description,category,amount (для доходов category = источник)
+REQUIRED_COLUMNS = {'type', 'date', 'description', 'amount'}
+
+CATEGORY_VALUES = {value for value, label in Expense.CATEGORIES}
+SOURCE_VALUES = {value for value, label in Income.SOURCES}
+
+
+class ImportResult:
+    def __init__(self):
+        self.expenses = 0
+        self.incomes = 0
+        self.duplicates = 0
+        self.invalid = 0
+        self.errors = []
+
+    def error(self, line, message):
+        self.invalid += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append(f'line {line}: {message}')
+
+    def __str__(self):
+        return (
+            f'Imported {self.expenses} expenses and {self.incomes} incomes, '
+            f'skipped {self.duplicates} duplicates and {self.invalid} invalid rows'
+        )
+
+
+def parse_transaction_row(row):
+    kind = (row.get('type') or '').strip().lower()
+    if kind not in ('expense', 'income'):
+        raise ValueError('type must be "expense" or "income"')
+
+    description = (row.get('description') or '').strip()
+    if not description:
+        raise ValueError('description is empty')
+    if len(description) > 200:
+        raise ValueError('description is longer than 200 characters')
+
+    try:
+        day = date.fromisoformat((row.get('date') or '').strip())
+    except ValueError:
+        raise ValueError('date must be in YYYY-MM-DD format')
+
+    try:
+        amount = Decimal((row.get('amount') or '').strip())
+        # NaN/Infinity не сравниваются с границами и не квантуются
+        if not amount.is_finite():
+            raise ValueError('amount is not a number')
+        amount = amount.quantize(Decimal('0.01'))
+    except InvalidOperation:
+        raise ValueError('amount is not a number')
+    if amount < 0 or amount >= Decimal('100000000'):
+        raise ValueError('amount is out of range')
+
+    category = (row.get('category') or row.get('source') or '').strip()
+    if kind == 'expense' and category not in CATEGORY_VALUES:
+        raise ValueError(f'unknown expense category "{category}"')
+    if kind == 'income' and category not in SOURCE_VALUES:
+        raise ValueError(f'unknown income source "{category}"')
+
+    return kind, day, description, category, amount
+
+
+class _Batch:
+    def __init__(self, user, model, field):
+        self.user = user
+        self.model = model
+        self.field = field
+        self.rows = []
+        # сколько раз отпечаток уже был в базе до импорта и сколько встретился в файле
+        self.existing = {}
+        self.seen = {}
+
+    def add(self, day, description, category, amount):
+        self.rows.append((day, description, category, amount, transaction_fingerprint(day, amount, description)))
+
+    def flush(self):
+        if not self.rows:
+            return 0, 0
+        rows, self.rows = self.rows, []
+
+        unknown = {row[4] for row in rows} - self.existing.keys()
+        if unknown:
+            counts = dict(
+                self.model.objects.filter(user=self.user, fingerprint__in=unknown)
+                .order_by().values('fingerprint').annotate(n=Count('id')).values_list('fingerprint', 'n')
+            )
+            for fingerprint in unknown:
+                self.existing[fingerprint] = counts.get(fingerprint, 0)
+
+        objects = []
+        duplicates = 0
+        for day, description, category, amount, fingerprint in rows:
+            self.seen[fingerprint] = self.seen.get(fingerprint, 0) + 1
+            if self.seen[fingerprint] <= self.existing[fingerprint]:
+                duplicates += 1
+                continue
+            objects.append(self.model(
+                user=self.user, description=description, amount=amount, date=day,
+                fingerprint=fingerprint, **{self.field: category}
+            ))
+
+        # bulk_create без сигналов, блокировку переезда проверяем сами
+        refuse_writes_while_moving(self.user.pk)
+        self.model.objects.bulk_create(objects, batch_size=IMPORT_BATCH_SIZE)
+        apply_to_monthly_totals(objects)
+        return len(objects), duplicates
+
+
+# потоковый импорт CSV: строки читаются по одной, вставка пачками
+def import_transactions(user, lines):
+    result = ImportResult()
+    reader = csv.DictReader(lines)
+    columns = {name.strip().lower() for name in reader.fieldnames or []}
+    missing = REQUIRED_COLUMNS - columns
+    if missing or not columns & {'category', 'source'}:
+        result.error(1, f'missing columns: {", ".join(sorted(missing or {"category"}))}')
+        return result
+
+    batches = {
+        'expense': _Batch(user, Expense, 'category'),
+        'income': _Batch(user, Income, 'source'),
+    }
+
+    def flush(batch):
+        created, duplicates = batch.flush()
+        result.duplicates += duplicates
+        if batch.model is Expense:
+            result.expenses += created
+        else:
+            result.incomes += created
+
+    with user_database(user.pk) as using, transaction.atomic(using=using):
+        for row in reader:
+            row = {(key or '').strip().lower(): value for key, value in row.items()}
+            # цели из файла экспорта не импортируем
+            if (row.get('type') or '').strip().lower() == 'goal':
+                continue
+            try:
+                kind, day, description, category, amount = parse_transaction_row(row)
+            except ValueError as e:
+                result.error(reader.line_num, str(e))
+                continue
+
+            batch = batches[kind]
+            batch.add(day, description, category, amount)
+            if len(batch.rows) >= IMPORT_BATCH_SIZE:
+                flush(batch)
+
+        for batch in batches.values():
+            flush(batch)
+
+        if result.expenses or result.incomes:
+            transaction.on_commit(lambda: bump_data_version(user.pk), using=using)
+
+    return result
@@ -0,0 +1,82 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncMonth
+from datetime import date
+import json
+import time
+
+from accounts.metrics import percentile
+from accounts.models import Expense, Income
+
+
+# скорость денежных агрегатов по всей истории и размер таблиц на диске
+class Command(BaseCommand):
+    help = 'Time the SUM aggregates over expenses and incomes and report table sizes as JSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=10, help='Runs per query')
+        parser.add_argument('--output', help='Write the JSON report to this file')
+
+    def handle(self, *args, **options):
+        rows = Expense.objects.count() + Income.objects.count()
+        if not rows:
+            raise CommandError('No transactions, run seed_finance_data first')
+
+        queries = {
+            # итог по всей таблице
+            'sum_all': lambda: (
+                Expense.objects.aggregate(total=Sum('amount')),
+                Income.objects.aggregate(total=Sum('amount')),
+            ),
+            # то же, что считает rebuild_monthly_totals
+            'sum_by_user_month_category': lambda: (
+                list(Expense.objects.order_by().annotate(year_month=TruncMonth('date')).values(
+                    'user_id', 'year_month', 'category'
+                ).annotate(total=Sum('amount'), count=Count('id'))),
+                list(Income.objects.order_by().annotate(year_month=TruncMonth('date')).values(
+                    'user_id', 'year_month', 'source'
+                ).annotate(total=Sum('amount'), count=Count('id'))),
+            ),
+            # поштучная загрузка сумм в питон
+            'load_amounts': lambda: (
+                list(Expense.objects.values_list('amount', flat=True)),
+                list(Income.objects.values_list('amount', flat=True)),
+            ),
+        }
+
+        report = {
+            'created_at': date.today().isoformat(),
+            'database': connection.vendor,
+            'iterations': options['iterations'],
+            'rows': rows,
+            'table_bytes': self.table_sizes(),
+            'queries': {},
+        }
+        for name, run in queries.items():
+            timings = []
+            for _ in range(options['iterations']):
+                start = time.perf_counter()
+                run()
+                timings.append((time.perf_counter() - start) * 1000)
+            report['queries'][name] = {
+                'p50_ms': round(percentile(timings, 50), 2),
+                'min_ms': round(min(timings), 2),
+            }
+
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output + '\n')
+        self.stdout.write(output)
+
+    def table_sizes(self):
+        if connection.vendor != 'sqlite':
+            return None
+        sizes = {}
+        with connection.cursor() as cursor:
+            for model in (Expense, Income):
+                table = model._meta.db_table
+                cursor.execute('SELECT SUM(pgsize) FROM dbstat WHERE name = %s', [table])
+                sizes[table] = cursor.fetchone()[0]
+        return sizes
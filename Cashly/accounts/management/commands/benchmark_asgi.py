@@ -0,0 +1,174 @@
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db.backends.signals import connection_created
+from django.urls import reverse
+from concurrent.futures import ThreadPoolExecutor
+from importlib import import_module
+from collections import defaultdict
+from wsgiref.util import setup_testing_defaults
+import asyncio
+import json
+import threading
+import time
+
+from accounts.metrics import percentile
+from accounts.summary_cache import bump_data_version
+
+PAGES = ['dashboard', 'profile', 'investments_goals']
+
+
+# задержка сети до сервера БД: sqlite локальный, без неё параллельные запросы почти ничего не дают
+class NetworkDelay:
+    def __init__(self, seconds):
+        self.seconds = seconds
+
+    def __call__(self, execute, sql, params, many, context):
+        time.sleep(self.seconds)
+        return execute(sql, params, many, context)
+
+    def install(self, sender, connection, **kwargs):
+        if self not in connection.execute_wrappers:
+            connection.execute_wrappers.append(self)
+
+
+# страницы со сводкой под одинаковой параллельной нагрузкой: Cashly.wsgi в пуле потоков
+# против Cashly.asgi в event loop'е, оба приложения вызываются в процессе, без HTTP
+class Command(BaseCommand):
+    help = 'Compare latency of the summary pages served by Cashly.wsgi (threads) and Cashly.asgi (event loop)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=16, help='Requests in flight at once')
+        parser.add_argument('--requests', type=int, default=300, help='Requests per page and server')
+        parser.add_argument('--prefix', default='seed', help='Users are taken from usernames with this prefix')
+        parser.add_argument('--warm', action='store_true', help='Keep cached summaries instead of rebuilding every page')
+        parser.add_argument('--db-latency-ms', type=float, default=0, help='Simulated network round trip per query')
+        parser.add_argument('--output', help='Write the JSON report to this file')
+
+    def handle(self, *args, **options):
+        users = list(User.objects.filter(username__startswith=options['prefix']).order_by('id')[:options['concurrency']])
+        if not users:
+            raise CommandError(f'No users starting with "{options["prefix"]}", run seed_finance_data first')
+
+        delay = None
+        if options['db_latency_ms']:
+            delay = NetworkDelay(options['db_latency_ms'] / 1000)
+            connection_created.connect(delay.install)
+
+        self.cold = not options['warm']
+        self.cookies = {user.pk: self.session_cookie(user) for user in users}
+        plan = [
+            (page, users[i % len(users)])
+            for page in PAGES
+            for i in range(options['requests'])
+        ]
+
+        from Cashly.asgi import application as asgi_application
+        from Cashly.wsgi import application as wsgi_application
+
+        report = {
+            'database': settings.DATABASES['default']['ENGINE'],
+            'concurrency': options['concurrency'],
+            'cold_cache': self.cold,
+            'db_latency_ms': options['db_latency_ms'],
+            'servers': {},
+        }
+        try:
+            for name, run in (('wsgi', self.run_wsgi), ('asgi', self.run_asgi)):
+                app = wsgi_application if name == 'wsgi' else asgi_application
+                self.samples = defaultdict(list)
+                self.lock = threading.Lock()
+                started = time.perf_counter()
+                run(app, plan, options['concurrency'])
+                elapsed = time.perf_counter() - started
+                report['servers'][name] = {
+                    'throughput_rps': round(len(plan) / elapsed, 1),
+                    'pages': {page: self.summarize(values) for page, values in sorted(self.samples.items())},
+                }
+        finally:
+            if delay:
+                connection_created.disconnect(delay.install)
+
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output + '\n')
+        self.stdout.write(output)
+
+    def session_cookie(self, user):
+        session = import_module(settings.SESSION_ENGINE).SessionStore()
+        session[SESSION_KEY] = str(user.pk)
+        session[BACKEND_SESSION_KEY] = settings.AUTHENTICATION_BACKENDS[0]
+        session[HASH_SESSION_KEY] = user.get_session_auth_hash()
+        session.save()
+        return f'{settings.SESSION_COOKIE_NAME}={session.session_key}'
+
+    def record(self, page, status, ms):
+        if status != 200:
+            raise CommandError(f'{page} returned {status}')
+        with self.lock:
+            self.samples[page].append(ms)
+
+    def run_wsgi(self, application, plan, concurrency):
+        def request(page, user):
+            environ = {'PATH_INFO': reverse(page), 'HTTP_COOKIE': self.cookies[user.pk], 'HTTP_HOST': 'localhost'}
+            setup_testing_defaults(environ)
+            statuses = []
+            if self.cold:
+                bump_data_version(user.pk)
+            start = time.perf_counter()
+            response = application(environ, lambda status, headers: statuses.append(int(status.split()[0])))
+            try:
+                b''.join(response)
+            finally:
+                response.close()
+            self.record(page, statuses[0], (time.perf_counter() - start) * 1000)
+
+        with ThreadPoolExecutor(concurrency) as pool:
+            for future in [pool.submit(request, page, user) for page, user in plan]:
+                future.result()
+
+    def run_asgi(self, application, plan, concurrency):
+        async def request(page, user, slots):
+            path = reverse(page)
+            scope = {
+                'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET',
+                'scheme': 'http', 'path': path, 'raw_path': path.encode(), 'query_string': b'', 'root_path': '',
+                'headers': [(b'host', b'localhost'), (b'cookie', self.cookies[user.pk].encode())],
+                'server': ('localhost', 80), 'client': ('127.0.0.1', 0),
+            }
+            received = []
+
+            async def receive():
+                if not received:
+                    received.append(True)
+                    return {'type': 'http.request', 'body': b'', 'more_body': False}
+                await asyncio.Event().wait()  # клиент не отключается
+
+            statuses = []
+
+            async def send(message):
+                if message['type'] == 'http.response.start':
+                    statuses.append(message['status'])
+
+            async with slots:
+                if self.cold:
+                    bump_data_version(user.pk)
+                start = time.perf_counter()
+                await application(scope, receive, send)
+                self.record(page, statuses[0], (time.perf_counter() - start) * 1000)
+
+        async def main():
+            slots = asyncio.Semaphore(concurrency)
+            await asyncio.gather(*(request(page, user, slots) for page, user in plan))
+
+        asyncio.run(main())
+
+    def summarize(self, values):
+        return {
+            'requests': len(values),
+            'p50_ms': round(percentile(values, 50), 2),
+            'p95_ms': round(percentile(values, 95), 2),
+            'p99_ms': round(percentile(values, 99), 2),
+        }
@@ -0,0 +1,135 @@
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from collections import defaultdict
+from datetime import date
+import json
+import time
+
+from accounts.metrics import percentile
+from accounts.models import Expense, Income, FinancialGoal
+
+
+# латентность и число запросов по вьюхам через тестовый клиент
+class Command(BaseCommand):
+    help = 'Drive the main views through the test client and report p50/p95/p99 latency and query counts as JSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=5, help='How many users to benchmark with')
+        parser.add_argument('--prefix', default='seed', help='Only use users whose username starts with this')
+        parser.add_argument('--iterations', type=int, default=20, help='Rounds of requests per user')
+        parser.add_argument('--cold', action='store_true', help='Clear the cache before every read request')
+        parser.add_argument('--output', help='Write the JSON report to this file')
+        parser.add_argument('--baseline', help='Compare with a previous JSON report and fail on regressions')
+        parser.add_argument('--threshold', type=float, default=20, help='Allowed p95 slowdown in percent')
+
+    def handle(self, *args, **options):
+        users = list(User.objects.filter(username__startswith=options['prefix']).order_by('id')[:options['users']])
+        if not users:
+            raise CommandError(f'No users starting with "{options["prefix"]}", run seed_finance_data first')
+
+        self.cold = options['cold']
+        self.samples = defaultdict(lambda: {'ms': [], 'queries': []})
+        client = Client(SERVER_NAME='localhost')
+        started = time.perf_counter()
+        for user in users:
+            client.force_login(user)
+            for _ in range(options['iterations']):
+                self.run_round(client, user)
+
+        report = {
+            'created_at': date.today().isoformat(),
+            'database': connection.vendor,
+            'users': len(users),
+            'iterations': options['iterations'],
+            'cold_cache': self.cold,
+            'elapsed_s': round(time.perf_counter() - started, 2),
+            'rows': {
+                'expenses': Expense.objects.count(),
+                'incomes': Income.objects.count(),
+                'goals': FinancialGoal.objects.count(),
+            },
+            'views': {name: self.summarize(sample) for name, sample in sorted(self.samples.items())},
+        }
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output + '\n')
+        self.stdout.write(output)
+
+        if options['baseline']:
+            self.compare(report, options['baseline'], options['threshold'])
+
+    def measure(self, name, client, method, url, data=None, read=False):
+        if read and self.cold:
+            cache.clear()
+        with CaptureQueriesContext(connection) as ctx:
+            start = time.perf_counter()
+            response = getattr(client, method)(url, data)
+            elapsed = (time.perf_counter() - start) * 1000
+        if response.status_code >= 400:
+            raise CommandError(f'{name} returned {response.status_code}')
+        self.samples[name]['ms'].append(elapsed)
+        self.samples[name]['queries'].append(len(ctx.captured_queries))
+        return response
+
+    def run_round(self, client, user):
+        today = date.today().isoformat()
+        self.measure('dashboard', client, 'get', reverse('dashboard'), read=True)
+        self.measure('profile', client, 'get', reverse('profile'), read=True)
+        self.measure('investments_goals', client, 'get', reverse('investments_goals'), read=True)
+
+        # записи создаём и сразу удаляем, чтобы данные не разрастались
+        self.measure('add_expense', client, 'post', reverse('add_expense'), {
+            'description': 'Benchmark', 'category': 'Food', 'amount': '1.00', 'date': today,
+        })
+        expense = Expense.objects.filter(user=user, description='Benchmark').order_by('-id').first()
+        self.measure('delete_expense', client, 'post', reverse('delete_expense', args=[expense.id]))
+
+        self.measure('add_income', client, 'post', reverse('add_income'), {
+            'description': 'Benchmark', 'source': 'Other', 'amount': '1.00', 'date': today,
+        })
+        income = Income.objects.filter(user=user, description='Benchmark').order_by('-id').first()
+        self.measure('delete_income', client, 'post', reverse('delete_income', args=[income.id]))
+
+        self.measure('add_goal', client, 'post', reverse('add_goal'), {'name': 'Benchmark', 'target': '100'})
+        goal = FinancialGoal.objects.filter(user=user, name='Benchmark').order_by('-id').first()
+        self.measure('delete_goal', client, 'post', reverse('delete_goal', args=[goal.id]))
+
+        self.measure('update_budgets', client, 'post', reverse('update_budgets'), {
+            'monthly_budget': str(user.profile.monthly_budget),
+        })
+
+    def summarize(self, sample):
+        ms, queries = sample['ms'], sample['queries']
+        return {
+            'requests': len(ms),
+            'p50_ms': round(percentile(ms, 50), 2),
+            'p95_ms': round(percentile(ms, 95), 2),
+            'p99_ms': round(percentile(ms, 99), 2),
+            'mean_ms': round(sum(ms) / len(ms), 2),
+            'queries_min': min(queries),
+            'queries_max': max(queries),
+        }
+
+    def compare(self, report, path, threshold):
+        with open(path) as f:
+            baseline = json.load(f)
+
+        regressions = []
+        for name, current in report['views'].items():
+            previous = baseline.get('views', {}).get(name)
+            if not previous:
+                continue
+            if current['p95_ms'] > previous['p95_ms'] * (1 + threshold / 100):
+                regressions.append(f"{name}: p95 {previous['p95_ms']}ms -> {current['p95_ms']}ms")
+            if current['queries_max'] > previous['queries_max']:
+                regressions.append(f"{name}: queries {previous['queries_max']} -> {current['queries_max']}")
+
+        if regressions:
+            raise CommandError('Regressions against baseline:\n' + '\n'.join(regressions))
+        self.stderr.write(self.style.SUCCESS(f'No regressions against {path}'))
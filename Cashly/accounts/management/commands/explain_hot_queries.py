@@ -0,0 +1,54 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from accounts.models import Expense, Income
+from accounts.services import FinanceSummary, get_ledger_page
+
+
+# план выполнения для горячих запросов dashboard/profile
+class Command(BaseCommand):
+    help = 'Print EXPLAIN QUERY PLAN for the per-user queries behind the dashboard and profile pages'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help='Username to run the queries for (defaults to the first user)')
+        parser.add_argument('--category', default='Food', help='Expense category for the per-category query')
+
+    def handle(self, *args, **options):
+        user = self.get_user(options['user'])
+
+        with CaptureQueriesContext(connection) as ctx:
+            summary = FinanceSummary(user)
+            summary.monthly_spent
+            summary.monthly_income
+            summary.goals_count
+            summary.budget_categories
+            list(Expense.objects.filter(user=user).order_by('-date')[:10])
+            list(Income.objects.filter(user=user).order_by('-date')[:10])
+            list(Expense.objects.filter(user=user, category=options['category']).order_by('-date')[:10])
+            entries, after = get_ledger_page(user)
+            if after:
+                get_ledger_page(user, after=after)
+
+        prefix = 'EXPLAIN QUERY PLAN' if connection.vendor == 'sqlite' else 'EXPLAIN'
+        with connection.cursor() as cursor:
+            for query in ctx.captured_queries:
+                sql = query['sql']
+                self.stdout.write(self.style.MIGRATE_HEADING(sql))
+                cursor.execute(f'{prefix} {sql}')
+                for row in cursor.fetchall():
+                    self.stdout.write('    ' + ' | '.join(str(col) for col in row))
+                self.stdout.write('')
+
+    def get_user(self, username):
+        if username:
+            user = User.objects.filter(username=username).first()
+            if not user:
+                raise CommandError(f'User "{username}" not found')
+            return user
+
+        user = User.objects.order_by('pk').first()
+        if not user:
+            raise CommandError('No users in the database')
+        return user
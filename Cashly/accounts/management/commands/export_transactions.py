@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.contrib.auth.models import User
+
+from accounts.exporter import EXPORT_FORMATS
+
+
+# полная выгрузка истории юзера (для поддержки)
+class Command(BaseCommand):
+    help = "Stream a user's expenses, incomes and goals as CSV or NDJSON"
+
+    def add_arguments(self, parser):
+        parser.add_argument('username')
+        parser.add_argument('--format', choices=sorted(EXPORT_FORMATS), default='csv')
+        parser.add_argument('--output', help='File to write to (defaults to stdout)')
+
+    def handle(self, *args, **options):
+        user = User.objects.filter(username=options['username']).first()
+        if not user:
+            raise CommandError(f'User "{options["username"]}" not found')
+
+        generate, content_type = EXPORT_FORMATS[options['format']]
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8', newline='') as f:
+                for chunk in generate(user):
+                    f.write(chunk)
+        else:
+            for chunk in generate(user):
+                self.stdout.write(chunk, ending='')
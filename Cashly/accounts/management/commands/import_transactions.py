@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.contrib.auth.models import User
+
+from accounts.importer import import_transactions
+
+
+# импорт истории операций из CSV для юзера
+class Command(BaseCommand):
+    help = 'Import expenses and incomes for a user from a CSV file (type,date,description,category,amount)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('username')
+        parser.add_argument('path', help='Path to the CSV file')
+
+    def handle(self, *args, **options):
+        user = User.objects.filter(username=options['username']).first()
+        if not user:
+            raise CommandError(f'User "{options["username"]}" not found')
+
+        try:
+            with open(options['path'], encoding='utf-8-sig', newline='') as f:
+                result = import_transactions(user, f)
+        except OSError as e:
+            raise CommandError(str(e))
+
+        for error in result.errors:
+            self.stderr.write(error)
+        self.stdout.write(self.style.SUCCESS(str(result)))
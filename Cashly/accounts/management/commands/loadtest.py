@@ -0,0 +1,190 @@
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.core.servers.basehttp import ThreadedWSGIServer, WSGIRequestHandler
+from django.core.signals import got_request_exception
+from django.db import OperationalError, connection
+from importlib import import_module
+from collections import Counter, defaultdict
+from datetime import date
+from urllib.parse import urlencode, urlsplit
+import http.client
+import json
+import random
+import secrets
+import string
+import sys
+import threading
+import time
+
+from accounts.models import Expense
+from accounts.metrics import percentile
+
+LOADTEST_DESCRIPTION = 'Load test'
+
+
+class QuietRequestHandler(WSGIRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+class LockErrorCounter:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.count = 0
+
+    def __call__(self, sender, request=None, **kwargs):
+        error = sys.exc_info()[1]
+        if isinstance(error, OperationalError) and 'locked' in str(error):
+            with self.lock:
+                self.count += 1
+
+
+# симулированный юзер: своя сессия, свой csrf, смесь чтений и записей
+class SimulatedUser:
+    READS = ['/', '/profile/', '/explore/', '/profile/ledger/']
+
+    def __init__(self, harness, user):
+        self.harness = harness
+        self.user = user
+        self.rng = random.Random(user.pk)
+        self.csrf = ''.join(secrets.choice(string.ascii_letters + string.digits) for _ in range(32))
+        session = import_module(settings.SESSION_ENGINE).SessionStore()
+        session[SESSION_KEY] = str(user.pk)
+        session[BACKEND_SESSION_KEY] = settings.AUTHENTICATION_BACKENDS[0]
+        session[HASH_SESSION_KEY] = user.get_session_auth_hash()
+        session.save()
+        self.cookie = f'{settings.SESSION_COOKIE_NAME}={session.session_key}; {settings.CSRF_COOKIE_NAME}={self.csrf}'
+
+    def request(self, name, method, path, data=None):
+        body = urlencode({**data, 'csrfmiddlewaretoken': self.csrf}) if data is not None else None
+        headers = {'Cookie': self.cookie}
+        if body is not None:
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+
+        start = time.perf_counter()
+        try:
+            http_connection = http.client.HTTPConnection(self.harness.host, self.harness.port, timeout=60)
+            http_connection.request(method, path, body=body, headers=headers)
+            response = http_connection.getresponse()
+            response.read()
+            status = response.status
+            http_connection.close()
+        except OSError as e:
+            status = type(e).__name__
+        self.harness.record(name, status, (time.perf_counter() - start) * 1000)
+
+    def run(self, deadline):
+        try:
+            while time.monotonic() < deadline:
+                if self.rng.random() < self.harness.write_ratio:
+                    self.write()
+                else:
+                    path = self.rng.choice(self.READS)
+                    self.request(path, 'GET', path)
+        finally:
+            connection.close()
+
+    def write(self):
+        self.request('add_expense', 'POST', '/profile/add-expense/', {
+            'description': LOADTEST_DESCRIPTION, 'category': 'Food',
+            'amount': f'{self.rng.randint(1, 5000) / 100:.2f}', 'date': date.today().isoformat(),
+        })
+        # id созданной записи берём из базы, это время не считается
+        expense_id = Expense.objects.filter(
+            user=self.user, description=LOADTEST_DESCRIPTION
+        ).order_by('-id').values_list('id', flat=True).first()
+        if expense_id:
+            self.request('delete_expense', 'POST', f'/profile/delete-expense/{expense_id}/', {})
+
+
+# нагрузочный тест: WSGI-приложение в многопоточном сервере + много юзеров
+class Command(BaseCommand):
+    help = 'Run Cashly.wsgi.application in a threaded server and drive mixed read/write traffic from simulated users'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clients', type=int, default=16, help='Concurrent simulated users')
+        parser.add_argument('--duration', type=float, default=30, help='Seconds to run')
+        parser.add_argument('--write-ratio', type=float, default=0.3, help='Share of actions that write')
+        parser.add_argument('--prefix', default='seed', help='Simulated users are taken from usernames with this prefix')
+        parser.add_argument('--url', help='Target an already running server instead of starting one')
+        parser.add_argument('--output', help='Write the JSON report to this file')
+
+    def handle(self, *args, **options):
+        users = list(User.objects.filter(username__startswith=options['prefix']).order_by('id')[:options['clients']])
+        if not users:
+            raise CommandError(f'No users starting with "{options["prefix"]}", run seed_finance_data first')
+
+        self.write_ratio = options['write_ratio']
+        self.lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.statuses = Counter()
+        lock_errors = LockErrorCounter()
+
+        server = None
+        if options['url']:
+            parts = urlsplit(options['url'])
+            self.host, self.port = parts.hostname, parts.port or 80
+        else:
+            from Cashly.wsgi import application
+            server = ThreadedWSGIServer(('127.0.0.1', 0), QuietRequestHandler)
+            server.set_app(application)
+            self.host, self.port = server.server_address
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            got_request_exception.connect(lock_errors)
+
+        clients = [SimulatedUser(self, users[i % len(users)]) for i in range(options['clients'])]
+        deadline = time.monotonic() + options['duration']
+        started = time.perf_counter()
+        threads = [threading.Thread(target=client.run, args=(deadline,)) for client in clients]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        if server:
+            server.shutdown()
+            server.server_close()
+            got_request_exception.disconnect(lock_errors)
+        # только записи симулированных юзеров: у настоящих может быть операция с таким же описанием
+        Expense.objects.filter(user__in=users, description=LOADTEST_DESCRIPTION).delete()
+
+        total = sum(self.statuses.values())
+        errors = sum(count for status, count in self.statuses.items() if status != 200 and status != 302)
+        all_latencies = [ms for values in self.latencies.values() for ms in values]
+        report = {
+            'database': settings.DATABASES['default']['ENGINE'],
+            'clients': options['clients'],
+            'write_ratio': self.write_ratio,
+            'duration_s': round(elapsed, 2),
+            'requests': total,
+            'throughput_rps': round(total / elapsed, 1) if elapsed else 0,
+            'p50_ms': round(percentile(all_latencies, 50), 2) if all_latencies else None,
+            'p95_ms': round(percentile(all_latencies, 95), 2) if all_latencies else None,
+            'p99_ms': round(percentile(all_latencies, 99), 2) if all_latencies else None,
+            'error_rate': round(errors / total, 4) if total else 0,
+            'lock_errors': None if options['url'] else lock_errors.count,
+            'lock_error_rate': None if options['url'] or not total else round(lock_errors.count / total, 4),
+            'statuses': {str(status): count for status, count in sorted(self.statuses.items(), key=str)},
+            'actions': {
+                name: {
+                    'requests': len(values),
+                    'p50_ms': round(percentile(values, 50), 2),
+                    'p95_ms': round(percentile(values, 95), 2),
+                    'p99_ms': round(percentile(values, 99), 2),
+                }
+                for name, values in sorted(self.latencies.items())
+            },
+        }
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output + '\n')
+        self.stdout.write(output)
+
+    def record(self, name, status, ms):
+        with self.lock:
+            self.latencies[name].append(ms)
+            self.statuses[status] += 1
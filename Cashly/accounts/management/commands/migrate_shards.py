@@ -0,0 +1,54 @@
+from django.apps import apps
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from accounts.models import UserShard
+from accounts.routers import SHARDED_MODELS
+
+# у каждого шарда свой диапазон id, чтобы строки переносились между шардами без смены ключей
+SHARD_ID_SPACING = 1 << 40
+
+
+# migrate для основной базы и всех шардов
+class Command(BaseCommand):
+    help = 'Run migrations against the default database and every shard, then record where existing users live'
+
+    def handle(self, *args, **options):
+        shards = settings.SHARD_DATABASES
+        if not shards:
+            raise CommandError('Sharding is off, set CASHLY_SHARDS')
+
+        verbosity = options['verbosity']
+        for alias in ['default'] + shards:
+            self.stdout.write(f'Migrating {alias}')
+            call_command('migrate', database=alias, interactive=False, verbosity=max(verbosity - 1, 0))
+
+        for i, alias in enumerate(shards):
+            self.reserve_id_range(alias, (i + 1) * SHARD_ID_SPACING)
+
+        # юзеры, заведённые до шардирования, остаются в default, пока их не перенесут
+        legacy = User.objects.filter(shard__isnull=True).values_list('pk', flat=True)
+        placed = UserShard.objects.bulk_create([UserShard(user_id=pk, database='default') for pk in legacy])
+        self.stdout.write(self.style.SUCCESS(
+            f'Migrated {len(shards) + 1} databases, {len(placed)} existing users stay in default'
+        ))
+
+    def reserve_id_range(self, alias, start):
+        connection = connections[alias]
+        if connection.vendor != 'sqlite':
+            return
+        tables = [
+            model._meta.db_table for model in apps.get_app_config('accounts').get_models()
+            if model._meta.model_name in SHARDED_MODELS
+        ]
+        with connection.cursor() as cursor:
+            for table in tables:
+                cursor.execute(
+                    'INSERT INTO sqlite_sequence (name, seq) SELECT %s, %s '
+                    'WHERE NOT EXISTS (SELECT 1 FROM sqlite_sequence WHERE name = %s)',
+                    [table, start, table],
+                )
+                cursor.execute('UPDATE sqlite_sequence SET seq = %s WHERE name = %s AND seq < %s', [start, table, start])
@@ -0,0 +1,121 @@
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+import time
+
+from accounts.management.commands.migrate_shards import SHARD_ID_SPACING
+from accounts.models import UserProfile, Expense, Income, Budget, FinancialGoal, MonthlyTotal, UserShard
+from accounts.routers import copy_user_stub, shard_for_user
+from accounts.summary_cache import bump_data_version
+
+# порядок копирования; удаление из старого шарда идёт в обратном
+USER_MODELS = [UserProfile, Expense, Income, Budget, FinancialGoal, MonthlyTotal]
+
+
+class MoveAborted(Exception):
+    pass
+
+
+# конец диапазона id базы (см. migrate_shards): default — до первого шарда, шард i — до шарда i + 1
+def id_range_end(alias):
+    if alias == 'default':
+        return SHARD_ID_SPACING
+    return (settings.SHARD_DATABASES.index(alias) + 2) * SHARD_ID_SPACING
+
+
+# онлайн-перенос одного юзера: остальные юзеры шарда работают как обычно,
+# сам юзер на время копирования может только читать
+class Command(BaseCommand):
+    help = "Move one user's rows to another shard while the site keeps running"
+
+    def add_arguments(self, parser):
+        parser.add_argument('username')
+        parser.add_argument('target', help='Destination database alias, e.g. shard1 or default')
+        parser.add_argument('--grace', type=float, default=2, help='Seconds to let in-flight writes finish after locking')
+        parser.add_argument('--batch-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        target = options['target']
+        if target not in ['default'] + settings.SHARD_DATABASES:
+            raise CommandError(f'Unknown database "{target}"')
+        user = User.objects.filter(username=options['username']).first()
+        if not user:
+            raise CommandError(f'User "{options["username"]}" not found')
+
+        source = shard_for_user(user.pk)
+        if source == target:
+            raise CommandError(f'{user.username} already lives in {target}')
+
+        placement = UserShard.objects.get(user=user)
+        placement.locked = True
+        placement.save(update_fields=['locked', 'updated_at'])
+        started = time.perf_counter()
+        try:
+            time.sleep(options['grace'])
+            copied = self.copy(user, source, target, options['batch_size'])
+        except Exception:
+            placement.locked = False
+            placement.save(update_fields=['locked', 'updated_at'])
+            raise
+
+        # с этого момента чтения и записи идут в новый шард
+        placement.database = target
+        placement.locked = False
+        placement.save(update_fields=['database', 'locked', 'updated_at'])
+        bump_data_version(user.pk)
+
+        self.delete_rows(user, source)
+        self.stdout.write(self.style.SUCCESS(
+            f'Moved {user.username} from {source} to {target}: {copied} rows in {time.perf_counter() - started:.1f}s'
+        ))
+
+    def copy(self, user, source, target, batch_size):
+        copy_user_stub(user, target)
+        reader = connections[source]
+        writer = connections[target]
+        copied = 0
+        with transaction.atomic(using=target), reader.cursor() as src, writer.cursor() as dst:
+            # остатки прерванного переноса
+            self.delete_rows(user, target, stub=False)
+            # строки копируются как есть: те же id, created_at и суммы, без сигналов.
+            # AUTOINCREMENT в sqlite выдаёт id после самого большого в таблице, что бы ни было в
+            # sqlite_sequence: строка с id выше диапазона цели увела бы новые id цели в чужой диапазон.
+            # такие строки (переезд в default или в шард с меньшим номером) получают новые id из диапазона цели
+            end = id_range_end(target)
+            for model in USER_MODELS:
+                table = model._meta.db_table
+                columns = [field.column for field in model._meta.concrete_fields]
+                pk = model._meta.pk.column
+                for condition, insert_columns in ((f'< {end}', columns), (f'>= {end}', [c for c in columns if c != pk])):
+                    select = 'SELECT {} FROM {} WHERE user_id = %s AND {} {} ORDER BY {}'.format(
+                        ', '.join(reader.ops.quote_name(column) for column in insert_columns),
+                        reader.ops.quote_name(table), reader.ops.quote_name(pk), condition, reader.ops.quote_name(pk),
+                    )
+                    insert = 'INSERT INTO {} ({}) VALUES ({})'.format(
+                        writer.ops.quote_name(table),
+                        ', '.join(writer.ops.quote_name(column) for column in insert_columns),
+                        ', '.join(['%s'] * len(insert_columns)),
+                    )
+                    src.execute(select, [user.pk])
+                    while rows := src.fetchmany(batch_size):
+                        dst.executemany(insert, rows)
+
+                count = model.objects.using(target).filter(user=user).count()
+                expected = model.objects.using(source).filter(user=user).count()
+                if count != expected:
+                    raise MoveAborted(f'{model.__name__}: copied {count} rows, source has {expected}')
+                copied += count
+        return copied
+
+    # сырой DELETE: сигналы при удалении пересчитали бы итоги уже в новом шарде
+    def delete_rows(self, user, alias, stub=True):
+        connection = connections[alias]
+        with transaction.atomic(using=alias), connection.cursor() as cursor:
+            for model in reversed(USER_MODELS):
+                table = connection.ops.quote_name(model._meta.db_table)
+                cursor.execute(f'DELETE FROM {table} WHERE user_id = %s', [user.pk])
+            if stub and alias != 'default':
+                cursor.execute(
+                    f'DELETE FROM {connection.ops.quote_name(User._meta.db_table)} WHERE id = %s', [user.pk]
+                )
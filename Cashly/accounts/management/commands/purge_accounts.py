@@ -0,0 +1,91 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from datetime import timedelta
+import logging
+import time
+
+from accounts.models import AccountPurge
+from accounts.purge import purge_account, PurgeSkipped, PURGE_CHUNK_SIZE
+
+logger = logging.getLogger(__name__)
+
+# запуск без движения дольше этого считается упавшим и берётся заново
+STALE_SECONDS = 600
+
+
+# фоновое удаление аккаунтов из очереди AccountPurge
+class Command(BaseCommand):
+    help = 'Delete queued accounts and their transaction history in chunked batches, retrying failures with backoff'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=PURGE_CHUNK_SIZE, help='Rows per DELETE')
+        parser.add_argument('--loop', action='store_true', help='Keep polling the queue instead of exiting when it is empty')
+        parser.add_argument('--interval', type=float, default=5, help='Seconds to sleep between polls with --loop')
+
+    def handle(self, *args, **options):
+        purged = 0
+        while True:
+            purge = self.claim()
+            if purge:
+                self.run(purge, options['chunk_size'])
+                purged += 1
+                continue
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
+
+        self.stdout.write(self.style.SUCCESS(f'Purge queue drained: {purged} accounts processed'))
+
+    # попытка считается при захвате: воркер, упавший посреди удаления, тоже её тратит
+    def claim(self):
+        now = timezone.now()
+        stale = now - timedelta(seconds=STALE_SECONDS)
+        with transaction.atomic():
+            AccountPurge.objects.filter(
+                status=AccountPurge.RUNNING, updated_at__lt=stale, attempts__gte=AccountPurge.MAX_ATTEMPTS
+            ).update(status=AccountPurge.FAILED, last_error='Worker stopped during the last attempt', updated_at=now)
+            purge = (
+                AccountPurge.objects.filter(status=AccountPurge.PENDING, next_attempt_at__lte=now)
+                | AccountPurge.objects.filter(status=AccountPurge.RUNNING, updated_at__lt=stale)
+            ).order_by('created_at', 'id').first()
+            if purge is None:
+                return None
+            purge.status = AccountPurge.RUNNING
+            purge.attempts += 1
+            purge.save(update_fields=['status', 'attempts', 'updated_at'])
+        return purge
+
+    def run(self, purge, chunk_size):
+        started = time.perf_counter()
+        self.stdout.write(f'Purging {purge.username} (user {purge.user_id}), attempt {purge.attempts}')
+        try:
+            purge_account(purge, chunk_size=chunk_size, progress=self.progress)
+        except PurgeSkipped as e:
+            # аккаунт снова включили, повторять нечего
+            self.mark_failed(purge, e, retry=False)
+            self.stderr.write(self.style.WARNING(f'Purge of {purge.username} skipped: {e}'))
+            return
+        except Exception as e:
+            logger.error(f"Purge of {purge.username} failed: {str(e)}")
+            self.mark_failed(purge, e)
+            self.stderr.write(self.style.ERROR(f'Purge of {purge.username} failed: {e}'))
+            return
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Purged {purge.username}: {purge.rows_deleted} rows in {elapsed:.1f}s'
+        ))
+
+    # удаление идёт пачками и повторяется с места остановки, упавшую попытку берём снова позже
+    def mark_failed(self, purge, error, retry=True):
+        purge.last_error = str(error)
+        if retry and purge.attempts < AccountPurge.MAX_ATTEMPTS:
+            purge.status = AccountPurge.PENDING
+            purge.next_attempt_at = timezone.now() + purge.retry_delay()
+        else:
+            purge.status = AccountPurge.FAILED
+        purge.save(update_fields=['status', 'last_error', 'next_attempt_at', 'updated_at'])
+
+    def progress(self, purge, model, count):
+        self.stdout.write(f'  {purge.username}: -{count} {model._meta.verbose_name_plural.lower()} ({purge.rows_deleted} rows so far)')
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.contrib.auth.models import User
+
+from accounts.services import rebuild_monthly_totals
+
+
+# сверка помесячных итогов с таблицами расходов и доходов
+class Command(BaseCommand):
+    help = 'Reconcile MonthlyTotal rollups against the raw Expense and Income rows'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help='Only rebuild rollups for this username')
+
+    def handle(self, *args, **options):
+        user = None
+        if options['user']:
+            user = User.objects.filter(username=options['user']).first()
+            if not user:
+                raise CommandError(f'User "{options["user"]}" not found')
+
+        created, updated, deleted = rebuild_monthly_totals(user)
+        self.stdout.write(self.style.SUCCESS(
+            f'Monthly totals reconciled: {created} created, {updated} updated, {deleted} deleted'
+        ))
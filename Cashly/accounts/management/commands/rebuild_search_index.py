@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+import time
+
+from accounts.routers import shard_databases
+from accounts.search import create_search_index, rebuild_search_index, search_available
+
+
+# полная перестройка FTS-индекса описаний операций во всех базах
+class Command(BaseCommand):
+    help = 'Recreate the FTS5 search triggers and rebuild the transaction description index from the tables'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--optimize', action='store_true', help='Merge index segments after the rebuild')
+
+    def handle(self, *args, **options):
+        for using in ['default'] + shard_databases():
+            connection = connections[using]
+            if not search_available(connection):
+                raise CommandError(f'{using}: full-text search needs SQLite with FTS5')
+
+            started = time.perf_counter()
+            create_search_index(connection)
+            rebuild_search_index(connection, optimize=options['optimize'])
+            self.stdout.write(self.style.SUCCESS(
+                f'{using}: search index rebuilt in {time.perf_counter() - started:.1f}s'
+            ))
@@ -0,0 +1,183 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import connections, transaction
+from django.utils import timezone
+from collections import defaultdict
+from datetime import date, timedelta
+from decimal import Decimal
+import random
+import time
+
+from accounts.fields import to_cents
+from accounts.models import (
+    UserProfile, Expense, Income, Budget, FinancialGoal, MonthlyTotal, transaction_fingerprint
+)
+from accounts.routers import shard_for_user, user_database
+
+# средняя сумма по категориям, суммы распределены логнормально вокруг неё
+EXPENSE_MEANS = {
+    'Food': 25, 'Transport': 15, 'Entertainment': 40, 'Health': 60,
+    'Shopping': 80, 'Bills': 120, 'Games': 30, 'Other': 20,
+}
+INCOME_MEANS = {'Salary': 2500, 'Freelance': 600, 'Investment': 200, 'Bonus': 900, 'Other': 100}
+DESCRIPTIONS = {
+    'Food': ['Groceries', 'Lunch', 'Coffee', 'Dinner out'],
+    'Transport': ['Taxi', 'Bus ticket', 'Fuel', 'Parking'],
+    'Entertainment': ['Cinema', 'Concert', 'Streaming'],
+    'Health': ['Pharmacy', 'Dentist', 'Gym'],
+    'Shopping': ['Clothes', 'Electronics', 'Books'],
+    'Bills': ['Rent', 'Electricity', 'Internet', 'Phone'],
+    'Games': ['Steam', 'Console game'],
+    'Other': ['Gift', 'Misc'],
+    'Salary': ['Monthly salary'],
+    'Freelance': ['Client project'],
+    'Investment': ['Dividends'],
+    'Bonus': ['Quarterly bonus'],
+}
+GOAL_NAMES = [('Vacation', '🏖️'), ('Car', '🚗'), ('Laptop', '💻'), ('Emergency fund', '🛟'), ('House', '🏠')]
+
+
+# синтетические данные для бенчмарков: пачками, без сигналов и поштучных save()
+class Command(BaseCommand):
+    help = 'Generate synthetic users with expenses, incomes, budgets and goals in large batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=10)
+        parser.add_argument('--expenses', type=int, default=1000, help='Mean expenses per user')
+        parser.add_argument('--incomes', type=int, default=50, help='Mean incomes per user')
+        parser.add_argument('--budgets', type=int, default=8, help='Category budgets per user for the current month')
+        parser.add_argument('--goals', type=int, default=3, help='Mean goals per user')
+        parser.add_argument('--months', type=int, default=24, help='How far back the history goes')
+        parser.add_argument(
+            '--distribution', choices=['uniform', 'pareto'], default='pareto',
+            help='How row counts are spread between users (pareto gives a few very heavy users)'
+        )
+        parser.add_argument('--prefix', default='seed', help='Username prefix for generated users')
+        parser.add_argument('--password', default='seed-password')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--seed', type=int, help='Random seed for reproducible data')
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        self.today = date.today()
+        self.first_day = self.today - timedelta(days=30 * options['months'])
+        self.distribution = options['distribution']
+        started = time.perf_counter()
+
+        users = self.create_users(options['users'], options['prefix'], options['password'])
+        totals = defaultdict(int)
+        for user in users:
+            with user_database(user.pk) as using, transaction.atomic(using=using):
+                rollups = defaultdict(lambda: [Decimal('0'), 0])
+                totals['expenses'] += self.create_transactions(
+                    user, Expense, 'category', EXPENSE_MEANS, self.spread(options['expenses']), rollups, using
+                )
+                totals['incomes'] += self.create_transactions(
+                    user, Income, 'source', INCOME_MEANS, self.spread(options['incomes']), rollups, using
+                )
+                MonthlyTotal.objects.bulk_create([
+                    MonthlyTotal(user=user, year_month=year_month, kind=kind, category=category, total=total, count=count)
+                    for (year_month, kind, category), (total, count) in rollups.items()
+                ], batch_size=self.batch_size)
+                totals['budgets'] += self.create_budgets(user, options['budgets'])
+                totals['goals'] += self.create_goals(user, self.spread(options['goals']))
+
+        elapsed = time.perf_counter() - started
+        rows = sum(totals.values())
+        self.stdout.write(self.style.SUCCESS(
+            f"Created {len(users)} users, {totals['expenses']} expenses, {totals['incomes']} incomes, "
+            f"{totals['budgets']} budgets and {totals['goals']} goals in {elapsed:.1f}s "
+            f"({rows / elapsed if elapsed else rows:.0f} rows/s)"
+        ))
+
+    def spread(self, mean):
+        if mean <= 0:
+            return 0
+        if self.distribution == 'uniform':
+            return self.rng.randint(0, 2 * mean)
+        # парето с alpha=2 имеет среднее 2 * xm
+        return int(self.rng.paretovariate(2) * mean / 2)
+
+    def create_users(self, count, prefix, password):
+        if count <= 0:
+            raise CommandError('--users must be positive')
+        start = User.objects.filter(username__startswith=prefix).count()
+        password = make_password(password)
+        now = timezone.now()
+        usernames = [f'{prefix}{start + i}' for i in range(count)]
+        User.objects.bulk_create([
+            User(username=username, email=f'{username}@example.com', password=password, date_joined=now)
+            for username in usernames
+        ], batch_size=self.batch_size)
+        users = list(User.objects.filter(username__in=usernames).order_by('id'))
+        # при шардировании профили вставляются пачкой в каждый шард
+        profiles = defaultdict(list)
+        for user in users:
+            profiles[shard_for_user(user.pk)].append(UserProfile(
+                user=user,
+                monthly_budget=Decimal(self.rng.randrange(500, 5000)),
+                lifetime_budget=Decimal(self.rng.randrange(20000, 200000)),
+            ))
+        for using, batch in profiles.items():
+            UserProfile.objects.using(using).bulk_create(batch, batch_size=self.batch_size)
+        return users
+
+    def random_amount(self, mean):
+        return Decimal(str(round(self.rng.lognormvariate(0, 0.6) * mean, 2))).quantize(Decimal('0.01'))
+
+    def random_day(self):
+        return self.first_day + timedelta(days=self.rng.randrange((self.today - self.first_day).days + 1))
+
+    def create_transactions(self, user, model, field, means, count, rollups, using):
+        kind = MonthlyTotal.EXPENSE if model is Expense else MonthlyTotal.INCOME
+        names = list(means)
+        weights = [1 / means[name] for name in names]  # мелких трат больше, чем крупных
+        # основная масса строк: executemany вместо bulk_create, компиляция SQL на каждую строку тут дороже вставки
+        columns = ['user_id', 'description', field, 'amount', 'date', 'created_at', 'fingerprint']
+        connection = connections[using]
+        sql = 'INSERT INTO {} ({}) VALUES ({})'.format(
+            connection.ops.quote_name(model._meta.db_table),
+            ', '.join(connection.ops.quote_name(column) for column in columns),
+            ', '.join(['%s'] * len(columns)),
+        )
+        now = connection.ops.adapt_datetimefield_value(timezone.now())
+        created = 0
+        with connection.cursor() as cursor:
+            while created < count:
+                batch = []
+                for category in self.rng.choices(names, weights, k=min(self.batch_size, count - created)):
+                    amount = self.random_amount(means[category])
+                    day = self.random_day()
+                    description = self.rng.choice(DESCRIPTIONS[category])
+                    batch.append((
+                        user.pk, description, category, to_cents(amount), day.isoformat(), now,
+                        transaction_fingerprint(day, amount, description),
+                    ))
+                    rollup = rollups[(day.replace(day=1), kind, category)]
+                    rollup[0] += amount
+                    rollup[1] += 1
+                cursor.executemany(sql, batch)
+                created += len(batch)
+        return created
+
+    def create_budgets(self, user, count):
+        month = self.today.replace(day=1)
+        categories = [name for name, label in Expense.CATEGORIES]
+        budgets = [
+            Budget(user=user, category=categories[i % len(categories)], limit=self.random_amount(300), month=month)
+            for i in range(count)
+        ]
+        Budget.objects.bulk_create(budgets, batch_size=self.batch_size)
+        return len(budgets)
+
+    def create_goals(self, user, count):
+        goals = []
+        for _ in range(count):
+            name, icon = self.rng.choice(GOAL_NAMES)
+            target = self.random_amount(5000)
+            saved = (target * Decimal(self.rng.random())).quantize(Decimal('0.01'))
+            goals.append(FinancialGoal(user=user, name=name, icon=icon, target=target, saved=saved))
+        FinancialGoal.objects.bulk_create(goals, batch_size=self.batch_size)
+        return len(goals)
@@ -0,0 +1,108 @@
+from django.core.management.base import BaseCommand
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from datetime import timedelta
+import logging
+import time
+
+from accounts.models import OutboundEmail
+
+logger = logging.getLogger(__name__)
+
+# сколько времени пачка считается занятой воркером
+CLAIM_SECONDS = 300
+
+
+# разбор outbox: пачками через одно SMTP-соединение, с повторами
+class Command(BaseCommand):
+    help = 'Send queued OutboundEmail rows in batches over one reused connection, retrying failures with backoff'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100)
+        parser.add_argument('--loop', action='store_true', help='Keep polling the outbox instead of exiting when it is empty')
+        parser.add_argument('--interval', type=float, default=5, help='Seconds to sleep between polls with --loop')
+
+    def handle(self, *args, **options):
+        total_sent = total_failed = 0
+        while True:
+            batch = self.claim_batch(options['batch_size'])
+            if batch:
+                sent, failed = self.send_batch(batch)
+                total_sent += sent
+                total_failed += failed
+                continue
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
+
+        self.stdout.write(self.style.SUCCESS(f'Outbox drained: {total_sent} sent, {total_failed} failed attempts'))
+
+    # попытка считается при захвате, в том же UPDATE: воркер, упавший посреди отправки,
+    # тоже её тратит, и письмо не забирается заново бесконечно
+    def claim_batch(self, size):
+        now = timezone.now()
+        with transaction.atomic():
+            due = OutboundEmail.objects.filter(status=OutboundEmail.PENDING, next_attempt_at__lte=now)
+            due.filter(attempts__gte=OutboundEmail.MAX_ATTEMPTS).update(
+                status=OutboundEmail.FAILED, last_error='Worker stopped during the last attempt'
+            )
+            ids = list(
+                due.filter(attempts__lt=OutboundEmail.MAX_ATTEMPTS)
+                .order_by('next_attempt_at', 'id').values_list('id', flat=True)[:size]
+            )
+            if not ids:
+                return []
+            OutboundEmail.objects.filter(id__in=ids).update(
+                attempts=F('attempts') + 1, next_attempt_at=now + timedelta(seconds=CLAIM_SECONDS)
+            )
+        return list(OutboundEmail.objects.filter(id__in=ids).order_by('id'))
+
+    def send_batch(self, batch):
+        sent = failed = 0
+        connection = get_connection(fail_silently=False)
+        try:
+            connection.open()
+        except Exception as e:
+            logger.error(f"Could not open email connection: {str(e)}")
+            for email in batch:
+                self.mark_failed(email, e)
+            return 0, len(batch)
+
+        try:
+            for email in batch:
+                message = EmailMessage(
+                    email.subject,
+                    email.body,
+                    from_email=email.from_email or None,
+                    to=[email.to],
+                    connection=connection,
+                )
+                try:
+                    message.send(fail_silently=False)
+                except Exception as e:
+                    logger.error(f"Email to {email.to} failed: {str(e)}")
+                    self.mark_failed(email, e)
+                    failed += 1
+                    continue
+
+                email.status = OutboundEmail.SENT
+                email.sent_at = timezone.now()
+                email.last_error = ''
+                email.save(update_fields=['status', 'sent_at', 'last_error'])
+                sent += 1
+        finally:
+            connection.close()
+
+        logger.info(f"Outbox batch: {sent} sent, {failed} failed")
+        return sent, failed
+
+    # attempts уже увеличен при захвате
+    def mark_failed(self, email, error):
+        email.last_error = str(error)
+        if email.attempts >= OutboundEmail.MAX_ATTEMPTS:
+            email.status = OutboundEmail.FAILED
+        else:
+            email.next_attempt_at = timezone.now() + email.retry_delay()
+        email.save(update_fields=['status', 'last_error', 'next_attempt_at'])
@@ -0,0 +1,55 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+import os
+import sqlite3
+import time
+
+
+# копия основной базы в файл реплики через sqlite backup API, подмена файла атомарная
+class Command(BaseCommand):
+    help = 'Copy the primary SQLite database into the read replica file (CASHLY_REPLICA_DB)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, help='Keep running and refresh the snapshot every N seconds')
+
+    def handle(self, *args, **options):
+        if not getattr(settings, 'REPLICA_DATABASE', None):
+            raise CommandError('No replica configured, set CASHLY_REPLICA_DB')
+        source = settings.DATABASES['default']
+        if source['ENGINE'] != 'django.db.backends.sqlite3':
+            raise CommandError('Snapshots are only supported for SQLite')
+
+        while True:
+            self.snapshot(str(source['NAME']), settings.REPLICA_DB)
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
+
+    def snapshot(self, source_path, target_path):
+        started = time.perf_counter()
+        tmp_path = f'{target_path}.tmp'
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+        # backup читает согласованный снимок и не блокирует писателей в WAL
+        source = sqlite3.connect(source_path)
+        target = sqlite3.connect(tmp_path)
+        try:
+            source.backup(target)
+            # реплика открывается read-only, WAL-файлы ей не нужны
+            target.execute('PRAGMA journal_mode = DELETE')
+        finally:
+            target.close()
+            source.close()
+
+        os.replace(tmp_path, target_path)
+        for suffix in ('-wal', '-shm'):
+            if os.path.exists(target_path + suffix):
+                os.remove(target_path + suffix)
+        # соединения этого процесса ещё смотрят на старый файл
+        connections[settings.REPLICA_DATABASE].close()
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Snapshot written to {target_path} in {(time.perf_counter() - started) * 1000:.0f}ms'
+        ))
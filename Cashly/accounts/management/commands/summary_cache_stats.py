@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from accounts.summary_cache import get_cache_stats, reset_cache_stats
+
+
+# статистика попаданий в кэш сводок
+class Command(BaseCommand):
+    help = 'Show hit/miss counters of the per-user summary cache (shared across processes only with a shared backend such as the file-based cache)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true', help='Reset the counters after printing them')
+
+    def handle(self, *args, **options):
+        stats = get_cache_stats()
+        lookups = stats['hits'] + stats['misses']
+        ratio = stats['hits'] / lookups * 100 if lookups else 0
+        self.stdout.write(f"hits: {stats['hits']}  misses: {stats['misses']}  hit ratio: {ratio:.1f}%")
+        if options['reset']:
+            reset_cache_stats()
@@ -0,0 +1,120 @@
+from collections import defaultdict
+from contextvars import ContextVar
+import math
+import threading
+import time
+
+# границы бакетов гистограмм (секунды и число запросов)
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200)
+
+
+# перцентиль по ближайшему рангу
+def percentile(values, p):
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, math.ceil(p / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+class QueryTracker:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.count = 0
+        self.duration = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            with self.lock:
+                self.count += 1
+                self.duration += time.perf_counter() - start
+
+
+# трекер текущего запроса: async-вьюхи ходят в базу из других потоков, контекст переезжает туда вместе с ними
+_current_tracker = ContextVar('query_tracker', default=None)
+
+
+def track_queries(tracker):
+    return _current_tracker.set(tracker)
+
+
+def stop_tracking_queries(token):
+    _current_tracker.reset(token)
+
+
+# execute_wrapper на каждом соединении (см. accounts/db.py), считает в трекер текущего запроса
+def tracked_execute(execute, sql, params, many, context):
+    tracker = _current_tracker.get()
+    if tracker is None:
+        return execute(sql, params, many, context)
+    return tracker(execute, sql, params, many, context)
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.count += 1
+        self.sum += value
+
+
+class MetricsRegistry:
+    METRICS = {
+        'cashly_request_duration_seconds': ('Wall time per request', DURATION_BUCKETS),
+        'cashly_request_db_queries': ('Database queries per request', QUERY_BUCKETS),
+        'cashly_request_db_duration_seconds': ('Database time per request', DURATION_BUCKETS),
+    }
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.histograms = {
+                name: defaultdict(lambda buckets=buckets: Histogram(buckets))
+                for name, (help_text, buckets) in self.METRICS.items()
+            }
+            self.responses = defaultdict(int)
+
+    def observe(self, view, status, duration, queries, db_duration):
+        with self.lock:
+            self.histograms['cashly_request_duration_seconds'][view].observe(duration)
+            self.histograms['cashly_request_db_queries'][view].observe(queries)
+            self.histograms['cashly_request_db_duration_seconds'][view].observe(db_duration)
+            self.responses[(view, status)] += 1
+
+    # текстовый формат Prometheus
+    def render(self):
+        lines = []
+        with self.lock:
+            lines.append('# HELP cashly_requests_total Requests by view and status code')
+            lines.append('# TYPE cashly_requests_total counter')
+            for (view, status), count in sorted(self.responses.items()):
+                lines.append(f'cashly_requests_total{{view="{view}",status="{status}"}} {count}')
+
+            for name, (help_text, buckets) in self.METRICS.items():
+                lines.append(f'# HELP {name} {help_text}')
+                lines.append(f'# TYPE {name} histogram')
+                for view, histogram in sorted(self.histograms[name].items()):
+                    cumulative = 0
+                    for bound, count in zip(histogram.buckets, histogram.counts):
+                        cumulative += count
+                        lines.append(f'{name}_bucket{{view="{view}",le="{bound}"}} {cumulative}')
+                    lines.append(f'{name}_bucket{{view="{view}",le="+Inf"}} {histogram.count}')
+                    lines.append(f'{name}_sum{{view="{view}"}} {histogram.sum:.6f}')
+                    lines.append(f'{name}_count{{view="{view}"}} {histogram.count}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
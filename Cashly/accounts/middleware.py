@@ -0,0 +1,122 @@
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.http import HttpResponse
+import time
+
+from .metrics import QueryTracker, registry, stop_tracking_queries, track_queries
+from .models import UserMoving, UserShard
+from .routers import pinned_to_primary, shard_for_user, user_database
+from .summary_cache import recording_bumps
+
+
+# middleware работают и под WSGI, и под ASGI: с синхронным звеном в цепочке
+# async-вьюха запускалась бы через async_to_sync в потоке этого звена
+class HybridMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return self.handle(request)
+
+
+# время запроса, число запросов к БД и время в БД по имени url
+class RequestMetricsMiddleware(HybridMiddleware):
+    def handle(self, request):
+        tracker = QueryTracker()
+        token = track_queries(tracker)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            stop_tracking_queries(token)
+        return self.observe(request, response, tracker, time.perf_counter() - start)
+
+    async def __acall__(self, request):
+        tracker = QueryTracker()
+        token = track_queries(tracker)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            stop_tracking_queries(token)
+        return self.observe(request, response, tracker, time.perf_counter() - start)
+
+    def observe(self, request, response, tracker, duration):
+        match = getattr(request, 'resolver_match', None)
+        view = match.view_name if match else 'unresolved'
+        registry.observe(view, response.status_code, duration, tracker.count, tracker.duration)
+
+        if getattr(settings, 'SERVER_TIMING_HEADER', False):
+            response['Server-Timing'] = (
+                f'app;dur={duration * 1000:.1f}, '
+                f'db;dur={tracker.duration * 1000:.1f};desc="{tracker.count} queries"'
+            )
+        return response
+
+
+# read-your-writes: после записи браузер какое-то время читает с основной базы
+class ReplicaPinMiddleware(HybridMiddleware):
+    COOKIE_NAME = 'cashly_primary'
+
+    def handle(self, request):
+        with recording_bumps() as bumped, pinned_to_primary(request.COOKIES.get(self.COOKIE_NAME) == '1'):
+            response = self.get_response(request)
+        return self.pin(request, response, bool(bumped))
+
+    async def __acall__(self, request):
+        with recording_bumps() as bumped, pinned_to_primary(request.COOKIES.get(self.COOKIE_NAME) == '1'):
+            response = await self.get_response(request)
+        return self.pin(request, response, bool(bumped))
+
+    def pin(self, request, response, wrote):
+        if request.method not in ('GET', 'HEAD', 'OPTIONS'):
+            wrote = True
+        if wrote:
+            response.set_cookie(
+                self.COOKIE_NAME, '1', max_age=settings.REPLICA_PIN_SECONDS, httponly=True, samesite='Lax'
+            )
+        return response
+
+
+# привязывает запрос к шарду юзера; пока юзер переезжает, записи отклоняются
+class ShardMiddleware(HybridMiddleware):
+    def handle(self, request):
+        if not request.user.is_authenticated:
+            return self.get_response(request)
+
+        with user_database(request.user.pk):
+            if request.method not in ('GET', 'HEAD', 'OPTIONS') and self.locked(request.user.pk).exists():
+                return self.moving()
+            return self.get_response(request)
+
+    async def __acall__(self, request):
+        user = await request.auser()
+        if not user.is_authenticated:
+            return await self.get_response(request)
+
+        alias = await sync_to_async(shard_for_user)(user.pk)
+        with user_database(user.pk, alias):
+            if request.method not in ('GET', 'HEAD', 'OPTIONS') and await self.locked(user.pk).aexists():
+                return self.moving()
+            return await self.get_response(request)
+
+    # запись, проскочившая мимо проверки метода (или начатая до блокировки), отклоняется при сохранении
+    def process_exception(self, request, exception):
+        if isinstance(exception, UserMoving):
+            return self.moving()
+        return None
+
+    def locked(self, user_id):
+        return UserShard.objects.using('default').filter(user_id=user_id, locked=True)
+
+    def moving(self):
+        response = HttpResponse('Your data is being moved, please retry in a few seconds.', status=503)
+        response['Retry-After'] = '5'
+        return response
@@ -0,0 +1,55 @@
+# Generated by Django 6.0.2 on 2026-10-18 02:56
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Sum, Count
+from django.db.models.functions import TruncMonth
+
+
+def populate_monthly_totals(apps, schema_editor):
+    MonthlyTotal = apps.get_model('accounts', 'MonthlyTotal')
+    sources = (
+        (apps.get_model('accounts', 'Expense'), 'expense', 'category'),
+        (apps.get_model('accounts', 'Income'), 'income', 'source'),
+    )
+    for model, kind, field in sources:
+        rows = model.objects.order_by().annotate(year_month=TruncMonth('date')).values('user', 'year_month', field).annotate(
+            total=Sum('amount'), count=Count('id')
+        )
+        MonthlyTotal.objects.bulk_create([
+            MonthlyTotal(
+                user_id=row['user'], year_month=row['year_month'], kind=kind,
+                category=row[field], total=row['total'], count=row['count']
+            )
+            for row in rows
+        ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0005_composite_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MonthlyTotal',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('year_month', models.DateField()),
+                ('kind', models.CharField(choices=[('expense', 'Expense'), ('income', 'Income')], max_length=10)),
+                ('category', models.CharField(max_length=50)),
+                ('total', models.DecimalField(decimal_places=2, default=0, max_digits=15)),
+                ('count', models.IntegerField(default=0)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='monthly_totals', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Monthly Total',
+                'verbose_name_plural': 'Monthly Totals',
+                'constraints': [models.UniqueConstraint(fields=('user', 'year_month', 'kind', 'category'), name='monthly_total_unique')],
+            },
+        ),
+        migrations.RunPython(populate_monthly_totals, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 6.0.2 on 2026-10-18 03:00
+
+from django.conf import settings
+from django.db import migrations, models
+from decimal import Decimal
+import hashlib
+
+
+def fill_fingerprints(apps, schema_editor):
+    for name in ('Expense', 'Income'):
+        model = apps.get_model('accounts', name)
+        batch = []
+        for row in model.objects.only('id', 'date', 'amount', 'description').iterator(chunk_size=2000):
+            amount = Decimal(row.amount).quantize(Decimal('0.01'))
+            raw = f'{row.date.isoformat()}|{amount}|{row.description.strip()}'
+            row.fingerprint = hashlib.sha1(raw.encode('utf-8')).hexdigest()
+            batch.append(row)
+            if len(batch) >= 2000:
+                model.objects.bulk_update(batch, ['fingerprint'])
+                batch = []
+        model.objects.bulk_update(batch, ['fingerprint'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0006_monthlytotal'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='expense',
+            name='fingerprint',
+            field=models.CharField(blank=True, default='', editable=False, max_length=40),
+        ),
+        migrations.AddField(
+            model_name='income',
+            name='fingerprint',
+            field=models.CharField(blank=True, default='', editable=False, max_length=40),
+        ),
+        migrations.AddIndex(
+            model_name='expense',
+            index=models.Index(fields=['user', 'fingerprint'], name='expense_user_fingerprint_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='income',
+            index=models.Index(fields=['user', 'fingerprint'], name='income_user_fingerprint_idx'),
+        ),
+        migrations.RunPython(fill_fingerprints, migrations.RunPython.noop),
+    ]
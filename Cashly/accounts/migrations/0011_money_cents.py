@@ -0,0 +1,238 @@
+# Generated by Django 6.0.2 on 2026-10-18 03:40
+
+import accounts.fields
+from django.db import migrations, models
+from django.db.models import F, Value
+from django.db.models.functions import Cast, Round
+from decimal import Decimal
+
+MONEY_FIELDS = [
+    ('userprofile', 'monthly_budget'),
+    ('userprofile', 'lifetime_budget'),
+    ('income', 'amount'),
+    ('expense', 'amount'),
+    ('budget', 'limit'),
+    ('financialgoal', 'target'),
+    ('financialgoal', 'saved'),
+    ('monthlytotal', 'total'),
+]
+
+
+# одним UPDATE на колонку, ROUND страхует от REAL вроде 12.34 * 100 = 1233.999...
+def decimal_to_cents(apps, schema_editor):
+    for model_name, name in MONEY_FIELDS:
+        model = apps.get_model('accounts', model_name)
+        model.objects.using(schema_editor.connection.alias).update(**{
+            f'{name}_cents': Cast(Round(F(name) * 100), models.BigIntegerField()),
+        })
+
+
+def cents_to_decimal(apps, schema_editor):
+    for model_name, name in MONEY_FIELDS:
+        model = apps.get_model('accounts', model_name)
+        model.objects.using(schema_editor.connection.alias).update(**{
+            name: F(f'{name}_cents') * Value(Decimal('0.01'), output_field=models.DecimalField()),
+        })
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0010_accountpurge'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userprofile',
+            name='monthly_budget_cents',
+            field=models.BigIntegerField(null=True),
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='lifetime_budget_cents',
+            field=models.BigIntegerField(null=True),
+        ),
+        migrations.AddField(
+            model_name='income',
+            name='amount_cents',
+            field=models.BigIntegerField(null=True),
+        ),
+        migrations.AddField(
+            model_name='expense',
+            name='amount_cents',
+            field=models.BigIntegerField(null=True),
+        ),
+        migrations.AddField(
+            model_name='budget',
+            name='limit_cents',
+            field=models.BigIntegerField(null=True),
+        ),
+        migrations.AddField(
+            model_name='financialgoal',
+            name='target_cents',
+            field=models.BigIntegerField(null=True),
+        ),
+        migrations.AddField(
+            model_name='financialgoal',
+            name='saved_cents',
+            field=models.BigIntegerField(null=True),
+        ),
+        migrations.AddField(
+            model_name='monthlytotal',
+            name='total_cents',
+            field=models.BigIntegerField(null=True),
+        ),
+        migrations.AlterField(
+            model_name='userprofile',
+            name='monthly_budget',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=12, null=True),
+        ),
+        migrations.AlterField(
+            model_name='userprofile',
+            name='lifetime_budget',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=15, null=True),
+        ),
+        migrations.AlterField(
+            model_name='income',
+            name='amount',
+            field=models.DecimalField(decimal_places=2, max_digits=10, null=True),
+        ),
+        migrations.AlterField(
+            model_name='expense',
+            name='amount',
+            field=models.DecimalField(decimal_places=2, max_digits=10, null=True),
+        ),
+        migrations.AlterField(
+            model_name='budget',
+            name='limit',
+            field=models.DecimalField(decimal_places=2, max_digits=10, null=True),
+        ),
+        migrations.AlterField(
+            model_name='financialgoal',
+            name='target',
+            field=models.DecimalField(decimal_places=2, max_digits=15, null=True),
+        ),
+        migrations.AlterField(
+            model_name='financialgoal',
+            name='saved',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=15, null=True),
+        ),
+        migrations.AlterField(
+            model_name='monthlytotal',
+            name='total',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=15, null=True),
+        ),
+        migrations.RunPython(decimal_to_cents, cents_to_decimal),
+        migrations.RemoveField(
+            model_name='userprofile',
+            name='monthly_budget',
+        ),
+        migrations.RenameField(
+            model_name='userprofile',
+            old_name='monthly_budget_cents',
+            new_name='monthly_budget',
+        ),
+        migrations.AlterField(
+            model_name='userprofile',
+            name='monthly_budget',
+            field=accounts.fields.MoneyField(default=0, max_digits=12),
+        ),
+        migrations.RemoveField(
+            model_name='userprofile',
+            name='lifetime_budget',
+        ),
+        migrations.RenameField(
+            model_name='userprofile',
+            old_name='lifetime_budget_cents',
+            new_name='lifetime_budget',
+        ),
+        migrations.AlterField(
+            model_name='userprofile',
+            name='lifetime_budget',
+            field=accounts.fields.MoneyField(default=0, max_digits=15),
+        ),
+        migrations.RemoveField(
+            model_name='income',
+            name='amount',
+        ),
+        migrations.RenameField(
+            model_name='income',
+            old_name='amount_cents',
+            new_name='amount',
+        ),
+        migrations.AlterField(
+            model_name='income',
+            name='amount',
+            field=accounts.fields.MoneyField(max_digits=10),
+        ),
+        migrations.RemoveField(
+            model_name='expense',
+            name='amount',
+        ),
+        migrations.RenameField(
+            model_name='expense',
+            old_name='amount_cents',
+            new_name='amount',
+        ),
+        migrations.AlterField(
+            model_name='expense',
+            name='amount',
+            field=accounts.fields.MoneyField(max_digits=10),
+        ),
+        migrations.RemoveField(
+            model_name='budget',
+            name='limit',
+        ),
+        migrations.RenameField(
+            model_name='budget',
+            old_name='limit_cents',
+            new_name='limit',
+        ),
+        migrations.AlterField(
+            model_name='budget',
+            name='limit',
+            field=accounts.fields.MoneyField(max_digits=10),
+        ),
+        migrations.RemoveField(
+            model_name='financialgoal',
+            name='target',
+        ),
+        migrations.RenameField(
+            model_name='financialgoal',
+            old_name='target_cents',
+            new_name='target',
+        ),
+        migrations.AlterField(
+            model_name='financialgoal',
+            name='target',
+            field=accounts.fields.MoneyField(max_digits=15),
+        ),
+        migrations.RemoveField(
+            model_name='financialgoal',
+            name='saved',
+        ),
+        migrations.RenameField(
+            model_name='financialgoal',
+            old_name='saved_cents',
+            new_name='saved',
+        ),
+        migrations.AlterField(
+            model_name='financialgoal',
+            name='saved',
+            field=accounts.fields.MoneyField(default=0, max_digits=15),
+        ),
+        migrations.RemoveField(
+            model_name='monthlytotal',
+            name='total',
+        ),
+        migrations.RenameField(
+            model_name='monthlytotal',
+            old_name='total_cents',
+            new_name='total',
+        ),
+        migrations.AlterField(
+            model_name='monthlytotal',
+            name='total',
+            field=accounts.fields.MoneyField(default=0, max_digits=15),
+        ),
+    ]
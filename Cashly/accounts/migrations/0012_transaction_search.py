@@ -0,0 +1,28 @@
+# Generated by Django 6.0.2 on 2026-10-18 04:05
+
+from django.db import migrations
+
+
+def create_index(apps, schema_editor):
+    from accounts.search import create_search_index, rebuild_search_index, search_available
+    connection = schema_editor.connection
+    create_search_index(connection)
+    # уже существующие строки попадают в индекс одним проходом
+    if search_available(connection):
+        rebuild_search_index(connection)
+
+
+def drop_index(apps, schema_editor):
+    from accounts.search import drop_search_index
+    drop_search_index(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0011_money_cents'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
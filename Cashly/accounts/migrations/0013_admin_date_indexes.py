@@ -0,0 +1,31 @@
+# Generated by Django 6.0.2 on 2026-10-18 04:20
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0012_transaction_search'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='budget',
+            index=models.Index(fields=['month'], name='budget_month_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='expense',
+            index=models.Index(fields=['date'], name='expense_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='financialgoal',
+            index=models.Index(fields=['created_at'], name='goal_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='income',
+            index=models.Index(fields=['date'], name='income_date_idx'),
+        ),
+    ]
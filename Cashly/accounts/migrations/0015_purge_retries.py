@@ -0,0 +1,24 @@
+# Generated by Django 6.0.2 on 2026-10-18 04:51
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0014_data_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='accountpurge',
+            name='attempts',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='accountpurge',
+            name='next_attempt_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
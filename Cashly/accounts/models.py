@@ -1,15 +1,24 @@
-from django.db import models
+from django.db import models, router, transaction, IntegrityError
+from django.db.models import F, Value
+from django.utils import timezone
 from django.contrib.auth.models import User
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, pre_save, post_delete, pre_delete
 from django.dispatch import receiver
+from datetime import timedelta
+from decimal import Decimal
+import hashlib
+
+from .fields import MoneyField
+from .routers import SHARDED_MODELS, shard_databases
+from .summary_cache import bump_data_version
 
 # таблица для расширенного профиля
 class UserProfile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='profile')
     bio = models.TextField(blank=True, null=True)
     photo = models.ImageField(upload_to='profile_photos/', blank=True, null=True)
-    monthly_budget = models.DecimalField(max_digits=12, decimal_places=2, default=0)
-    lifetime_budget = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    monthly_budget = MoneyField(max_digits=12, default=0)
+    lifetime_budget = MoneyField(max_digits=15, default=0)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -25,12 +34,24 @@ class UserProfile(models.Model):
 @receiver(post_save, sender=User)
 def create_user_profile(sender, instance, created, **kwargs):
     if created:
-        UserProfile.objects.get_or_create(user=instance)
+        UserProfile.objects.db_manager(hints={'user_id': instance.pk}).get_or_create(user=instance)
 
 
-@receiver(post_save, sender=User)
-def save_user_profile(sender, instance, **kwargs):
-    instance.profile
+# профиль юзера: обычно уже подгружен вместе с request.user, запрос только если его ещё нет
+def get_profile(user):
+    try:
+        return user.profile
+    except UserProfile.DoesNotExist:
+        profile, created = UserProfile.objects.db_manager(hints={'user_id': user.pk}).get_or_create(user=user)
+        user.profile = profile
+        return profile
+
+
+# хэш (дата, сумма, описание) для поиска дублей при импорте
+def transaction_fingerprint(day, amount, description):
+    amount = Decimal(amount).quantize(Decimal('0.01'))
+    raw = f'{day.isoformat()}|{amount}|{description.strip()}'
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()
 
 
 # модель для доходов
@@ -46,9 +67,10 @@ class Income(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='incomes')
     description = models.CharField(max_length=200)
     source = models.CharField(max_length=50, choices=SOURCES)
-    amount = models.DecimalField(max_digits=10, decimal_places=2)
+    amount = MoneyField(max_digits=10)
     date = models.DateField()
     created_at = models.DateTimeField(auto_now_add=True)
+    fingerprint = models.CharField(max_length=40, blank=True, default='', editable=False)
 
     def __str__(self):
         return f"{self.description} - ${self.amount}"
@@ -57,6 +79,13 @@ class Income(models.Model):
         verbose_name = "Income"
         verbose_name_plural = "Incomes"
         ordering = ['-date']
+        indexes = [
+            models.Index(fields=['user', 'date'], name='income_user_date_idx'),
+            # для админки: сортировка по дате и date_hierarchy по всей таблице
+            models.Index(fields=['date'], name='income_date_idx'),
+            models.Index(fields=['user', 'source', 'date'], name='income_user_source_date_idx'),
+            models.Index(fields=['user', 'fingerprint'], name='income_user_fingerprint_idx'),
+        ]
 
 
 # расходы
@@ -75,9 +104,10 @@ class Expense(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='expenses')
     description = models.CharField(max_length=200)
     category = models.CharField(max_length=50, choices=CATEGORIES)
-    amount = models.DecimalField(max_digits=10, decimal_places=2)
+    amount = MoneyField(max_digits=10)
     date = models.DateField()
     created_at = models.DateTimeField(auto_now_add=True)
+    fingerprint = models.CharField(max_length=40, blank=True, default='', editable=False)
 
     def __str__(self):
         return f"{self.description} - ${self.amount}"
@@ -86,13 +116,20 @@ class Expense(models.Model):
         verbose_name = "Expense"
         verbose_name_plural = "Expenses"
         ordering = ['-date']
+        indexes = [
+            models.Index(fields=['user', 'date'], name='expense_user_date_idx'),
+            # для админки: сортировка по дате и date_hierarchy по всей таблице
+            models.Index(fields=['date'], name='expense_date_idx'),
+            models.Index(fields=['user', 'category', 'date'], name='expense_user_cat_date_idx'),
+            models.Index(fields=['user', 'fingerprint'], name='expense_user_fingerprint_idx'),
+        ]
 
 
 # лимиты по категориям
 class Budget(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='budgets')
     category = models.CharField(max_length=50)
-    limit = models.DecimalField(max_digits=10, decimal_places=2)
+    limit = MoneyField(max_digits=10)
     month = models.DateField()
 
     def __str__(self):
@@ -101,6 +138,10 @@ class Budget(models.Model):
     class Meta:
         verbose_name = "Budget"
         verbose_name_plural = "Budgets"
+        indexes = [
+            models.Index(fields=['user', 'month', 'category'], name='budget_user_month_cat_idx'),
+            models.Index(fields=['month'], name='budget_month_idx'),
+        ]
 
 
 # финансовые цели
@@ -108,8 +149,8 @@ class FinancialGoal(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='goals')
     name = models.CharField(max_length=200)
     icon = models.CharField(max_length=10, default='🎯')
-    target = models.DecimalField(max_digits=15, decimal_places=2)
-    saved = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    target = MoneyField(max_digits=15)
+    saved = MoneyField(max_digits=15, default=0)
     created_at = models.DateTimeField(auto_now_add=True)
 
     def __str__(self):
@@ -124,4 +165,262 @@ class FinancialGoal(models.Model):
     class Meta:
         verbose_name = "Financial Goal"
         verbose_name_plural = "Financial Goals"
-        
\ No newline at end of file
+        indexes = [
+            models.Index(fields=['created_at'], name='goal_created_idx'),
+        ]
+
+
+# помесячные итоги по тратам и доходам, обновляются инкрементально
+class MonthlyTotal(models.Model):
+    EXPENSE = 'expense'
+    INCOME = 'income'
+    KINDS = [
+        (EXPENSE, 'Expense'),
+        (INCOME, 'Income'),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='monthly_totals')
+    year_month = models.DateField()  # первое число месяца
+    kind = models.CharField(max_length=10, choices=KINDS)
+    category = models.CharField(max_length=50)  # категория расхода или источник дохода
+    total = MoneyField(max_digits=15, default=0)
+    count = models.IntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.user} {self.year_month:%Y-%m} {self.kind} {self.category} - ${self.total}"
+
+    @classmethod
+    def apply(cls, user_id, day, kind, category, amount, count=1):
+        key = dict(user_id=user_id, year_month=day.replace(day=1), kind=kind, category=category)
+        using = router.db_for_write(cls, user_id=user_id)
+        rows = cls.objects.using(using)
+        # без output_field сумма ушла бы в SQL как Decimal, а не в центах
+        delta = Value(amount, output_field=cls._meta.get_field('total'))
+        with transaction.atomic(using=using):
+            updated = rows.filter(**key).update(total=F('total') + delta, count=F('count') + count)
+            # строку создаём только при добавлении, вычитать из несуществующей нечего
+            if updated or count <= 0:
+                return
+            try:
+                with transaction.atomic(using=using):
+                    rows.create(total=amount, count=count, **key)
+            except IntegrityError:
+                rows.filter(**key).update(total=F('total') + delta, count=F('count') + count)
+
+    class Meta:
+        verbose_name = "Monthly Total"
+        verbose_name_plural = "Monthly Totals"
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'year_month', 'kind', 'category'], name='monthly_total_unique'),
+        ]
+
+
+def rollup_entry(instance):
+    if isinstance(instance, Expense):
+        kind, category = MonthlyTotal.EXPENSE, instance.category
+    else:
+        kind, category = MonthlyTotal.INCOME, instance.source
+    # во вьюхах дата и сумма приходят строками
+    day = instance._meta.get_field('date').to_python(instance.date)
+    amount = instance._meta.get_field('amount').to_python(instance.amount)
+    return (instance.user_id, day, kind, category, amount)
+
+
+@receiver(pre_save, sender=Expense)
+@receiver(pre_save, sender=Income)
+def set_fingerprint(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    user_id, day, kind, category, amount = rollup_entry(instance)
+    instance.fingerprint = transaction_fingerprint(day, amount, instance.description)
+
+
+@receiver(pre_save, sender=Expense)
+@receiver(pre_save, sender=Income)
+def remember_rollup_entry(sender, instance, raw=False, using=None, **kwargs):
+    previous = None
+    if instance.pk and not raw:
+        previous = sender.objects.using(using).filter(pk=instance.pk).first()
+    instance._rollup_previous = rollup_entry(previous) if previous else None
+
+
+@receiver(post_save, sender=Expense)
+@receiver(post_save, sender=Income)
+def update_monthly_total(sender, instance, raw=False, using=None, **kwargs):
+    if raw:
+        return
+    current = rollup_entry(instance)
+    previous = getattr(instance, '_rollup_previous', None)
+    if previous == current:
+        return
+    with transaction.atomic(using=using):
+        if previous:
+            user_id, day, kind, category, amount = previous
+            MonthlyTotal.apply(user_id, day, kind, category, -amount, count=-1)
+        MonthlyTotal.apply(*current)
+
+
+@receiver(post_delete, sender=Expense)
+@receiver(post_delete, sender=Income)
+def remove_from_monthly_total(sender, instance, **kwargs):
+    user_id, day, kind, category, amount = rollup_entry(instance)
+    MonthlyTotal.apply(user_id, day, kind, category, -amount, count=-1)
+
+
+# исходящие письма, отправляются воркером send_outbound_emails
+class OutboundEmail(models.Model):
+    PENDING = 'pending'
+    SENT = 'sent'
+    FAILED = 'failed'
+    STATUSES = [
+        (PENDING, 'Pending'),
+        (SENT, 'Sent'),
+        (FAILED, 'Failed'),
+    ]
+
+    MAX_ATTEMPTS = 5
+    RETRY_BASE_SECONDS = 60
+
+    to = models.EmailField()
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    from_email = models.CharField(max_length=255, blank=True)
+    status = models.CharField(max_length=10, choices=STATUSES, default=PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(blank=True, null=True)
+
+    def __str__(self):
+        return f"{self.subject} -> {self.to} ({self.status})"
+
+    def retry_delay(self):
+        # 1, 2, 4, 8... минут
+        return timedelta(seconds=self.RETRY_BASE_SECONDS * 2 ** (self.attempts - 1))
+
+    class Meta:
+        verbose_name = "Outbound Email"
+        verbose_name_plural = "Outbound Emails"
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='outbox_status_next_idx'),
+        ]
+
+
+# удаление аккаунта в фоне: юзер сразу деактивируется, данные чистит команда purge_accounts
+class AccountPurge(models.Model):
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUSES = [
+        (PENDING, 'Pending'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    ]
+
+    MAX_ATTEMPTS = 5
+    RETRY_BASE_SECONDS = 60
+
+    # не внешний ключ: запись переживает удаление юзера
+    user_id = models.IntegerField(db_index=True)
+    username = models.CharField(max_length=150)
+    status = models.CharField(max_length=10, choices=STATUSES, default=PENDING)
+    rows_deleted = models.PositiveIntegerField(default=0)
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+
+    def __str__(self):
+        return f"Purge of {self.username} ({self.status})"
+
+    def retry_delay(self):
+        # 1, 2, 4, 8... минут, как у outbox
+        return timedelta(seconds=self.RETRY_BASE_SECONDS * 2 ** (self.attempts - 1))
+
+    class Meta:
+        verbose_name = "Account Purge"
+        verbose_name_plural = "Account Purges"
+        indexes = [
+            models.Index(fields=['status', 'updated_at'], name='purge_status_updated_idx'),
+        ]
+
+
+# версия данных юзера для ключей кэша сводок и ETag'ов API (см. summary_cache.py).
+# лежит в default, а не в кэше: её видят все воркеры и management-команды
+class DataVersion(models.Model):
+    # не внешний ключ: версия переживает удаление юзера при очистке
+    user_id = models.IntegerField(primary_key=True)
+    version = models.BigIntegerField()
+
+    def __str__(self):
+        return f"Data version of user {self.user_id}: {self.version}"
+
+    class Meta:
+        verbose_name = "Data Version"
+        verbose_name_plural = "Data Versions"
+
+
+# сбрасываем кэш сводок юзера после любой записи его данных
+@receiver(post_save, sender=UserProfile)
+@receiver(post_save, sender=Expense)
+@receiver(post_save, sender=Income)
+@receiver(post_save, sender=Budget)
+@receiver(post_save, sender=FinancialGoal)
+@receiver(post_delete, sender=UserProfile)
+@receiver(post_delete, sender=Expense)
+@receiver(post_delete, sender=Income)
+@receiver(post_delete, sender=Budget)
+@receiver(post_delete, sender=FinancialGoal)
+def invalidate_summary_cache(sender, instance, using=None, **kwargs):
+    user_id = instance.user_id
+    transaction.on_commit(lambda: bump_data_version(user_id), using=using)
+
+
+# где лежат данные юзера, если включено шардирование (см. accounts/routers.py)
+class UserShard(models.Model):
+    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='shard')
+    database = models.CharField(max_length=50)
+    # пока юзер переезжает между шардами, его записи отклоняются
+    locked = models.BooleanField(default=False)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.user} -> {self.database}"
+
+    class Meta:
+        verbose_name = "User Shard"
+        verbose_name_plural = "User Shards"
+
+
+class UserMoving(Exception):
+    pass
+
+
+# пока move_user_shard копирует строки юзера, запись потерялась бы на одной из сторон
+# или вернулась бы из копии. проверяется при каждой записи, а не только по методу запроса
+def refuse_writes_while_moving(user_id):
+    if shard_databases() and UserShard.objects.using('default').filter(user_id=user_id, locked=True).exists():
+        raise UserMoving(f'User {user_id} is being moved to another shard')
+
+
+# итоги пишутся вместе с операциями, их отдельно не проверяем
+@receiver(pre_save)
+@receiver(pre_delete)
+def refuse_sharded_writes_while_moving(sender, instance, raw=False, **kwargs):
+    if raw or sender._meta.app_label != 'accounts' or sender is MonthlyTotal:
+        return
+    if sender._meta.model_name in SHARDED_MODELS:
+        refuse_writes_while_moving(instance.user_id)
+
+
+# каскад при удалении юзера идёт только в его базе, данные в шарде удаляем отдельно
+@receiver(pre_delete, sender=User)
+def delete_sharded_user_data(sender, instance, using=None, **kwargs):
+    alias = UserShard.objects.using('default').filter(user_id=instance.pk).values_list('database', flat=True).first()
+    if alias and alias != using:
+        User.objects.using(alias).filter(pk=instance.pk).delete()
@@ -0,0 +1,79 @@
+from django.contrib.auth.models import User
+from django.db import connections, router, transaction
+from django.utils import timezone
+
+from .models import UserProfile, Expense, Income, Budget, FinancialGoal, MonthlyTotal, AccountPurge
+from .summary_cache import bump_data_version
+
+PURGE_CHUNK_SIZE = 5000
+
+# дочерние таблицы юзера, самые большие первыми
+PURGE_MODELS = [Expense, Income, MonthlyTotal, Budget, FinancialGoal, UserProfile]
+
+
+# запрос на удаление: деактивируем сразу (логин и сессии перестают работать), чистим потом
+def request_account_purge(user):
+    with transaction.atomic():
+        User.objects.filter(pk=user.pk).update(is_active=False)
+        purge, created = AccountPurge.objects.get_or_create(
+            user_id=user.pk, status=AccountPurge.PENDING, defaults={'username': user.username}
+        )
+    return purge
+
+
+# у юзера есть незавершённое удаление: старая ссылка активации снова валидна
+# (is_active опять False), но включать такой аккаунт нельзя
+def purge_requested(user_id):
+    return AccountPurge.objects.filter(user_id=user_id).exclude(status=AccountPurge.DONE).exists()
+
+
+class PurgeSkipped(Exception):
+    pass
+
+
+# удаление пачками по id: каждая пачка в своей короткой транзакции, другие писатели успевают между ними
+def _delete_in_chunks(model, user_id, chunk_size, progress):
+    using = router.db_for_write(model, user_id=user_id)
+    connection = connections[using]
+    table = connection.ops.quote_name(model._meta.db_table)
+    sql = f'DELETE FROM {table} WHERE id IN (SELECT id FROM {table} WHERE user_id = %s LIMIT %s)'
+    deleted = 0
+    while True:
+        with transaction.atomic(using=using), connection.cursor() as cursor:
+            cursor.execute(sql, [user_id, chunk_size])
+            count = cursor.rowcount
+        deleted += count
+        if count:
+            progress(model, count)
+        if count < chunk_size:
+            return deleted
+
+
+def purge_account(purge, chunk_size=PURGE_CHUNK_SIZE, progress=None):
+    user_id = purge.user_id
+    # аккаунт снова включили (админ или активация до этой проверки): его данные не трогаем
+    if User.objects.filter(pk=user_id, is_active=True).exists():
+        raise PurgeSkipped(f'User {user_id} is active again, history kept')
+
+    def report(model, count):
+        purge.rows_deleted += count
+        purge.save(update_fields=['rows_deleted', 'updated_at'])
+        if progress:
+            progress(purge, model, count)
+
+    # файл фото удаляем сами, сырой DELETE про хранилище не знает
+    profile = UserProfile.objects.db_manager(hints={'user_id': user_id}).filter(user_id=user_id).first()
+    if profile and profile.photo:
+        profile.photo.delete(save=False)
+
+    for model in PURGE_MODELS:
+        _delete_in_chunks(model, user_id, chunk_size, report)
+
+    # дочерние таблицы пустые, каскад коллектора теперь дешёвый
+    User.objects.filter(pk=user_id).delete()
+    bump_data_version(user_id)
+
+    purge.status = AccountPurge.DONE
+    purge.finished_at = timezone.now()
+    purge.save(update_fields=['status', 'finished_at', 'updated_at'])
+    return purge
@@ -0,0 +1,134 @@
+from django.conf import settings
+from django.contrib.auth.models import User
+from contextlib import contextmanager
+from contextvars import ContextVar
+import zlib
+
+_replica_reads = ContextVar('replica_reads', default=False)
+_pinned_to_primary = ContextVar('pinned_to_primary', default=False)
+# (user_id, alias) юзера, для которого сейчас обрабатывается запрос
+_bound_user = ContextVar('bound_user', default=None)
+
+# всё, что висит на одном юзере, живёт в его шарде
+SHARDED_MODELS = {'userprofile', 'expense', 'income', 'budget', 'financialgoal', 'monthlytotal'}
+
+
+# чтения внутри блока (сводки, отчёты) можно отдать реплике
+@contextmanager
+def replica_reads():
+    token = _replica_reads.set(True)
+    try:
+        yield
+    finally:
+        _replica_reads.reset(token)
+
+
+# после записи юзер читает только с основной базы, пока реплика не догонит
+@contextmanager
+def pinned_to_primary(pinned=True):
+    token = _pinned_to_primary.set(pinned)
+    try:
+        yield
+    finally:
+        _pinned_to_primary.reset(token)
+
+
+def primary_pinned():
+    return _pinned_to_primary.get()
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        alias = getattr(settings, 'REPLICA_DATABASE', None)
+        if alias and _replica_reads.get() and not _pinned_to_primary.get():
+            return alias
+        return 'default'
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return True
+
+
+def shard_databases():
+    return getattr(settings, 'SHARD_DATABASES', [])
+
+
+# первичное размещение по crc32(id), дальше решает таблица UserShard
+def initial_shard(user_id):
+    shards = shard_databases()
+    return shards[zlib.crc32(str(user_id).encode()) % len(shards)]
+
+
+def assign_shard(user_id):
+    from .models import UserShard
+
+    alias = initial_shard(user_id)
+    user = User.objects.using('default').filter(pk=user_id).first()
+    if user is None:
+        return alias
+    copy_user_stub(user, alias)
+    placement, created = UserShard.objects.using('default').get_or_create(user=user, defaults={'database': alias})
+    return placement.database
+
+
+# в шарде нужна строка auth_user, иначе не пройдут внешние ключи
+def copy_user_stub(user, alias):
+    if alias == 'default':
+        return
+    User.objects.using(alias).bulk_create([
+        User(pk=user.pk, username=user.username, password='!', date_joined=user.date_joined)
+    ], ignore_conflicts=True)
+
+
+def shard_for_user(user_id):
+    if not shard_databases():
+        return 'default'
+    bound = _bound_user.get()
+    if bound and bound[0] == user_id:
+        return bound[1]
+
+    from .models import UserShard
+    alias = UserShard.objects.using('default').filter(user_id=user_id).values_list('database', flat=True).first()
+    return alias or assign_shard(user_id)
+
+
+# запросы без подсказок (filter(user=...), bulk_create) уходят в шард этого юзера
+@contextmanager
+def user_database(user_id, alias=None):
+    # async-код узнаёт шард заранее через sync_to_async(shard_for_user)
+    alias = alias or shard_for_user(user_id)
+    token = _bound_user.set((user_id, alias))
+    try:
+        yield alias
+    finally:
+        _bound_user.reset(token)
+
+
+class ShardRouter:
+    def _db_for(self, model, hints):
+        if model._meta.app_label != 'accounts' or model._meta.model_name not in SHARDED_MODELS:
+            return None
+
+        user_id = hints.get('user_id')
+        instance = hints.get('instance')
+        if user_id is None and instance is not None:
+            user_id = instance.pk if isinstance(instance, User) else getattr(instance, 'user_id', None)
+        if user_id is not None:
+            return shard_for_user(user_id)
+
+        bound = _bound_user.get()
+        return bound[1] if bound else None
+
+    def db_for_read(self, model, **hints):
+        return self._db_for(model, hints)
+
+    def db_for_write(self, model, **hints):
+        return self._db_for(model, hints)
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
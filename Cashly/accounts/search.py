@@ -0,0 +1,163 @@
+from django.db import connections, router
+from django.db.models.expressions import RawSQL
+import re
+
+from .models import Expense, Income
+
+SEARCH_MODELS = {'expense': Expense, 'income': Income}
+SEARCH_MAX_RESULTS = 200
+
+WORD_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def fts_table(model):
+    return f'{model._meta.db_table}_fts'
+
+
+# FTS5 с внешним содержимым: текст лежит в самой таблице, индекс держат триггеры.
+# user_id тоже в индексе, чтобы поиск юзера пересекал списки документов, а не фильтровал все совпадения.
+# prefix='2 3' строит индексы префиксов для "ко*" и "кофе*" без перебора словаря
+def search_index_sql(model):
+    table = model._meta.db_table
+    fts = fts_table(model)
+    return [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5("
+        f"description, user_id, content='{table}', content_rowid='id', "
+        f"tokenize='unicode61 remove_diacritics 2', prefix='2 3')",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {table} BEGIN "
+        f"INSERT INTO {fts}(rowid, description, user_id) VALUES (new.id, new.description, new.user_id); END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {table} BEGIN "
+        f"INSERT INTO {fts}({fts}, rowid, description, user_id) VALUES ('delete', old.id, old.description, old.user_id); END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE OF description, user_id ON {table} BEGIN "
+        f"INSERT INTO {fts}({fts}, rowid, description, user_id) VALUES ('delete', old.id, old.description, old.user_id); "
+        f"INSERT INTO {fts}(rowid, description, user_id) VALUES (new.id, new.description, new.user_id); END",
+    ]
+
+
+def search_available(connection):
+    return connection.vendor == 'sqlite'
+
+
+SEARCH_TRIGGER_SUFFIXES = ('ai', 'ad', 'au')
+
+
+# триггеры создаются с IF NOT EXISTS: пересоздание таблицы в миграции sqlite их теряет,
+# после каждого migrate их возвращает restore_search_triggers (accounts/db.py)
+def create_search_index(connection):
+    if not search_available(connection):
+        return
+    with connection.cursor() as cursor:
+        for model in SEARCH_MODELS.values():
+            for sql in search_index_sql(model):
+                cursor.execute(sql)
+
+
+def drop_search_index(connection):
+    if not search_available(connection):
+        return
+    with connection.cursor() as cursor:
+        for model in SEARCH_MODELS.values():
+            fts = fts_table(model)
+            for suffix in SEARCH_TRIGGER_SUFFIXES:
+                cursor.execute(f'DROP TRIGGER IF EXISTS {fts}_{suffix}')
+            cursor.execute(f'DROP TABLE IF EXISTS {fts}')
+
+
+def missing_search_objects(connection):
+    expected = []
+    for model in SEARCH_MODELS.values():
+        fts = fts_table(model)
+        expected += [fts] + [f'{fts}_{suffix}' for suffix in SEARCH_TRIGGER_SUFFIXES]
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT name FROM sqlite_master WHERE name IN ({', '.join(['%s'] * len(expected))})", expected
+        )
+        existing = {name for name, in cursor.fetchall()}
+    return [name for name in expected if name not in existing]
+
+
+# пропавшие триггеры создаются заново, а индекс перестраивается: пока их не было,
+# таблица могла меняться мимо него. Возвращает, чего не хватало
+def ensure_search_index(connection):
+    if not search_available(connection):
+        return []
+    missing = missing_search_objects(connection)
+    if missing:
+        create_search_index(connection)
+        rebuild_search_index(connection)
+    return missing
+
+
+def rebuild_search_index(connection, optimize=False):
+    with connection.cursor() as cursor:
+        for model in SEARCH_MODELS.values():
+            fts = fts_table(model)
+            cursor.execute(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')")
+            if optimize:
+                cursor.execute(f"INSERT INTO {fts}({fts}) VALUES ('optimize')")
+
+
+# ввод юзера -> запрос FTS5: каждое слово в кавычках (без операторов) и с префиксом, все слова обязательны
+def fts_query(text, user_id=None):
+    words = WORD_RE.findall(text or '')
+    if not words:
+        return None
+    query = 'description : (' + ' '.join(f'"{word}"*' for word in words) + ')'
+    if user_id is not None:
+        query = f'user_id : "{user_id}" AND {query}'
+    return query
+
+
+# подзапрос id совпадений для фильтра queryset'а, без выгрузки списка в питон
+def matching_ids(model, text):
+    query = fts_query(text)
+    if query is None:
+        return None
+    fts = fts_table(model)
+    return RawSQL(f'SELECT rowid FROM {fts} WHERE {fts} MATCH %s', [query])
+
+
+# поиск по операциям юзера: [(kind, id)] по релевантности, расходы и доходы вперемешку
+def search_transaction_ids(user, text, limit=SEARCH_MAX_RESULTS):
+    using = router.db_for_read(Expense, user_id=user.pk)
+    connection = connections[using]
+    if not search_available(connection):
+        # без FTS5 остаётся обычный LIKE, без ранжирования
+        ranked = []
+        for kind, model in SEARCH_MODELS.items():
+            ids = model.objects.using(using).filter(
+                user=user, description__icontains=text.strip()
+            ).order_by('-date', '-id').values_list('id', flat=True)[:limit]
+            ranked.extend((kind, pk) for pk in ids)
+        return ranked[:limit]
+
+    query = fts_query(text, user.pk)
+    if query is None:
+        return []
+    # bm25 считает только по description, вес user_id нулевой
+    parts = [
+        f"SELECT '{kind}', rowid, bm25({fts_table(model)}, 1.0, 0.0) AS score "
+        f"FROM {fts_table(model)} WHERE {fts_table(model)} MATCH %s"
+        for kind, model in SEARCH_MODELS.items()
+    ]
+    sql = ' UNION ALL '.join(parts) + ' ORDER BY score, 2 DESC LIMIT %s'
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [query] * len(parts) + [limit])
+        return [(kind, pk) for kind, pk, score in cursor.fetchall()]
+
+
+def search_transactions(user, text, limit=SEARCH_MAX_RESULTS):
+    ranked = search_transaction_ids(user, text, limit)
+    rows = {}
+    for kind, model in SEARCH_MODELS.items():
+        ids = [pk for row_kind, pk in ranked if row_kind == kind]
+        if ids:
+            for entry in model.objects.db_manager(hints={'user_id': user.pk}).filter(user=user, id__in=ids):
+                rows[(kind, entry.pk)] = entry
+    entries = []
+    for key in ranked:
+        entry = rows.get(key)
+        if entry is not None:
+            entry.kind = key[0]
+            entries.append(entry)
+    return entries
@@ -0,0 +1,527 @@
+from django.db import connections, router, transaction
+from django.db.models import Sum, Count, Q
+from django.db.models.functions import TruncMonth
+from django.utils.functional import cached_property
+from datetime import datetime, date
+from decimal import Decimal
+from collections import defaultdict
+import heapq
+
+from .models import (
+    Expense, Income, Budget, FinancialGoal, MonthlyTotal, get_profile,
+    refuse_writes_while_moving, rollup_entry, transaction_fingerprint,
+)
+from .routers import shard_databases
+from .summary_cache import bump_data_version
+
+
+# прогресс по лимитам категорий: траты за месяц одним GROUP BY
+def get_budget_categories(user, month_start, budgets=None):
+    if budgets is None:
+        budgets = Budget.objects.filter(user=user, month__gte=month_start)
+    budgets = list(budgets)
+    if not budgets:
+        return []
+
+    spent_by_category = dict(
+        Expense.objects.filter(
+            user=user,
+            category__in={budget.category for budget in budgets},
+            date__gte=month_start
+        ).order_by().values('category').annotate(total=Sum('amount')).values_list('category', 'total')
+    )
+
+    budget_categories = []
+    for budget in budgets:
+        spent = spent_by_category.get(budget.category) or Decimal('0')
+        budget_categories.append({
+            'name': budget.category,
+            'limit': budget.limit,
+            'spent': spent,
+            'is_over': spent > budget.limit,
+            'percent': min(int((spent / budget.limit) * 100) if budget.limit > 0 else 0, 100)
+        })
+    return budget_categories
+
+
+# для bulk-операций, где сигналы не срабатывают: одно обновление на группу
+def apply_to_monthly_totals(entries, sign=1):
+    groups = defaultdict(lambda: [Decimal('0'), 0])
+    for entry in entries:
+        user_id, day, kind, category, amount = rollup_entry(entry)
+        group = groups[(user_id, day.replace(day=1), kind, category)]
+        group[0] += amount
+        group[1] += 1
+
+    for (user_id, year_month, kind, category), (total, count) in groups.items():
+        MonthlyTotal.apply(user_id, year_month, kind, category, sign * total, count=sign * count)
+
+
+BULK_BATCH_SIZE = 1000
+
+
+# пачка разобранных операций (kind, day, description, category, amount) одной транзакцией:
+# bulk_create, итоги и версия кэша обновляются один раз на всю пачку
+def bulk_create_transactions(user, entries):
+    objects = []
+    for kind, day, description, category, amount in entries:
+        model, field = (Expense, 'category') if kind == 'expense' else (Income, 'source')
+        objects.append(model(
+            user=user, description=description, amount=amount, date=day,
+            fingerprint=transaction_fingerprint(day, amount, description), **{field: category}
+        ))
+    if not objects:
+        return objects
+
+    refuse_writes_while_moving(user.pk)
+    using = router.db_for_write(Expense, user_id=user.pk)
+    with transaction.atomic(using=using):
+        Expense.objects.using(using).bulk_create(
+            [entry for entry in objects if isinstance(entry, Expense)], batch_size=BULK_BATCH_SIZE
+        )
+        Income.objects.using(using).bulk_create(
+            [entry for entry in objects if isinstance(entry, Income)], batch_size=BULK_BATCH_SIZE
+        )
+        apply_to_monthly_totals(objects)
+        transaction.on_commit(lambda: bump_data_version(user.pk), using=using)
+    return objects
+
+
+# пересчёт помесячных итогов по сырым операциям
+def rebuild_monthly_totals(user=None):
+    if user is not None:
+        databases = [router.db_for_write(MonthlyTotal, user_id=user.pk)]
+    else:
+        databases = ['default'] + shard_databases()
+
+    created = updated = deleted = 0
+    for using in databases:
+        counts = _rebuild_monthly_totals(using, user)
+        created, updated, deleted = created + counts[0], updated + counts[1], deleted + counts[2]
+    return created, updated, deleted
+
+
+def _rebuild_monthly_totals(using, user):
+    expected = {}
+    for model, kind, field in ((Expense, MonthlyTotal.EXPENSE, 'category'), (Income, MonthlyTotal.INCOME, 'source')):
+        rows = model.objects.using(using)
+        rows = rows.all() if user is None else rows.filter(user=user)
+        rows = rows.order_by().annotate(year_month=TruncMonth('date')).values('user', 'year_month', field).annotate(
+            total=Sum('amount'), count=Count('id')
+        )
+        for row in rows:
+            expected[(row['user'], row['year_month'], kind, row[field])] = (row['total'], row['count'])
+
+    existing = MonthlyTotal.objects.using(using)
+    existing = existing.all() if user is None else existing.filter(user=user)
+    created = updated = deleted = 0
+    changed = set()
+    with transaction.atomic(using=using):
+        for rollup in existing.select_for_update():
+            key = (rollup.user_id, rollup.year_month, rollup.kind, rollup.category)
+            if key not in expected:
+                rollup.delete()
+                deleted += 1
+                changed.add(rollup.user_id)
+                continue
+            total, count = expected.pop(key)
+            if rollup.total != total or rollup.count != count:
+                rollup.total, rollup.count = total, count
+                rollup.save(update_fields=['total', 'count'])
+                updated += 1
+                changed.add(rollup.user_id)
+
+        MonthlyTotal.objects.using(using).bulk_create([
+            MonthlyTotal(user_id=user_id, year_month=year_month, kind=kind, category=category, total=total, count=count)
+            for (user_id, year_month, kind, category), (total, count) in expected.items()
+        ], batch_size=1000)
+        created = len(expected)
+        changed.update(key[0] for key in expected)
+
+        # исправленные итоги не видны, пока в кэше лежат сводки по старым
+        for user_id in changed:
+            transaction.on_commit(lambda user_id=user_id: bump_data_version(user_id), using=using)
+    return created, updated, deleted
+
+
+LEDGER_PAGE_SIZE = 50
+
+# порядок в общей ленте: дата, потом тип, потом id (всё по убыванию)
+LEDGER_KINDS = {'expense': 0, 'income': 1}
+
+
+def encode_ledger_cursor(entry):
+    return f'{entry.date.isoformat()}_{entry.kind}_{entry.pk}'
+
+
+def decode_ledger_cursor(cursor):
+    try:
+        day, kind, pk = cursor.split('_')
+        if kind not in LEDGER_KINDS:
+            return None
+        return date.fromisoformat(day), kind, int(pk)
+    except (AttributeError, ValueError):
+        return None
+
+
+def _ledger_after(kind, cursor):
+    day, cursor_kind, pk = cursor
+    rank, cursor_rank = LEDGER_KINDS[kind], LEDGER_KINDS[cursor_kind]
+    if rank < cursor_rank:
+        return Q(date__lte=day)
+    if rank > cursor_rank:
+        return Q(date__lt=day)
+    # внешнее date <= day даёт индексу диапазон для поиска
+    return Q(date__lte=day) & (Q(date__lt=day) | Q(id__lt=pk))
+
+
+# таблицы ленты с фильтрами: категория оставляет только расходы, источник только доходы
+def ledger_querysets(user, category=None, source=None, date_from=None, date_to=None):
+    tables = []
+    if not source or category:
+        expenses = Expense.objects.filter(user=user)
+        if category:
+            expenses = expenses.filter(category=category)
+        tables.append(('expense', expenses))
+    if not category or source:
+        incomes = Income.objects.filter(user=user)
+        if source:
+            incomes = incomes.filter(source=source)
+        tables.append(('income', incomes))
+
+    for i, (kind, qs) in enumerate(tables):
+        if date_from:
+            qs = qs.filter(date__gte=date_from)
+        if date_to:
+            qs = qs.filter(date__lte=date_to)
+        tables[i] = (kind, qs)
+    return tables
+
+
+# остаток после каждой строки страницы, {(kind, id): Decimal}: доходы в плюс, расходы в минус.
+# всё до месяца самой старой строки берётся из помесячных итогов, дальше нарастающий
+# SUM() OVER по UNION ALL обеих таблиц считает база — от начала того месяца до самой новой строки.
+# фильтры ленты на остаток не влияют, это остаток по всем операциям
+def ledger_balances(user, entries):
+    if not entries:
+        return {}
+    start = min(entry.date for entry in entries).replace(day=1)
+    end = max(entry.date for entry in entries)
+
+    before = MonthlyTotal.objects.filter(user=user, year_month__lt=start).aggregate(
+        income=Sum('total', filter=Q(kind=MonthlyTotal.INCOME)),
+        expense=Sum('total', filter=Q(kind=MonthlyTotal.EXPENSE)),
+    )
+    opening = (before['income'] or 0) - (before['expense'] or 0)
+
+    connection = connections[router.db_for_read(Expense, user_id=user.pk)]
+    ops = connection.ops
+    bounds = [user.pk, ops.adapt_datefield_value(start), ops.adapt_datefield_value(end)]
+    parts, wanted, params, ids_params = [], [], [], []
+    for kind, model, sign in (('expense', Expense, '-'), ('income', Income, '')):
+        parts.append(
+            f"SELECT '{kind}' AS kind, {LEDGER_KINDS[kind]} AS kind_rank, id, date, {sign}amount AS amount "
+            f"FROM {ops.quote_name(model._meta.db_table)} WHERE user_id = %s AND date >= %s AND date <= %s"
+        )
+        params.extend(bounds)
+        ids = [entry.pk for entry in entries if entry.kind == kind]
+        if ids:
+            wanted.append(f"(kind = '{kind}' AND id IN ({', '.join(['%s'] * len(ids))}))")
+            ids_params.extend(ids)
+    # порядок окна тот же, что у ленты, только по возрастанию
+    sql = (
+        'SELECT kind, id, balance FROM ('
+        'SELECT kind, id, SUM(amount) OVER (ORDER BY date, kind_rank, id ROWS UNBOUNDED PRECEDING) AS balance '
+        f"FROM ({' UNION ALL '.join(parts)}) AS entries"
+        f") AS running WHERE {' OR '.join(wanted)}"
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params + ids_params)
+        return {
+            (kind, pk): opening + Decimal(int(balance)).scaleb(-2)
+            for kind, pk, balance in cursor.fetchall()
+        }
+
+
+# лента всех операций с keyset-пагинацией по (date, id) вместо OFFSET.
+# with_balance: у каждой строки ещё и остаток после неё (entry.balance)
+def get_ledger_page(user, after=None, limit=LEDGER_PAGE_SIZE, category=None, source=None,
+                    date_from=None, date_to=None, with_balance=False):
+    cursor = decode_ledger_cursor(after) if after else None
+    tables = ledger_querysets(user, category, source, date_from, date_to)
+
+    streams = []
+    for kind, qs in tables:
+        if cursor:
+            qs = qs.filter(_ledger_after(kind, cursor))
+        rows = list(qs.order_by('-date', '-id')[:limit + 1])
+        for row in rows:
+            row.kind = kind
+        streams.append(rows)
+
+    def sort_key(entry):
+        return (entry.date, LEDGER_KINDS[entry.kind], entry.pk)
+
+    merged = list(heapq.merge(*streams, key=sort_key, reverse=True))
+    entries = merged[:limit]
+    next_cursor = encode_ledger_cursor(entries[-1]) if len(merged) > limit else None
+    if with_balance:
+        balances = ledger_balances(user, entries)
+        for entry in entries:
+            entry.balance = balances[(entry.kind, entry.pk)]
+    return entries, next_cursor
+
+
+# выбранные операции: [('expense', qs), ('income', qs)], всегда в пределах юзера
+def select_transactions(user, ids=None, **filters):
+    if ids is None:
+        return ledger_querysets(user, **filters)
+    return [
+        (kind, model.objects.filter(user=user, id__in=ids[kind]))
+        for kind, model in (('expense', Expense), ('income', Income))
+        if ids.get(kind)
+    ]
+
+
+# суммы по (месяц, категория) для поправки помесячных итогов одним запросом
+def _rollup_groups(kind, qs):
+    field = 'category' if kind == 'expense' else 'source'
+    rows = qs.order_by().annotate(year_month=TruncMonth('date')).values('year_month', field).annotate(
+        total=Sum('amount'), count=Count('id')
+    )
+    return [(row['year_month'], row[field], row['total'], row['count']) for row in rows]
+
+
+def _rollup_kind(kind):
+    return MonthlyTotal.EXPENSE if kind == 'expense' else MonthlyTotal.INCOME
+
+
+# массовое удаление: один DELETE на таблицу, итоги и версия кэша правятся раз на пачку
+def bulk_delete_transactions(user, selection):
+    refuse_writes_while_moving(user.pk)
+    using = router.db_for_write(Expense, user_id=user.pk)
+    counts = {'expense': 0, 'income': 0}
+    with transaction.atomic(using=using):
+        for kind, qs in selection:
+            qs = qs.using(using)
+            groups = _rollup_groups(kind, qs)
+            # _raw_delete не поднимает строки и не шлёт post_delete на каждую
+            counts[kind] = qs._raw_delete(using)
+            for year_month, category, total, count in groups:
+                MonthlyTotal.apply(user.pk, year_month, _rollup_kind(kind), category, -total, count=-count)
+        if any(counts.values()):
+            # группы, из которых ушли все строки
+            MonthlyTotal.objects.using(using).filter(user=user, count__lte=0).delete()
+            transaction.on_commit(lambda: bump_data_version(user.pk), using=using)
+    return counts
+
+
+# массовая смена категории расходов и/или источника доходов одним UPDATE
+def bulk_recategorize_transactions(user, selection, category=None, source=None):
+    refuse_writes_while_moving(user.pk)
+    using = router.db_for_write(Expense, user_id=user.pk)
+    counts = {'expense': 0, 'income': 0}
+    with transaction.atomic(using=using):
+        for kind, qs in selection:
+            field, value = ('category', category) if kind == 'expense' else ('source', source)
+            if not value:
+                continue
+            qs = qs.using(using).exclude(**{field: value})
+            groups = _rollup_groups(kind, qs)
+            counts[kind] = qs.update(**{field: value})
+
+            moved = defaultdict(lambda: [Decimal('0'), 0])
+            for year_month, old_value, total, count in groups:
+                MonthlyTotal.apply(user.pk, year_month, _rollup_kind(kind), old_value, -total, count=-count)
+                moved[year_month][0] += total
+                moved[year_month][1] += count
+            for year_month, (total, count) in moved.items():
+                MonthlyTotal.apply(user.pk, year_month, _rollup_kind(kind), value, total, count=count)
+        if any(counts.values()):
+            # группы, из которых ушли все строки
+            MonthlyTotal.objects.using(using).filter(user=user, count__lte=0).delete()
+            transaction.on_commit(lambda: bump_data_version(user.pk), using=using)
+    return counts
+
+
+# сводка по финансам юзера: один агрегирующий запрос на таблицу
+class FinanceSummary:
+    def __init__(self, user, today=None):
+        self.user = user
+        today = today or datetime.now().date()
+        self.month_start = today.replace(day=1)
+
+    @cached_property
+    def budgets(self):
+        return list(Budget.objects.filter(user=self.user, month__gte=self.month_start))
+
+    @cached_property
+    def _totals(self):
+        # читаем из помесячных итогов, а не из всей истории операций
+        expense = Q(kind=MonthlyTotal.EXPENSE)
+        income = Q(kind=MonthlyTotal.INCOME)
+        this_month = Q(year_month__gte=self.month_start)
+        return MonthlyTotal.objects.filter(user=self.user).aggregate(
+            monthly_spent=Sum('total', filter=expense & this_month),
+            lifetime_spent=Sum('total', filter=expense),
+            monthly_income=Sum('total', filter=income & this_month),
+            lifetime_income=Sum('total', filter=income),
+        )
+
+    @cached_property
+    def _goal_totals(self):
+        return FinancialGoal.objects.filter(user=self.user).aggregate(
+            count=Count('id'),
+            saved=Sum('saved'),
+        )
+
+    @property
+    def monthly_spent(self):
+        return self._totals['monthly_spent'] or Decimal('0')
+
+    @property
+    def lifetime_spent(self):
+        return self._totals['lifetime_spent'] or Decimal('0')
+
+    @property
+    def monthly_income(self):
+        return self._totals['monthly_income'] or Decimal('0')
+
+    @property
+    def lifetime_income(self):
+        return self._totals['lifetime_income'] or Decimal('0')
+
+    @property
+    def goals_count(self):
+        return self._goal_totals['count']
+
+    @property
+    def goals_saved(self):
+        return self._goal_totals['saved'] or 0
+
+    @property
+    def total_budget(self):
+        return sum((budget.limit for budget in self.budgets), Decimal('0'))
+
+    @cached_property
+    def budget_categories(self):
+        return get_budget_categories(self.user, self.month_start, budgets=self.budgets)
+
+
+# контексты страниц со сводкой, кэшируются целиком
+def build_dashboard_context(user):
+    profile = get_profile(user)
+    summary = FinanceSummary(user)
+    
+    # последние расходы
+    expense_list = list(Expense.objects.filter(user=user).order_by('-date')[:10])
+    income_list = list(Income.objects.filter(user=user).order_by('-date')[:10])
+    
+    monthly_budget = profile.monthly_budget or Decimal('0')
+    portfolio_value = monthly_budget - summary.monthly_spent
+    
+    total_expenses = sum((exp.amount for exp in expense_list), Decimal('0'))
+    total_income = sum((inc.amount for inc in income_list), Decimal('0'))
+    
+    context = {
+        'investments_count': summary.goals_count,
+        'portfolio_value': portfolio_value,
+        'expense_list': expense_list,
+        'income_list': income_list,
+        'total_expenses': total_expenses,
+        'total_income': total_income,
+        'monthly_income': summary.monthly_income,
+        'budget_categories': summary.budget_categories,
+    }
+    return context
+
+
+def build_profile_context(user):
+    profile = get_profile(user)
+    summary = FinanceSummary(user)
+    
+    expense_list = list(Expense.objects.filter(user=user).order_by('-date')[:10])
+    income_list = list(Income.objects.filter(user=user).order_by('-date')[:10])
+    
+    budget_categories = summary.budget_categories
+    total_budget = summary.total_budget
+    spent_total = sum((cat['spent'] for cat in budget_categories), Decimal('0'))
+    remaining_total = total_budget - spent_total
+    total_budget_percent = int((spent_total / total_budget) * 100) if total_budget > 0 else 0
+    
+    # счётчик и сумма целей — по уже загруженному списку, без отдельного агрегата
+    goals = list(FinancialGoal.objects.filter(user=user))
+    goals_saved = sum((goal.saved for goal in goals), Decimal('0'))
+    
+    monthly_budget = profile.monthly_budget or Decimal('0')
+    lifetime_budget = profile.lifetime_budget or Decimal('0')
+
+    monthly_spent = summary.monthly_spent
+    monthly_income = summary.monthly_income
+    lifetime_spent = summary.lifetime_spent
+    lifetime_income = summary.lifetime_income
+
+    monthly_percent = int((monthly_spent / monthly_budget) * 100) if monthly_budget > 0 else 0
+    lifetime_percent = int((lifetime_spent / lifetime_budget) * 100) if lifetime_budget > 0 else 0
+
+    monthly_remaining = monthly_budget - monthly_spent + monthly_income
+    lifetime_remaining = lifetime_budget - lifetime_spent + lifetime_income
+    
+    monthly_net = monthly_income - monthly_spent
+    
+    context = {
+        'investments_count': len(goals),
+        'portfolio_value': goals_saved,
+        'expense_list': expense_list,
+        'income_list': income_list,
+        'budget_categories': budget_categories,
+        'total_budget': total_budget,
+        'spent_total': spent_total,
+        'remaining_total': remaining_total,
+        'total_budget_percent': total_budget_percent,
+        'goals': goals,
+        'monthly_budget': monthly_budget,
+        'monthly_spent': monthly_spent,
+        'monthly_income': monthly_income,
+        'monthly_net': monthly_net,
+        'monthly_percent': monthly_percent,
+        'monthly_remaining': monthly_remaining,
+        'lifetime_budget': lifetime_budget,
+        'lifetime_spent': lifetime_spent,
+        'lifetime_income': lifetime_income,
+        'lifetime_percent': lifetime_percent,
+        'lifetime_remaining': lifetime_remaining,
+    }
+    return context
+
+
+def build_goals_context(user):
+    goals = list(FinancialGoal.objects.filter(user=user))
+    summary = FinanceSummary(user)
+    
+    monthly_net = summary.monthly_income - summary.monthly_spent
+    
+    context = {
+        'goals': goals,
+        'monthly_net': monthly_net,
+    }
+    return context
+
+
+# сводка для /api/summary/: те же числа, что на главной и в профиле
+def build_api_summary(user):
+    profile = get_profile(user)
+    summary = FinanceSummary(user)
+    return {
+        'month': summary.month_start,
+        'monthly_budget': profile.monthly_budget,
+        'lifetime_budget': profile.lifetime_budget,
+        'monthly_spent': summary.monthly_spent,
+        'monthly_income': summary.monthly_income,
+        'lifetime_spent': summary.lifetime_spent,
+        'lifetime_income': summary.lifetime_income,
+        'goals_count': summary.goals_count,
+        'goals_saved': summary.goals_saved,
+        'total_budget': summary.total_budget,
+        'budget_categories': summary.budget_categories,
+    }
@@ -0,0 +1,115 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DatabaseError
+from django.db.models import F
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+import time
+
+from .routers import pinned_to_primary, primary_pinned, replica_reads
+
+SUMMARY_TIMEOUT = 60 * 60
+STATS_KEYS = {'hits': 'summary:stats:hits', 'misses': 'summary:stats:misses'}
+_bumped_users = ContextVar('bumped_users', default=None)
+
+
+def _new_version():
+    # после потери строки версия не должна совпасть со старыми записями кэша
+    return int(time.time() * 1000)
+
+
+def _versions():
+    from .models import DataVersion
+
+    # только основная база: версия с отстающей реплики открыла бы старые записи
+    return DataVersion.objects.using('default')
+
+
+def get_data_version(user_id):
+    from .models import DataVersion
+
+    version = _versions().filter(user_id=user_id).values_list('version', flat=True).first()
+    if version is None:
+        _versions().bulk_create([DataVersion(user_id=user_id, version=_new_version())], ignore_conflicts=True)
+        version = _versions().filter(user_id=user_id).values_list('version', flat=True).first()
+    return version
+
+
+# любая запись юзера делает все его закэшированные сводки неактуальными
+def bump_data_version(user_id):
+    from .models import DataVersion
+
+    bumped = _bumped_users.get()
+    if bumped is not None:
+        bumped.add(user_id)
+    if not _versions().filter(user_id=user_id).update(version=F('version') + 1):
+        _versions().bulk_create([DataVersion(user_id=user_id, version=_new_version())], ignore_conflicts=True)
+
+
+# какие юзеры записали данные внутри блока (ReplicaPinMiddleware); множество общее
+# для потоков sync_to_async, on_commit-колбэки видят тот же объект
+@contextmanager
+def recording_bumps():
+    bumped = set()
+    token = _bumped_users.set(bumped)
+    try:
+        yield bumped
+    finally:
+        _bumped_users.reset(token)
+
+
+def _count(stat):
+    key = STATS_KEYS[stat]
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, 0, None)
+        cache.incr(key)
+
+
+def get_cache_stats():
+    return {stat: cache.get(key) or 0 for stat, key in STATS_KEYS.items()}
+
+
+def reset_cache_stats():
+    cache.delete_many(list(STATS_KEYS.values()))
+
+
+def _summary_key(name, user_id, version):
+    today = datetime.now().date()
+    return f'summary:{name}:{user_id}:{version}:{today.isoformat()}'
+
+
+# снапшот реплики — копия default вместе с таблицей версий: если версия юзера в нём та же,
+# что в основной базе, в снапшоте уже есть все его записи
+def replica_is_current(user_id, version):
+    alias = getattr(settings, 'REPLICA_DATABASE', None)
+    if not alias or primary_pinned():
+        return False
+    from .models import DataVersion
+
+    try:
+        replica_version = DataVersion.objects.using(alias).filter(user_id=user_id).values_list('version', flat=True).first()
+    except DatabaseError:
+        # снапшот старше таблицы версий
+        return False
+    return replica_version == version
+
+
+# контекст страницы по ключу (страница, юзер, версия данных, день).
+# тяжёлые агрегаты читаются с реплики, если она догнала версию юзера, иначе с основной базы:
+# снапшот отстающей реплики лёг бы под свежую версию и отдавался бы час
+def cached_summary(name, user, build):
+    version = get_data_version(user.pk)
+    key = _summary_key(name, user.pk, version)
+    context = cache.get(key)
+    if context is not None:
+        _count('hits')
+        return context
+
+    _count('misses')
+    with replica_reads(), pinned_to_primary(not replica_is_current(user.pk, version)):
+        context = build()
+    cache.set(key, context, SUMMARY_TIMEOUT)
+    return context
@@ -1,3 +1,1227 @@
-from django.test import TestCase
+from asgiref.sync import async_to_sync, iscoroutinefunction
+from django.test import AsyncRequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.db import connection, connections, transaction
+from django.db.models import Sum
+from django.core import mail
+from django.core.mail.backends.base import BaseEmailBackend
+from django.core.management import call_command
+from django.conf import settings
+from django.core.cache import cache
+from django.core.handlers.asgi import ASGIHandler
+from django.urls import resolve, reverse
+from django.utils import timezone
+from django.utils.encoding import force_bytes
+from django.utils.http import urlsafe_base64_encode
+from django.core.files.uploadedfile import SimpleUploadedFile
+import asyncio
+import io
+import json
+import smtplib
+import tempfile
+from unittest import mock
+from django.contrib.auth.models import User
+from datetime import date, datetime, timezone as dt_timezone
+from decimal import Decimal
 
-# Create your tests here.
+from .models import (
+    Expense, Income, Budget, FinancialGoal, MonthlyTotal, OutboundEmail, UserProfile, UserShard, AccountPurge, UserMoving,
+    DataVersion,
+)
+from .services import (
+    get_budget_categories, rebuild_monthly_totals, FinanceSummary, get_ledger_page,
+    bulk_delete_transactions, select_transactions,
+    build_profile_context,
+)
+from .summary_cache import cached_summary, get_cache_stats, get_data_version
+from .importer import import_transactions
+from .metrics import registry
+from .routers import (
+    ReplicaRouter, ShardRouter, replica_reads, pinned_to_primary, user_database, initial_shard,
+)
+from .search import missing_search_objects, search_transaction_ids
+from .management.commands.migrate_shards import SHARD_ID_SPACING
+from .management.commands.send_outbound_emails import Command as SendOutboundEmailsCommand
+from .middleware import ReplicaPinMiddleware, ShardMiddleware
+from .purge import request_account_purge
+from .views import export_transactions_view
+from .tokens import email_verification_token
+
+
+class MoneyFieldTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('ivan', password='secret')
+
+    def test_amounts_are_stored_as_cents(self):
+        Expense.objects.create(user=self.user, description='a', category='Food', amount='12.34', date=date(2026, 1, 5))
+        Expense.objects.create(user=self.user, description='b', category='Food', amount=Decimal('0.1'), date=date(2026, 1, 6))
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT amount FROM accounts_expense ORDER BY id')
+            self.assertEqual([row[0] for row in cursor.fetchall()], [1234, 10])
+
+        self.assertEqual(Expense.objects.get(description='a').amount, Decimal('12.34'))
+        self.assertEqual(Expense.objects.aggregate(total=Sum('amount'))['total'], Decimal('12.44'))
+        self.assertEqual(Expense.objects.filter(amount__gt=Decimal('0.10')).count(), 1)
+        total = MonthlyTotal.objects.get(user=self.user)
+        self.assertEqual((total.total, total.count), (Decimal('12.44'), 2))
+
+
+class BudgetCategoriesTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('alice', password='secret')
+        self.month_start = date.today().replace(day=1)
+
+    def add_budgets(self, count):
+        offset = Budget.objects.filter(user=self.user).count()
+        for i in range(offset, offset + count):
+            category = f'Category{i}'
+            Budget.objects.create(user=self.user, category=category, limit=Decimal('100'), month=self.month_start)
+            Expense.objects.create(
+                user=self.user, description='x', category=category,
+                amount=Decimal('40'), date=self.month_start
+            )
+
+    def test_spent_is_matched_to_budgets(self):
+        Budget.objects.create(user=self.user, category='Food', limit=Decimal('50'), month=self.month_start)
+        Budget.objects.create(user=self.user, category='Games', limit=Decimal('0'), month=self.month_start)
+        Expense.objects.create(user=self.user, description='a', category='Food', amount=Decimal('30'), date=self.month_start)
+        Expense.objects.create(user=self.user, description='b', category='Food', amount=Decimal('30'), date=self.month_start)
+
+        categories = {c['name']: c for c in get_budget_categories(self.user, self.month_start)}
+
+        self.assertEqual(categories['Food']['spent'], Decimal('60'))
+        self.assertTrue(categories['Food']['is_over'])
+        self.assertEqual(categories['Food']['percent'], 100)
+        self.assertEqual(categories['Games']['spent'], Decimal('0'))
+        self.assertEqual(categories['Games']['percent'], 0)
+
+    def test_query_count_is_constant(self):
+        self.add_budgets(2)
+        with self.assertNumQueries(2):
+            self.assertEqual(len(get_budget_categories(self.user, self.month_start)), 2)
+
+        self.add_budgets(30)
+        with self.assertNumQueries(2):
+            self.assertEqual(len(get_budget_categories(self.user, self.month_start)), 32)
+
+
+class MonthlyTotalTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('bob', password='secret')
+        self.day = date.today().replace(day=1)
+
+    def rollup(self, kind, category):
+        return MonthlyTotal.objects.filter(user=self.user, kind=kind, category=category).first()
+
+    def test_rollup_follows_create_edit_delete(self):
+        expense = Expense.objects.create(
+            user=self.user, description='a', category='Food', amount='12.50', date=self.day.isoformat()
+        )
+        Expense.objects.create(user=self.user, description='b', category='Food', amount=Decimal('7.50'), date=self.day)
+        self.assertEqual(self.rollup(MonthlyTotal.EXPENSE, 'Food').total, Decimal('20'))
+        self.assertEqual(self.rollup(MonthlyTotal.EXPENSE, 'Food').count, 2)
+
+        expense = Expense.objects.get(pk=expense.pk)
+        expense.category = 'Games'
+        expense.save()
+        self.assertEqual(self.rollup(MonthlyTotal.EXPENSE, 'Food').total, Decimal('7.50'))
+        self.assertEqual(self.rollup(MonthlyTotal.EXPENSE, 'Games').total, Decimal('12.50'))
+
+        expense.delete()
+        self.assertEqual(self.rollup(MonthlyTotal.EXPENSE, 'Games').total, Decimal('0'))
+        self.assertEqual(self.rollup(MonthlyTotal.EXPENSE, 'Games').count, 0)
+
+    def test_summary_reads_rollups(self):
+        Expense.objects.create(user=self.user, description='a', category='Food', amount=Decimal('30'), date=self.day)
+        Expense.objects.create(user=self.user, description='b', category='Food', amount=Decimal('5'), date=date(2020, 1, 5))
+        Income.objects.create(user=self.user, description='c', source='Salary', amount=Decimal('100'), date=self.day)
+
+        summary = FinanceSummary(self.user)
+        with self.assertNumQueries(1):
+            self.assertEqual(summary.monthly_spent, Decimal('30'))
+            self.assertEqual(summary.lifetime_spent, Decimal('35'))
+            self.assertEqual(summary.monthly_income, Decimal('100'))
+            self.assertEqual(summary.lifetime_income, Decimal('100'))
+
+    def test_rebuild_reconciles_drift(self):
+        Expense.objects.create(user=self.user, description='a', category='Food', amount=Decimal('30'), date=self.day)
+        Income.objects.create(user=self.user, description='c', source='Salary', amount=Decimal('100'), date=self.day)
+        MonthlyTotal.objects.filter(kind=MonthlyTotal.EXPENSE).update(total=Decimal('999'))
+        MonthlyTotal.objects.filter(kind=MonthlyTotal.INCOME).delete()
+        MonthlyTotal.objects.create(
+            user=self.user, year_month=date(2019, 1, 1), kind=MonthlyTotal.EXPENSE, category='Bills', total=1, count=1
+        )
+
+        self.assertEqual(rebuild_monthly_totals(self.user), (1, 1, 1))
+        self.assertEqual(self.rollup(MonthlyTotal.EXPENSE, 'Food').total, Decimal('30'))
+        self.assertEqual(self.rollup(MonthlyTotal.INCOME, 'Salary').total, Decimal('100'))
+        self.assertEqual(rebuild_monthly_totals(self.user), (0, 0, 0))
+
+
+class SummaryCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('carol', password='secret')
+        self.client.force_login(self.user)
+
+    def check_cache(self):
+        self.client.get(reverse('profile'))
+        response = self.client.get(reverse('profile'))
+        self.assertEqual(get_cache_stats(), {'hits': 1, 'misses': 1})
+        self.assertEqual(response.context['monthly_spent'], Decimal('0'))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('add_expense'), {
+                'description': 'Lunch', 'category': 'Food', 'amount': '12.50', 'date': date.today().isoformat()
+            })
+        response = self.client.get(reverse('profile'))
+        self.assertEqual(get_cache_stats(), {'hits': 1, 'misses': 2})
+        self.assertEqual(response.context['monthly_spent'], Decimal('12.50'))
+
+    def test_locmem_backend(self):
+        self.check_cache()
+
+    def test_file_backend(self):
+        with tempfile.TemporaryDirectory() as location:
+            with override_settings(CACHES={'default': {
+                'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': location,
+            }}):
+                self.check_cache()
+
+
+class LedgerTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('dave', password='secret')
+        for day in range(1, 11):
+            Expense.objects.create(
+                user=self.user, description=f'e{day}', category='Food' if day % 2 else 'Bills',
+                amount=Decimal(day), date=date(2026, 1, day)
+            )
+            Income.objects.create(
+                user=self.user, description=f'i{day}', source='Salary',
+                amount=Decimal(day), date=date(2026, 1, day)
+            )
+
+    def walk(self, **filters):
+        seen, after = [], None
+        while True:
+            entries, after = get_ledger_page(self.user, after=after, limit=3, **filters)
+            seen.extend((entry.kind, entry.pk) for entry in entries)
+            if not after:
+                return seen
+
+    def test_pages_cover_history_in_order(self):
+        seen = self.walk()
+        self.assertEqual(len(seen), 20)
+        self.assertEqual(len(set(seen)), 20)
+
+        entries, _ = get_ledger_page(self.user, limit=4)
+        self.assertEqual([e.description for e in entries], ['i10', 'e10', 'i9', 'e9'])
+
+    def test_filters(self):
+        self.assertEqual(len(self.walk(category='Food')), 5)
+        self.assertEqual(len(self.walk(source='Salary')), 10)
+        self.assertEqual(len(self.walk(date_from=date(2026, 1, 3), date_to=date(2026, 1, 4))), 4)
+
+    def test_page_query_count(self):
+        _, after = get_ledger_page(self.user, limit=3)
+        with self.assertNumQueries(2):
+            get_ledger_page(self.user, after=after, limit=3)
+
+    def test_running_balance(self):
+        # прошлые месяцы идут в остаток через помесячные итоги
+        Income.objects.create(user=self.user, description='old', source='Salary', amount=Decimal('100.50'), date=date(2025, 11, 5))
+        Expense.objects.create(user=self.user, description='dec', category='Bills', amount=Decimal('20.25'), date=date(2025, 12, 31))
+        other = User.objects.create_user('frank', password='secret')
+        Income.objects.create(user=other, description='x', source='Salary', amount=Decimal(1000), date=date(2025, 12, 1))
+
+        balance, expected = Decimal('80.25'), {}
+        for day in range(1, 11):
+            balance -= day
+            expected[f'e{day}'] = balance
+            balance += day
+            expected[f'i{day}'] = balance
+
+        after, seen = None, {}
+        while True:
+            entries, after = get_ledger_page(self.user, after=after, limit=3, with_balance=True)
+            seen.update((entry.description, entry.balance) for entry in entries)
+            if not after:
+                break
+        self.assertEqual(seen, {**expected, 'dec': Decimal('80.25'), 'old': Decimal('100.50')})
+
+        # фильтр сужает строки, но остаток по-прежнему по всем операциям
+        entries, _ = get_ledger_page(self.user, limit=2, category='Food', with_balance=True)
+        self.assertEqual([(e.description, e.balance) for e in entries], [('e9', expected['e9']), ('e7', expected['e7'])])
+
+        _, after = get_ledger_page(self.user, limit=3)
+        with self.assertNumQueries(4):
+            get_ledger_page(self.user, after=after, limit=3, with_balance=True)
+
+    def test_bulk_delete_selected_rows(self):
+        other = User.objects.create_user('eve', password='secret')
+        foreign = Expense.objects.create(user=other, description='x', category='Food', amount=1, date=date(2026, 1, 1))
+        selected = [f'expense:{pk}' for pk in Expense.objects.filter(user=self.user, category='Food').values_list('pk', flat=True)]
+        selected += [f'income:{Income.objects.filter(user=self.user).first().pk}', f'expense:{foreign.pk}']
+
+        self.client.force_login(self.user)
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            response = self.client.post(reverse('ledger_bulk'), {'action': 'delete', 'selected': selected}, follow=True)
+        self.assertContains(response, 'Deleted 5 expenses and 1 incomes')
+        self.assertEqual(len(callbacks), 1)
+        self.assertTrue(Expense.objects.filter(pk=foreign.pk).exists())
+        self.assertEqual(Expense.objects.filter(user=self.user).count(), 5)
+        self.assertEqual(rebuild_monthly_totals(self.user), (0, 0, 0))
+
+    def test_bulk_recategorize_by_filter(self):
+        self.client.force_login(self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('ledger_bulk'), {
+                'action': 'recategorize', 'scope': 'filter', 'new_category': 'Health',
+                'filters': 'category=Bills&date_to=2026-01-06',
+            }, follow=True)
+        self.assertContains(response, 'Updated 3 expenses and 0 incomes')
+        self.assertEqual(Expense.objects.filter(user=self.user, category='Health').count(), 3)
+        self.assertEqual(Income.objects.filter(user=self.user, source='Salary').count(), 10)
+        self.assertEqual(rebuild_monthly_totals(self.user), (0, 0, 0))
+
+
+class ImportTests(TestCase):
+    CSV = [
+        'type,date,description,category,amount',
+        'expense,2026-01-15,Groceries,Food,42.10',
+        'expense,2026-01-15,Groceries,Food,42.10',
+        'income,2026-01-31,Salary,Salary,2500',
+        'expense,2026-01-16,Bad,Unknown,1',
+        'expense,not-a-date,Bad,Food,1',
+    ]
+
+    def setUp(self):
+        self.user = User.objects.create_user('erin', password='secret')
+
+    def test_import_is_idempotent(self):
+        result = import_transactions(self.user, self.CSV)
+        self.assertEqual((result.expenses, result.incomes, result.duplicates, result.invalid), (2, 1, 0, 2))
+        self.assertEqual(FinanceSummary(self.user).lifetime_spent, Decimal('84.20'))
+
+        result = import_transactions(self.user, self.CSV)
+        self.assertEqual((result.expenses, result.incomes, result.duplicates), (0, 0, 3))
+        self.assertEqual(Expense.objects.filter(user=self.user).count(), 2)
+
+    def test_manual_entries_count_as_existing(self):
+        Expense.objects.create(
+            user=self.user, description='Groceries', category='Food', amount='42.1', date='2026-01-15'
+        )
+        result = import_transactions(self.user, self.CSV)
+        self.assertEqual((result.expenses, result.duplicates), (1, 1))
+
+    def test_non_finite_amounts_are_invalid(self):
+        rows = self.CSV[:2] + [
+            'expense,2026-01-15,Ghost,Food,NaN',
+            'expense,2026-01-15,Ghost,Food,Infinity',
+            'expense,2026-01-15,Ghost,Food,-inf',
+        ]
+        result = import_transactions(self.user, rows)
+        self.assertEqual((result.expenses, result.invalid), (1, 3))
+
+        self.client.force_login(self.user)
+        upload = SimpleUploadedFile('history.csv', '\n'.join(rows).encode('utf-8'), content_type='text/csv')
+        response = self.client.post(reverse('import_transactions'), {'file': upload})
+        self.assertRedirects(response, reverse('ledger'))
+        self.assertFalse(Expense.objects.filter(user=self.user, description='Ghost').exists())
+
+    def test_upload_endpoint(self):
+        self.client.force_login(self.user)
+        upload = SimpleUploadedFile('history.csv', '\n'.join(self.CSV).encode('utf-8'), content_type='text/csv')
+        response = self.client.post(reverse('import_transactions'), {'file': upload})
+        self.assertRedirects(response, reverse('ledger'))
+        self.assertEqual(Income.objects.filter(user=self.user).count(), 1)
+
+
+class ExportTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('frank', password='secret')
+        Expense.objects.create(user=self.user, description='Taxi, late', category='Transport', amount=Decimal('9.90'), date=date(2026, 2, 1))
+        Income.objects.create(user=self.user, description='Salary', source='Salary', amount=Decimal('100'), date=date(2026, 2, 2))
+        FinancialGoal.objects.create(user=self.user, name='Bike', target=Decimal('500'), saved=Decimal('50'))
+        self.client.force_login(self.user)
+
+    def test_csv_export_round_trips_through_import(self):
+        response = self.client.get(reverse('export_transactions'), {'format': 'csv'})
+        self.assertTrue(response.streaming)
+        content = b''.join(response.streaming_content).decode('utf-8')
+        self.assertEqual(len(content.splitlines()), 4)
+
+        result = import_transactions(self.user, content.splitlines())
+        self.assertEqual((result.expenses, result.incomes, result.duplicates, result.invalid), (0, 0, 2, 0))
+
+    def test_asgi_export_streams_in_chunks(self):
+        for day in range(1, 6):
+            Expense.objects.create(user=self.user, description='Coffee', category='Food', amount=3, date=date(2026, 3, day))
+        request = AsyncRequestFactory().get(reverse('export_transactions'), {'format': 'ndjson'})
+        request.user = self.user
+        with mock.patch('accounts.exporter.EXPORT_CHUNK_SIZE', 2):
+            response = export_transactions_view(request)
+            self.assertTrue(response.is_async)
+
+            async def collect():
+                return [chunk async for chunk in response.streaming_content]
+            chunks = async_to_sync(collect)()
+        # 8 строк пачками по 2, а не одним куском
+        self.assertEqual(len(chunks), 4)
+        rows = [json.loads(line) for line in b''.join(chunks).decode('utf-8').splitlines()]
+        self.assertEqual([row['type'] for row in rows], ['expense'] * 6 + ['income', 'goal'])
+
+    def test_ndjson_export(self):
+        response = self.client.get(reverse('export_transactions'), {'format': 'ndjson'})
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).decode('utf-8').splitlines()]
+        self.assertEqual([row['type'] for row in rows], ['expense', 'income', 'goal'])
+        self.assertEqual(rows[0]['amount'], '9.90')
+        self.assertEqual(rows[2]['saved'], '50.00')
+
+
+class FailingEmailBackend(BaseEmailBackend):
+    def send_messages(self, email_messages):
+        raise smtplib.SMTPServerDisconnected('relay went away')
+
+
+class OutboxTests(TestCase):
+    def register(self):
+        return self.client.post(reverse('register'), {
+            'username': 'grace', 'email': 'grace@example.com',
+            'password1': 'Str0ng-pass', 'password2': 'Str0ng-pass',
+        })
+
+    def test_registration_queues_email_without_sending(self):
+        response = self.register()
+        self.assertTemplateUsed(response, 'accounts/email_sent.html')
+        self.assertEqual(len(mail.outbox), 0)
+        email = OutboundEmail.objects.get()
+        self.assertEqual(email.to, 'grace@example.com')
+        self.assertFalse(User.objects.get(username='grace').is_active)
+
+        call_command('send_outbound_emails', stdout=io.StringIO())
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertIn('/activate/', mail.outbox[0].body)
+        email.refresh_from_db()
+        self.assertEqual((email.status, email.attempts), (OutboundEmail.SENT, 1))
+
+    @override_settings(EMAIL_BACKEND='accounts.tests.FailingEmailBackend')
+    def test_failures_are_retried_with_backoff(self):
+        self.register()
+        email = OutboundEmail.objects.get()
+        for attempt in range(1, OutboundEmail.MAX_ATTEMPTS + 1):
+            OutboundEmail.objects.filter(pk=email.pk).update(next_attempt_at=email.created_at)
+            call_command('send_outbound_emails', stdout=io.StringIO())
+            email.refresh_from_db()
+            self.assertEqual(email.attempts, attempt)
+            self.assertIn('relay went away', email.last_error)
+
+        self.assertEqual(email.status, OutboundEmail.FAILED)
+        self.assertEqual(len(mail.outbox), 0)
+
+    def test_crashed_worker_uses_up_attempts(self):
+        self.register()
+        email = OutboundEmail.objects.get()
+        # воркер забрал письмо и умер до отправки: после CLAIM_SECONDS его заберут снова
+        command = SendOutboundEmailsCommand()
+        for attempt in range(1, OutboundEmail.MAX_ATTEMPTS + 1):
+            OutboundEmail.objects.filter(pk=email.pk).update(next_attempt_at=email.created_at)
+            self.assertEqual([claimed.attempts for claimed in command.claim_batch(10)], [attempt])
+
+        OutboundEmail.objects.filter(pk=email.pk).update(next_attempt_at=email.created_at)
+        self.assertEqual(command.claim_batch(10), [])
+        email.refresh_from_db()
+        self.assertEqual((email.status, email.attempts), (OutboundEmail.FAILED, OutboundEmail.MAX_ATTEMPTS))
+
+
+class AccountPurgeTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('henry', password='secret')
+        self.client.force_login(self.user)
+        Expense.objects.bulk_create([
+            Expense(user=self.user, description='Coffee', category='Food', amount=Decimal('3.00'), date=date(2025, 1 + i % 12, 1))
+            for i in range(25)
+        ])
+        Income.objects.create(user=self.user, description='Salary', source='Salary', amount=Decimal('100'), date=date(2025, 1, 1))
+        FinancialGoal.objects.create(user=self.user, name='Car', target=Decimal('1000'))
+        rebuild_monthly_totals(self.user)
+
+    def test_request_returns_before_history_is_deleted(self):
+        response = self.client.post(reverse('delete_account'))
+        self.assertRedirects(response, reverse('login'))
+        self.assertFalse(User.objects.get(pk=self.user.pk).is_active)
+        self.assertEqual(Expense.objects.filter(user_id=self.user.pk).count(), 25)
+        purge = AccountPurge.objects.get()
+        self.assertEqual(purge.status, AccountPurge.PENDING)
+        self.assertEqual(self.client.get(reverse('profile')).status_code, 302)
+
+        rows = Expense.objects.count() + Income.objects.count() + MonthlyTotal.objects.count() + 2  # цель и профиль
+        out = io.StringIO()
+        call_command('purge_accounts', chunk_size=10, stdout=out)
+        self.assertIn('-10 expenses', out.getvalue())
+
+        purge.refresh_from_db()
+        self.assertEqual((purge.status, purge.rows_deleted), (AccountPurge.DONE, rows))
+        self.assertFalse(User.objects.filter(pk=self.user.pk).exists())
+        for model in (Expense, Income, MonthlyTotal, FinancialGoal, UserProfile):
+            self.assertFalse(model.objects.filter(user_id=self.user.pk).exists())
+
+    def test_activation_link_does_not_revive_queued_account(self):
+        self.user.is_active = False
+        self.user.save()
+        uid = urlsafe_base64_encode(force_bytes(self.user.pk))
+        token = email_verification_token.make_token(self.user)
+
+        request_account_purge(self.user)
+        response = self.client.get(reverse('activate', args=[uid, token]))
+        self.assertContains(response, 'Invalid activation link')
+        self.assertFalse(User.objects.get(pk=self.user.pk).is_active)
+
+        # включённый вручную аккаунт воркер не удаляет
+        User.objects.filter(pk=self.user.pk).update(is_active=True)
+        call_command('purge_accounts', stdout=io.StringIO(), stderr=io.StringIO())
+        purge = AccountPurge.objects.get()
+        self.assertEqual(purge.status, AccountPurge.FAILED)
+        self.assertIn('active again', purge.last_error)
+        self.assertEqual(Expense.objects.filter(user_id=self.user.pk).count(), 25)
+
+    def test_failed_purge_is_retried_with_backoff(self):
+        request_account_purge(self.user)
+        with mock.patch('accounts.management.commands.purge_accounts.purge_account', side_effect=OSError('disk I/O error')):
+            call_command('purge_accounts', stdout=io.StringIO(), stderr=io.StringIO())
+            purge = AccountPurge.objects.get()
+            self.assertEqual((purge.status, purge.attempts), (AccountPurge.PENDING, 1))
+            self.assertGreater(purge.next_attempt_at, timezone.now())
+
+            # до срока повтора воркер её не берёт, потом берёт до MAX_ATTEMPTS
+            call_command('purge_accounts', stdout=io.StringIO(), stderr=io.StringIO())
+            self.assertEqual(AccountPurge.objects.get().attempts, 1)
+            for attempt in range(2, AccountPurge.MAX_ATTEMPTS + 1):
+                AccountPurge.objects.update(next_attempt_at=timezone.now())
+                call_command('purge_accounts', stdout=io.StringIO(), stderr=io.StringIO())
+            purge.refresh_from_db()
+            self.assertEqual((purge.status, purge.attempts), (AccountPurge.FAILED, AccountPurge.MAX_ATTEMPTS))
+            self.assertEqual(purge.last_error, 'disk I/O error')
+
+        # после исправления причины админ ставит удаление в очередь заново
+        admin_user = User.objects.create_superuser('root', password='secret')
+        self.client.force_login(admin_user)
+        self.client.post(reverse('admin:accounts_accountpurge_changelist'), {
+            'action': 'retry_purges', '_selected_action': [purge.pk],
+        })
+        purge.refresh_from_db()
+        self.assertEqual((purge.status, purge.attempts), (AccountPurge.PENDING, 0))
+        call_command('purge_accounts', stdout=io.StringIO())
+        self.assertEqual(AccountPurge.objects.get().status, AccountPurge.DONE)
+        self.assertFalse(Expense.objects.filter(user_id=self.user.pk).exists())
+
+
+class SearchTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('judy', password='secret')
+        self.other = User.objects.create_user('karl', password='secret')
+        day = date(2026, 3, 1)
+        self.beans = Expense.objects.create(user=self.user, description='Coffee beans', category='Food', amount=Decimal('9'), date=day)
+        self.shop = Expense.objects.create(user=self.user, description='Coffee shop, coffee to go', category='Food', amount=Decimal('4'), date=day)
+        Expense.objects.create(user=self.user, description='Taxi', category='Transport', amount=Decimal('20'), date=day)
+        Income.objects.create(user=self.user, description='Café refund', source='Other', amount=Decimal('3'), date=day)
+        Expense.objects.create(user=self.other, description='Coffee', category='Food', amount=Decimal('2'), date=day)
+        self.client.force_login(self.user)
+
+    def search(self, q):
+        response = self.client.get(reverse('api_search'), {'q': q})
+        self.assertEqual(response.status_code, 200)
+        return [(row['type'], row['description']) for row in response.json()['results']]
+
+    def test_ranked_prefix_search_is_scoped_to_user(self):
+        self.assertEqual(self.search('cof'), [('expense', 'Coffee shop, coffee to go'), ('expense', 'Coffee beans')])
+        self.assertEqual(self.search('cafe'), [('income', 'Café refund')])
+        self.assertEqual(self.search('coffee be'), [('expense', 'Coffee beans')])
+        self.assertEqual(self.search('"*'), [])
+
+    def test_index_follows_updates_and_deletes(self):
+        self.beans.description = 'Tea leaves'
+        self.beans.save()
+        self.shop.delete()
+        self.assertEqual(self.search('coffee'), [])
+        self.assertEqual(self.search('tea'), [('expense', 'Tea leaves')])
+
+        with connection.cursor() as cursor:
+            cursor.execute("INSERT INTO accounts_expense_fts(accounts_expense_fts) VALUES ('delete-all')")
+        self.assertEqual(self.search('tea'), [])
+        call_command('rebuild_search_index', stdout=io.StringIO())
+        self.assertEqual(self.search('tea'), [('expense', 'Tea leaves')])
+
+    def test_migrate_restores_lost_triggers(self):
+        self.assertEqual(missing_search_objects(connection), [])
+        # так выглядит база после миграции, пересоздавшей таблицу расходов
+        with connection.cursor() as cursor:
+            cursor.execute('DROP TRIGGER accounts_expense_fts_ai')
+        Expense.objects.create(user=self.user, description='Tea leaves', category='Food', amount=Decimal('5'), date=date(2026, 3, 2))
+        self.assertEqual(missing_search_objects(connection), ['accounts_expense_fts_ai'])
+        self.assertEqual(self.search('tea'), [])
+
+        with self.assertLogs('accounts.db', 'WARNING'):
+            call_command('migrate', verbosity=0, stdout=io.StringIO())
+        self.assertEqual(missing_search_objects(connection), [])
+        self.assertEqual(self.search('tea'), [('expense', 'Tea leaves')])
+
+    def test_admin_search_uses_index(self):
+        staff = User.objects.create_user('admin', password='secret', is_staff=True, is_superuser=True)
+        self.client.force_login(staff)
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('admin:accounts_expense_changelist'), {'q': 'coff'})
+        self.assertEqual(response.context['cl'].result_count, 3)
+        self.assertFalse(any('LIKE' in query['sql'] for query in ctx.captured_queries))
+        response = self.client.get(reverse('admin:accounts_expense_changelist'), {'q': 'karl'})
+        self.assertEqual(response.context['cl'].result_count, 1)
+
+
+class AdminChangelistTests(TestCase):
+    URLS = [
+        'admin:accounts_expense_changelist',
+        'admin:accounts_income_changelist',
+        'admin:accounts_budget_changelist',
+        'admin:accounts_financialgoal_changelist',
+    ]
+
+    def setUp(self):
+        self.staff = User.objects.create_user('root', password='secret', is_staff=True, is_superuser=True)
+        self.client.force_login(self.staff)
+        self.add_users(2)
+
+    def add_users(self, count):
+        day = date(2026, 2, 1)
+        for i in range(count):
+            user = User.objects.create_user(f'owner{User.objects.count()}')
+            Expense.objects.create(user=user, description='Lunch', category='Food', amount=Decimal('12'), date=day)
+            Income.objects.create(user=user, description='Salary', source='Salary', amount=Decimal('900'), date=day)
+            Budget.objects.create(user=user, category='Food', limit=Decimal('100'), month=day)
+            FinancialGoal.objects.create(user=user, name='Car', target=Decimal('1000'), saved=Decimal(10 * (i + 1)))
+
+    def count_queries(self, url, params=None):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse(url), params or {})
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries)
+
+    def test_query_count_does_not_grow_with_rows_or_users(self):
+        before = {url: self.count_queries(url) for url in self.URLS}
+        self.add_users(10)
+        after = {url: self.count_queries(url) for url in self.URLS}
+        self.assertEqual(before, after)
+        for url, count in after.items():
+            self.assertLessEqual(count, 10, url)
+
+    def test_user_filter_does_not_list_users(self):
+        owner = User.objects.get(username='owner1')
+        response = self.client.get(reverse('admin:accounts_expense_changelist'), {'user__id__exact': owner.pk})
+        self.assertEqual(response.context['cl'].result_count, 1)
+        self.assertContains(response, f'<option value="{owner.pk}" selected>owner1</option>', html=True)
+        self.assertNotContains(response, 'owner2</option>')
+
+    def test_goals_sort_by_database_percent(self):
+        response = self.client.get(reverse('admin:accounts_financialgoal_changelist'), {'o': '-5'})
+        percents = [goal.percent_value for goal in response.context['cl'].result_list]
+        self.assertEqual(percents, [2, 1])
+        self.assertEqual(percents, [goal.percent for goal in response.context['cl'].result_list])
+
+    def test_goal_date_hierarchy_seeks_index_instead_of_distinct_trunc(self):
+        url = 'admin:accounts_financialgoal_changelist'
+
+        def spread(moments):
+            for goal, moment in zip(FinancialGoal.objects.order_by('id'), moments):
+                FinancialGoal.objects.filter(pk=goal.pk).update(created_at=moment)
+
+        moments = [datetime(2025, 3, 1, 12, tzinfo=dt_timezone.utc), datetime(2026, 2, 1, 12, tzinfo=dt_timezone.utc)]
+        spread(moments)
+        levels = [{}, {'created_at__year': 2026}, {'created_at__year': 2026, 'created_at__month': 2}]
+        before = [self.count_queries(url, params) for params in levels]
+
+        self.add_users(10)
+        spread(moments * 6)
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse(url))
+        self.assertFalse([q for q in ctx.captured_queries if 'datetime_trunc' in q['sql'] or 'DISTINCT' in q['sql']])
+        self.assertContains(response, '?created_at__year=2025')
+        self.assertContains(response, '?created_at__year=2026')
+        self.assertEqual([self.count_queries(url, params) for params in levels], before)
+
+    def test_unfiltered_count_uses_planner_estimate(self):
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+            cursor.execute("UPDATE sqlite_stat1 SET stat = '5000000 1' WHERE tbl = 'accounts_expense'")
+        response = self.client.get(reverse('admin:accounts_expense_changelist'))
+        self.assertEqual(response.context['cl'].result_count, 5000000)
+        response = self.client.get(reverse('admin:accounts_expense_changelist'), {'category__exact': 'Food'})
+        self.assertEqual(response.context['cl'].result_count, 2)
+
+
+class RequestMetricsTests(TestCase):
+    def setUp(self):
+        registry.reset()
+        self.user = User.objects.create_user('heidi', password='secret')
+        self.client.force_login(self.user)
+
+    def test_requests_are_recorded_per_view(self):
+        self.client.get(reverse('profile'))
+        self.client.get(reverse('profile'))
+
+        staff = User.objects.create_user('admin', password='secret', is_staff=True)
+        self.client.force_login(staff)
+        response = self.client.get(reverse('metrics'))
+        body = response.content.decode()
+        self.assertIn('cashly_requests_total{view="profile",status="200"} 2', body)
+        self.assertIn('cashly_request_duration_seconds_count{view="profile"} 2', body)
+        self.assertIn('cashly_request_db_queries_bucket{view="profile",le="+Inf"} 2', body)
+
+    def test_metrics_are_staff_only(self):
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, 302)
+
+    @override_settings(SERVER_TIMING_HEADER=True)
+    def test_server_timing_header(self):
+        response = self.client.get(reverse('profile'))
+        self.assertRegex(response['Server-Timing'], r'^app;dur=[\d.]+, db;dur=[\d.]+;desc="\d+ queries"$')
+
+
+
+
+class ApiTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('alice', password='secret')
+        self.client.force_login(self.user)
+
+    def post_json(self, name, data):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(reverse(name), json.dumps(data), content_type='application/json')
+
+    def test_unchanged_summary_is_not_recomputed(self):
+        response = self.client.get(reverse('api_summary'))
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('api_summary'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        # только чтение версии данных, без агрегатов
+        queries = [q['sql'] for q in ctx.captured_queries if 'FROM "accounts_' in q['sql']]
+        self.assertEqual(len(queries), 1)
+        self.assertIn('"accounts_dataversion"', queries[0])
+
+        created = self.post_json('api_expenses', {
+            'description': 'Lunch', 'category': 'Food', 'amount': 12.5, 'date': date.today().isoformat(),
+        })
+        self.assertEqual(created.status_code, 201)
+        self.assertEqual(created.json()['amount'], '12.50')
+
+        response = self.client.get(reverse('api_summary'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(Decimal(response.json()['monthly_spent']), Decimal('12.50'))
+
+    def test_etag_changes_after_write_from_management_command(self):
+        Expense.objects.create(user=self.user, description='Lunch', category='Food', amount=12, date=date.today())
+        # итоги разошлись с операциями в обход сигналов, как после сбоя
+        MonthlyTotal.objects.filter(user=self.user).update(total=Decimal('1'))
+        response = self.client.get(reverse('api_summary'))
+        etag = response['ETag']
+        self.assertEqual(Decimal(response.json()['monthly_spent']), Decimal('1.00'))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('rebuild_monthly_totals', stdout=io.StringIO())
+
+        response = self.client.get(reverse('api_summary'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        # версия лежит в базе, а не в кэше процесса: её видят и другие воркеры
+        version = DataVersion.objects.get(user_id=self.user.pk).version
+        self.assertIn(f'-{version}-', response['ETag'])
+        self.assertEqual(Decimal(response.json()['monthly_spent']), Decimal('12.00'))
+
+    def test_writes_are_validated(self):
+        self.assertEqual(self.post_json('api_incomes', {'description': 'Pay', 'source': 'Lottery', 'amount': 1,
+                                                        'date': '2026-01-01'}).status_code, 400)
+        self.assertEqual(self.post_json('api_goals', {'name': 'Car', 'target': 'lots'}).status_code, 400)
+        self.assertEqual(self.post_json('api_goals', {'name': 'Car', 'target': 5000}).status_code, 201)
+        self.assertEqual(self.client.get(reverse('api_goals')).json()['results'][0]['target'], '5000.00')
+
+        self.client.logout()
+        self.assertEqual(self.client.get(reverse('api_summary')).status_code, 401)
+
+    def test_batch_reports_each_entry(self):
+        today = date.today().isoformat()
+        entries = [
+            {'type': 'expense', 'description': 'Coffee', 'category': 'Food', 'amount': '3.20', 'date': today},
+            {'type': 'income', 'description': 'Pay', 'source': 'Salary', 'amount': 1000, 'date': today},
+            {'type': 'expense', 'description': 'Bad', 'category': 'Nope', 'amount': '1', 'date': today},
+            'not an object',
+        ] + [
+            {'type': 'expense', 'description': f'Item {i}', 'category': 'Shopping', 'amount': 1, 'date': today}
+            for i in range(200)
+        ]
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.post_json('api_transactions_batch', {'entries': entries})
+        inserts = [q for q in ctx.captured_queries if q['sql'].startswith('INSERT INTO "accounts_expense"')]
+        self.assertLessEqual(len(inserts), 2)
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertEqual((body['created'], body['failed']), (202, 2))
+        self.assertEqual(body['results'][1]['id'], Income.objects.get().pk)
+        self.assertEqual(body['results'][2]['status'], 'error')
+        self.assertEqual(body['results'][3]['error'], 'entry must be an object')
+
+        total = MonthlyTotal.objects.get(user=self.user, kind=MonthlyTotal.EXPENSE, category='Shopping')
+        self.assertEqual((total.total, total.count), (Decimal('200'), 200))
+        self.assertEqual(rebuild_monthly_totals(self.user), (0, 0, 0))
+
+    def test_non_finite_amounts_are_rejected_per_entry(self):
+        today = date.today().isoformat()
+        self.assertEqual(self.post_json('api_expenses', {
+            'description': 'Lunch', 'category': 'Food', 'amount': 'NaN', 'date': today,
+        }).status_code, 400)
+
+        entries = [
+            {'type': 'expense', 'description': 'Coffee', 'category': 'Food', 'amount': '3.20', 'date': today},
+            {'type': 'expense', 'description': 'Ghost', 'category': 'Food', 'amount': 'NaN', 'date': today},
+            {'type': 'income', 'description': 'Pay', 'source': 'Salary', 'amount': 'Infinity', 'date': today},
+        ]
+        response = self.post_json('api_transactions_batch', {'entries': entries})
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertEqual((body['created'], body['failed']), (1, 2))
+        self.assertEqual([r['status'] for r in body['results']][1:], ['error', 'error'])
+        self.assertEqual(body['results'][1]['error'], 'amount is not a number')
+        self.assertEqual(Expense.objects.filter(user=self.user).count(), 1)
+
+    def test_transactions_are_paged_by_cursor(self):
+        for day in range(1, 6):
+            Expense.objects.create(user=self.user, description='Coffee', category='Food', amount=3, date=date(2026, 1, day))
+        page = self.client.get(reverse('api_transactions'), {'limit': 3}).json()
+        self.assertEqual([row['date'] for row in page['results']], ['2026-01-05', '2026-01-04', '2026-01-03'])
+        page = self.client.get(reverse('api_transactions'), {'limit': 3, 'after': page['next']}).json()
+        self.assertEqual([row['date'] for row in page['results']], ['2026-01-02', '2026-01-01'])
+        self.assertIsNone(page['next'])
+        self.assertNotIn('balance', page['results'][0])
+        page = self.client.get(reverse('api_transactions'), {'limit': 3, 'balance': '1'}).json()
+        self.assertEqual([row['balance'] for row in page['results']], ['-15.00', '-12.00', '-9.00'])
+
+
+class AuthPathTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('alice', password='secret')
+
+    # cached_db включается только с общим кэшем; в тестах кэш один на процесс
+    @override_settings(SESSION_ENGINE='django.contrib.sessions.backends.cached_db')
+    def test_request_reads_session_from_cache_and_profile_with_user(self):
+        self.client.force_login(self.user)
+        self.client.get(reverse('profile'))
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.post(reverse('update_budgets'), {'monthly_budget': '1500'})
+        self.assertEqual(response.status_code, 302)
+        sqls = [q['sql'] for q in ctx.captured_queries]
+        self.assertFalse([sql for sql in sqls if 'django_session' in sql])
+        self.assertFalse([sql for sql in sqls if sql.startswith('SELECT') and 'FROM "accounts_userprofile"' in sql])
+        self.assertEqual(UserProfile.objects.get(user=self.user).monthly_budget, Decimal('1500.00'))
+
+    def test_login_does_not_touch_profile(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.post(reverse('login'), {'username': 'alice', 'password': 'secret'})
+        self.assertRedirects(response, reverse('dashboard'), fetch_redirect_response=False)
+        self.assertFalse([q for q in ctx.captured_queries if 'accounts_userprofile' in q['sql']])
+
+    def test_missing_profile_is_created_on_first_use(self):
+        UserProfile.objects.filter(user=self.user).delete()
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get(reverse('profile')).status_code, 200)
+        self.assertTrue(UserProfile.objects.filter(user=self.user).exists())
+
+
+class SummaryPageTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('ivan')
+        today = date.today()
+        Expense.objects.create(user=self.user, description='Lunch', category='Food', amount=Decimal('12.50'), date=today)
+        Income.objects.create(user=self.user, description='Salary', source='Salary', amount=Decimal('900'), date=today)
+        Budget.objects.create(user=self.user, category='Food', limit=Decimal('100'), month=today.replace(day=1))
+        FinancialGoal.objects.create(user=self.user, name='Car', target=Decimal('1000'), saved=Decimal('250'))
+
+    def test_summary_pages(self):
+        self.client.force_login(self.user)
+
+        response = self.client.get(reverse('profile'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['monthly_spent'], Decimal('12.50'))
+        self.assertEqual(response.context['monthly_net'], Decimal('887.50'))
+        self.assertEqual(response.context['investments_count'], 1)
+        self.assertEqual(response.context['portfolio_value'], Decimal('250.00'))
+        self.assertEqual(response.context['budget_categories'][0]['spent'], Decimal('12.50'))
+
+        response = self.client.get(reverse('dashboard'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['investments_count'], 1)
+        self.assertEqual(response.context['portfolio_value'], Decimal('-12.50'))
+        self.assertEqual([entry.description for entry in response.context['expense_list']], ['Lunch'])
+
+        response = self.client.get(reverse('investments_goals'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([goal.name for goal in response.context['goals']], ['Car'])
+
+    def test_anonymous_user_is_redirected(self):
+        self.assertEqual(self.client.get(reverse('dashboard')).status_code, 302)
+
+
+# страницы через стандартный ASGI-обработчик Django: те же синхронные вьюхи, что под WSGI
+class ASGISummaryPageTests(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('ivan')
+        today = date.today()
+        Expense.objects.create(user=self.user, description='Lunch', category='Food', amount=Decimal('12.50'), date=today)
+        Income.objects.create(user=self.user, description='Salary', source='Salary', amount=Decimal('900'), date=today)
+        Budget.objects.create(user=self.user, category='Food', limit=Decimal('100'), month=today.replace(day=1))
+        FinancialGoal.objects.create(user=self.user, name='Car', target=Decimal('1000'), saved=Decimal('250'))
+        self.client.force_login(self.user)
+        self.cookie = f'{settings.SESSION_COOKIE_NAME}={self.client.cookies[settings.SESSION_COOKIE_NAME].value}'
+
+    def asgi_get(self, path):
+        scope = {
+            'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET',
+            'scheme': 'http', 'path': path, 'raw_path': path.encode(), 'query_string': b'', 'root_path': '',
+            'headers': [(b'host', b'localhost'), (b'cookie', self.cookie.encode())],
+            'server': ('localhost', 80), 'client': ('127.0.0.1', 0),
+        }
+        received, sent = [], []
+
+        async def receive():
+            if not received:
+                received.append(True)
+                return {'type': 'http.request', 'body': b'', 'more_body': False}
+            await asyncio.Event().wait()  # клиент не отключается
+
+        async def send(message):
+            sent.append(message)
+
+        asyncio.run(ASGIHandler()(scope, receive, send))
+        body = b''.join(message.get('body', b'') for message in sent if message['type'] == 'http.response.body')
+        return sent[0]['status'], body.decode()
+
+    def test_summary_pages_are_served_by_sync_views(self):
+        for name in ('dashboard', 'profile', 'investments_goals'):
+            self.assertFalse(iscoroutinefunction(resolve(reverse(name)).func), name)
+
+        status, body = self.asgi_get(reverse('dashboard'))
+        self.assertEqual(status, 200)
+        self.assertIn('Lunch', body)
+        status, body = self.asgi_get(reverse('investments_goals'))
+        self.assertEqual(status, 200)
+        self.assertIn('Car', body)
+        status, _ = self.asgi_get(reverse('profile'))
+        self.assertEqual(status, 200)
+
+        # контекст, собранный под ASGI, лёг в кэш сводок
+        context = cached_summary('profile', self.user, lambda: self.fail('profile was not cached'))
+        expected = build_profile_context(self.user)
+        for key in ('monthly_spent', 'monthly_net', 'investments_count', 'portfolio_value', 'budget_categories'):
+            self.assertEqual(context[key], expected[key], key)
+
+
+@override_settings(REPLICA_DATABASE='replica', REPLICA_PIN_SECONDS=60)
+class ReplicaRouterTests(TestCase):
+    databases = {'default', 'replica'}
+
+    def test_only_marked_reads_go_to_replica(self):
+        router = ReplicaRouter()
+        self.assertEqual(router.db_for_read(Expense), 'default')
+        with replica_reads():
+            self.assertEqual(router.db_for_read(Expense), 'replica')
+            self.assertEqual(router.db_for_write(Expense), 'default')
+            with pinned_to_primary():
+                self.assertEqual(router.db_for_read(Expense), 'default')
+
+    def test_pin_cookie_is_set_after_write(self):
+        user = User.objects.create_user('alice', password='secret')
+        self.client.force_login(user)
+        with self.modify_settings(MIDDLEWARE={'append': 'accounts.middleware.ReplicaPinMiddleware'}):
+            response = self.client.get(reverse('dashboard'))
+            self.assertNotIn(ReplicaPinMiddleware.COOKIE_NAME, response.cookies)
+
+            response = self.client.post(reverse('add_expense'), {
+                'description': 'Lunch', 'category': 'Food', 'amount': '10.00', 'date': date.today().isoformat(),
+            })
+            self.assertEqual(response.cookies[ReplicaPinMiddleware.COOKIE_NAME]['max-age'], 60)
+
+
+# снапшот-реплика: отстающая не должна попасть в кэш сводок, догнавшая версию юзера их обслуживает
+@override_settings(
+    REPLICA_DATABASE='replica', DATABASE_ROUTERS=['accounts.routers.ReplicaRouter'],
+    MIDDLEWARE=[*settings.MIDDLEWARE, 'accounts.middleware.ReplicaPinMiddleware'],
+)
+class LaggingReplicaTests(TestCase):
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('bob', password='secret')
+        Income.objects.create(user=self.user, description='Salary', source='Salary', amount=100, date=date.today())
+        self.client.force_login(self.user)
+
+    def test_cached_summaries_are_built_from_primary(self):
+        with replica_reads():
+            self.assertFalse(Income.objects.exists())
+
+        self.assertEqual(self.client.get(reverse('api_summary')).json()['monthly_income'], '100.00')
+        self.assertEqual(self.client.get(reverse('dashboard')).context['monthly_income'], Decimal('100'))
+        # второй запрос берёт из кэша то же самое
+        self.assertEqual(self.client.get(reverse('dashboard')).context['monthly_income'], Decimal('100'))
+        self.assertEqual(get_cache_stats()['hits'], 1)
+
+    def test_caught_up_replica_serves_summaries_until_next_write(self):
+        # снапшот с той же версией данных, что в основной базе; итог в нём отличается,
+        # чтобы было видно, откуда читали
+        version = get_data_version(self.user.pk)
+        User.objects.using('replica').bulk_create([User(pk=self.user.pk, username='bob')])
+        MonthlyTotal.objects.using('replica').create(
+            user_id=self.user.pk, year_month=date.today().replace(day=1), kind=MonthlyTotal.INCOME,
+            category='Salary', total=Decimal('250'), count=1,
+        )
+        DataVersion.objects.using('replica').create(user_id=self.user.pk, version=version)
+
+        self.assertEqual(self.client.get(reverse('profile')).context['monthly_income'], Decimal('250'))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('add_income'), {
+                'description': 'Bonus', 'source': 'Salary', 'amount': '50', 'date': date.today().isoformat(),
+            })
+        # без куки привязки реплика всё равно не подходит: версия ушла вперёд
+        del self.client.cookies[ReplicaPinMiddleware.COOKIE_NAME]
+        self.assertEqual(self.client.get(reverse('profile')).context['monthly_income'], Decimal('150'))
+
+        # снапшот догнал версию: снова реплика, пока юзер не привязан к основной базе
+        DataVersion.objects.using('replica').filter(user_id=self.user.pk).update(version=get_data_version(self.user.pk))
+        cache.clear()
+        self.assertEqual(self.client.get(reverse('profile')).context['monthly_income'], Decimal('250'))
+        self.client.cookies[ReplicaPinMiddleware.COOKIE_NAME] = '1'
+        cache.clear()
+        self.assertEqual(self.client.get(reverse('profile')).context['monthly_income'], Decimal('150'))
+
+
+
+@override_settings(SHARD_DATABASES=['shard0', 'shard1'])
+class ShardRouterTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('alice', password='secret')
+        self.placement = UserShard.objects.create(user=self.user, database='shard1')
+
+    def test_user_rows_follow_the_placement(self):
+        router = ShardRouter()
+        self.assertEqual(router.db_for_write(Expense, instance=Expense(user_id=self.user.pk)), 'shard1')
+        self.assertEqual(router.db_for_read(UserProfile, instance=self.user), 'shard1')
+        self.assertEqual(router.db_for_write(MonthlyTotal, user_id=self.user.pk), 'shard1')
+        # без подсказок и без привязки запроса шард не угадываем
+        self.assertIsNone(router.db_for_read(Expense))
+        with user_database(self.user.pk):
+            self.assertEqual(router.db_for_read(Budget), 'shard1')
+            self.assertIsNone(router.db_for_read(OutboundEmail))
+        self.assertIn(initial_shard(self.user.pk), ['shard0', 'shard1'])
+        self.assertEqual(initial_shard(self.user.pk), initial_shard(self.user.pk))
+
+    def test_writes_are_rejected_while_user_is_moving(self):
+        self.placement.locked = True
+        self.placement.save()
+        self.client.force_login(self.user)
+        with self.modify_settings(MIDDLEWARE={'append': 'accounts.middleware.ShardMiddleware'}):
+            response = self.client.post(reverse('add_expense'), {
+                'description': 'Lunch', 'category': 'Food', 'amount': '10.00', 'date': date.today().isoformat(),
+            })
+            self.assertEqual(response.status_code, 503)
+            self.assertEqual(self.client.get(reverse('dashboard')).status_code, 200)
+        self.assertFalse(Expense.objects.exists())
+
+    def test_writes_are_refused_at_save_while_user_is_moving(self):
+        expense = Expense.objects.create(user=self.user, description='Lunch', category='Food', amount=10, date=date(2026, 1, 5))
+        self.placement.locked = True
+        self.placement.save()
+
+        # save() и delete() откатывают свою транзакцию при ошибке, тут это savepoint
+        with self.assertRaises(UserMoving), transaction.atomic():
+            Expense.objects.create(user=self.user, description='Dinner', category='Food', amount=20, date=date(2026, 1, 5))
+        with self.assertRaises(UserMoving), transaction.atomic():
+            expense.delete()
+        with self.assertRaises(UserMoving):
+            bulk_delete_transactions(self.user, select_transactions(self.user))
+        self.assertEqual(Expense.objects.get().pk, expense.pk)
+        self.assertEqual(MonthlyTotal.objects.get().count, 1)
+
+        # запись, начатая до блокировки, отдаётся как 503, а не 500
+        response = ShardMiddleware(lambda request: None).process_exception(None, UserMoving())
+        self.assertEqual(response.status_code, 503)
+
+    def test_deletes_require_post(self):
+        expense = Expense.objects.create(user=self.user, description='Lunch', category='Food', amount=10, date=date(2026, 1, 5))
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get(reverse('delete_expense', args=[expense.pk])).status_code, 405)
+        self.assertTrue(Expense.objects.exists())
+        self.client.post(reverse('delete_expense', args=[expense.pk]))
+        self.assertFalse(Expense.objects.exists())
+
+
+# loadtest поднимает настоящий сервер в потоках, ему нужны закоммиченные данные
+class LoadTestCommandTests(TransactionTestCase):
+    def test_cleanup_only_touches_simulated_users(self):
+        simulated = User.objects.create_user('seed0')
+        outsider = User.objects.create_user('outsider')
+        for user in (simulated, outsider):
+            Expense.objects.create(user=user, description='Load test', category='Food', amount=1, date=date(2026, 1, 5))
+
+        out = io.StringIO()
+        call_command('loadtest', clients=1, duration=0.2, write_ratio=0, stdout=out)
+        self.assertGreater(json.loads(out.getvalue())['requests'], 0)
+        self.assertFalse(Expense.objects.filter(user=simulated).exists())
+        self.assertTrue(Expense.objects.filter(user=outsider, description='Load test').exists())
+
+
+# настоящие базы шардов: migrate_shards и перенос юзера между ними
+@override_settings(SHARD_DATABASES=['shard0', 'shard1'], DATABASE_ROUTERS=['accounts.routers.ShardRouter'])
+class ShardMoveTests(TransactionTestCase):
+    databases = {'default', 'shard0', 'shard1'}
+
+    def setUp(self):
+        cache.clear()
+
+    def test_migrate_shards_places_legacy_users_and_reserves_id_ranges(self):
+        with override_settings(SHARD_DATABASES=[], DATABASE_ROUTERS=[]):
+            legacy = User.objects.create_user('legacy')
+        call_command('migrate_shards', verbosity=0, stdout=io.StringIO())
+
+        self.assertEqual(UserShard.objects.get(user=legacy).database, 'default')
+        for alias, start in (('shard0', SHARD_ID_SPACING), ('shard1', 2 * SHARD_ID_SPACING)):
+            with connections[alias].cursor() as cursor:
+                cursor.execute("SELECT seq FROM sqlite_sequence WHERE name = 'accounts_expense'")
+                self.assertEqual(cursor.fetchone()[0], start)
+
+    # как в запросе: ShardMiddleware привязывает юзера к его шарду
+    def add_history(self, user, description):
+        with user_database(user.pk):
+            for day in (1, 2, 3):
+                Expense.objects.create(user=user, description=description, category='Food', amount=10, date=date(2026, 1, day))
+            Income.objects.create(user=user, description='Salary', source='Salary', amount=500, date=date(2026, 1, 1))
+            FinancialGoal.objects.create(user=user, name='Car', target=1000)
+
+    def fts_rows(self, alias, user):
+        with connections[alias].cursor() as cursor:
+            cursor.execute('SELECT count(*) FROM accounts_expense_fts WHERE accounts_expense_fts MATCH %s', [f'user_id:{user.pk}'])
+            return cursor.fetchone()[0]
+
+    def test_move_user_between_shards(self):
+        call_command('migrate_shards', verbosity=0, stdout=io.StringIO())
+        alice = User.objects.create_user('alice')
+        source = UserShard.objects.get(user=alice).database
+        target = 'shard1' if source == 'shard0' else 'shard0'
+        self.add_history(alice, 'Coffee beans')
+        # сосед по целевому шарду не должен пострадать
+        users = (User.objects.create_user(f'bob{i}') for i in range(20))
+        bob = next(user for user in users if UserShard.objects.get(user=user).database == target)
+        self.add_history(bob, 'Tea')
+        self.assertEqual(Expense.objects.using(source).filter(user_id=alice.pk).count(), 3)
+        self.assertEqual(self.fts_rows(source, alice), 3)
+
+        call_command('move_user_shard', 'alice', target, grace=0, stdout=io.StringIO())
+
+        placement = UserShard.objects.get(user=alice)
+        self.assertEqual((placement.database, placement.locked), (target, False))
+        for model in (UserProfile, Expense, Income, FinancialGoal, MonthlyTotal):
+            self.assertFalse(model.objects.using(source).filter(user_id=alice.pk).exists(), model.__name__)
+        self.assertFalse(User.objects.using(source).filter(pk=alice.pk).exists())
+        self.assertEqual(Expense.objects.using(target).filter(user_id=alice.pk).count(), 3)
+        self.assertEqual(Expense.objects.using(target).filter(user_id=bob.pk).count(), 3)
+
+        # индекс поиска: в старом шарде строки юзера ушли, в новом появились
+        self.assertEqual(self.fts_rows(source, alice), 0)
+        self.assertEqual(self.fts_rows(target, alice), 3)
+        self.assertEqual(len(search_transaction_ids(alice, 'coffee')), 3)
+        self.assertEqual(len(search_transaction_ids(bob, 'coffee')), 0)
+
+        # итоги переехали вместе с операциями и сходятся с ними
+        totals = MonthlyTotal.objects.using(target).filter(user_id=alice.pk)
+        self.assertEqual(totals.get(kind=MonthlyTotal.EXPENSE).total, Decimal('30'))
+        self.assertEqual(totals.get(kind=MonthlyTotal.INCOME).total, Decimal('500'))
+        self.assertEqual(rebuild_monthly_totals(alice), (0, 0, 0))
+        self.assertEqual(rebuild_monthly_totals(bob), (0, 0, 0))
+
+        # запись после переезда идёт в новый шард
+        with user_database(alice.pk):
+            Expense.objects.create(user=alice, description='Lunch', category='Food', amount=5, date=date(2026, 1, 4))
+        self.assertEqual(Expense.objects.using(target).filter(user_id=alice.pk).count(), 4)
+        self.assertEqual(totals.get(kind=MonthlyTotal.EXPENSE).count, 4)
+
+    def test_move_down_and_back_keeps_id_ranges(self):
+        call_command('migrate_shards', verbosity=0, stdout=io.StringIO())
+        users = (User.objects.create_user(f'carol{i}') for i in range(20))
+        carol = next(user for user in users if UserShard.objects.get(user=user).database == 'shard1')
+        self.add_history(carol, 'Coffee beans')
+        ids = set(Expense.objects.using('shard1').filter(user_id=carol.pk).values_list('pk', flat=True))
+        self.assertTrue(all(pk > 2 * SHARD_ID_SPACING for pk in ids))
+
+        call_command('move_user_shard', carol.username, 'shard0', grace=0, stdout=io.StringIO())
+        moved = list(Expense.objects.using('shard0').filter(user_id=carol.pk).order_by('date'))
+        self.assertEqual([expense.date.day for expense in moved], [1, 2, 3])
+        self.assertEqual(len(search_transaction_ids(carol, 'coffee')), 3)
+        with user_database(carol.pk):
+            Expense.objects.create(user=carol, description='Lunch', category='Food', amount=5, date=date(2026, 1, 4))
+        # все id в шарде 0 остались в его диапазоне, новые тоже
+        shard0_ids = Expense.objects.using('shard0').values_list('pk', flat=True)
+        self.assertTrue(all(SHARD_ID_SPACING < pk < 2 * SHARD_ID_SPACING for pk in shard0_ids))
+
+        # в шарде 1 за это время появились новые строки, обратный переезд не упирается в их ключи
+        dave = next(user for user in users if UserShard.objects.get(user=user).database == 'shard1')
+        self.add_history(dave, 'Tea')
+        call_command('move_user_shard', carol.username, 'shard1', grace=0, stdout=io.StringIO())
+        self.assertEqual(Expense.objects.using('shard1').filter(user_id=carol.pk).count(), 4)
+        self.assertEqual(Expense.objects.using('shard1').filter(user_id=dave.pk).count(), 3)
+        self.assertEqual(rebuild_monthly_totals(carol), (0, 0, 0))
+
+
+class SeedAndBenchmarkTests(TestCase):
+    def test_seeded_data_is_consistent_and_benchmarkable(self):
+        call_command('seed_finance_data', users=2, expenses=50, incomes=5, seed=1, stdout=io.StringIO())
+        self.assertEqual(User.objects.filter(username__startswith='seed').count(), 2)
+        self.assertEqual(rebuild_monthly_totals(), (0, 0, 0))
+
+        out = io.StringIO()
+        call_command('benchmark_views', users=1, iterations=2, stdout=out)
+        report = json.loads(out.getvalue())
+        self.assertEqual(report['views']['profile']['requests'], 2)
+        self.assertIn('p99_ms', report['views']['add_expense'])
+
+
+class SqlitePragmaTests(TestCase):
+    # новое соединение к временному файлу, журнал тестовой базы не трогаем
+    def read_pragmas(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            wrapper = connections['default'].__class__(
+                {**connection.settings_dict, 'NAME': f'{tmp}/pragmas.sqlite3'}, alias='pragma_check',
+            )
+            try:
+                with wrapper.cursor() as cursor:
+                    cursor.execute('PRAGMA journal_mode')
+                    journal_mode = cursor.fetchone()[0]
+                    cursor.execute('PRAGMA synchronous')
+                    synchronous = cursor.fetchone()[0]
+            finally:
+                wrapper.close()
+        return journal_mode, synchronous
+
+    @override_settings(DB_MODE='production')
+    def test_production_mode_applies_pragmas(self):
+        # synchronous: 1 = NORMAL
+        self.assertEqual(self.read_pragmas(), ('wal', 1))
+
+    @override_settings(DB_MODE='default')
+    def test_default_mode_keeps_sqlite_defaults(self):
+        # synchronous: 2 = FULL
+        self.assertEqual(self.read_pragmas(), ('delete', 2))
@@ -7,6 +7,7 @@ from .views import (
     dashboard_view,
     profile_view,
     edit_profile_view,
+    delete_account_view,
     add_expense_view,
     add_income_view,
     delete_expense_view,
@@ -15,9 +16,15 @@ from .views import (
     update_budgets_view,
     add_goal_view,
     edit_goal_view,
-    delete_goal_view
+    delete_goal_view,
+    ledger_view,
+    ledger_bulk_view,
+    import_transactions_view,
+    export_transactions_view,
+    metrics_view
     , terms_view
 )
+from .api import summary_api, search_api, transactions_api, transactions_batch_api, expenses_api, incomes_api, goals_api
 
 
 urlpatterns = [
@@ -27,6 +34,7 @@ urlpatterns = [
     path('', dashboard_view, name='dashboard'),
     path('profile/', profile_view, name='profile'),
     path('profile/edit/', edit_profile_view, name='edit_profile'),
+    path('profile/delete-account/', delete_account_view, name='delete_account'),
     path('profile/add-expense/', add_expense_view, name='add_expense'),
     path('profile/add-income/', add_income_view, name='add_income'),
     path('profile/delete-expense/<int:expense_id>/', delete_expense_view, name='delete_expense'),
@@ -35,7 +43,19 @@ urlpatterns = [
     path('explore/add-goal/', add_goal_view, name='add_goal'),
     path('explore/edit-goal/<int:goal_id>/', edit_goal_view, name='edit_goal'),
     path('explore/delete-goal/<int:goal_id>/', delete_goal_view, name='delete_goal'),
+    path('profile/ledger/', ledger_view, name='ledger'),
+    path('profile/ledger/bulk/', ledger_bulk_view, name='ledger_bulk'),
+    path('profile/import/', import_transactions_view, name='import_transactions'),
+    path('profile/export/', export_transactions_view, name='export_transactions'),
     path('profile/update-budgets/', update_budgets_view, name='update_budgets'),
     path('activate/<uidb64>/<token>/', activate_email, name='activate'),
     path('terms/', terms_view, name='terms'),
+    path('metrics/', metrics_view, name='metrics'),
+    path('api/summary/', summary_api, name='api_summary'),
+    path('api/transactions/', transactions_api, name='api_transactions'),
+    path('api/search/', search_api, name='api_search'),
+    path('api/transactions/batch/', transactions_batch_api, name='api_transactions_batch'),
+    path('api/expenses/', expenses_api, name='api_expenses'),
+    path('api/incomes/', incomes_api, name='api_incomes'),
+    path('api/goals/', goals_api, name='api_goals'),
 ]
@@ -1,25 +1,38 @@
 from django.shortcuts import render, redirect
+from django.urls import reverse
 from django.contrib.auth import login, logout, authenticate
 from django.contrib.auth.decorators import login_required
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.forms import AuthenticationForm
 from django.contrib.auth.models import User
 from django.contrib.sites.shortcuts import get_current_site
 from django.template.loader import render_to_string
 from django.utils.http import urlsafe_base64_encode, urlsafe_base64_decode
 from django.utils.encoding import force_bytes, force_str
-from django.core.mail import EmailMessage
-from django.db.models import Sum
+from django.db import transaction
+from django.views.decorators.http import require_POST
 from django.contrib import messages
 from django.conf import settings
-from datetime import datetime
+from datetime import date
 from decimal import Decimal, InvalidOperation
+import csv
+import io
 import logging
-import smtplib
 
 from .tokens import email_verification_token
 from .forms import RegisterForm, EditProfileForm
-from .models import UserProfile, Expense, Income, Budget, FinancialGoal
-from django.http import HttpResponse
+from .models import Expense, Income, FinancialGoal, OutboundEmail, get_profile
+from .services import (
+    build_dashboard_context, build_profile_context, build_goals_context, get_ledger_page,
+    select_transactions, bulk_delete_transactions, bulk_recategorize_transactions
+)
+from .summary_cache import cached_summary
+from .importer import import_transactions
+from .exporter import EXPORT_FORMATS, aexport_chunks
+from .metrics import registry
+from .purge import purge_requested, request_account_purge
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, StreamingHttpResponse, QueryDict
 
 logger = logging.getLogger(__name__)
 
@@ -43,197 +56,174 @@ def logout_view(request):
 # главная страница
 @login_required
 def dashboard_view(request):
-    profile, created = UserProfile.objects.get_or_create(user=request.user)
-    
-    # последние расходы
-    expense_list = Expense.objects.filter(user=request.user).order_by('-date')[:10]
-    income_list = Income.objects.filter(user=request.user).order_by('-date')[:10]
-    
-    investments_count = FinancialGoal.objects.filter(user=request.user).count()
-    
-    # считаем по месяцам
-    today = datetime.now().date()
-    current_month_start = today.replace(day=1)
-    
-    monthly_budget = profile.monthly_budget or Decimal('0')
-    monthly_spent = Expense.objects.filter(
-        user=request.user,
-        date__gte=current_month_start
-    ).aggregate(total=Sum('amount'))['total'] or Decimal('0')
-    
-    monthly_income = Income.objects.filter(
-        user=request.user,
-        date__gte=current_month_start
-    ).aggregate(total=Sum('amount'))['total'] or Decimal('0')
-    
-    portfolio_value = monthly_budget - monthly_spent
-    
-    budget_categories = []
-    budgets = Budget.objects.filter(user=request.user, month__gte=current_month_start)
-    
-    for budget in budgets:
-        spent = Expense.objects.filter(
-            user=request.user,
-            category=budget.category,
-            date__gte=current_month_start
-        ).aggregate(total=Sum('amount'))['total'] or Decimal('0')
-        
-        budget_categories.append({
-            'name': budget.category,
-            'limit': budget.limit,
-            'spent': spent,
-            'is_over': spent > budget.limit,
-            'percent': min(int((spent / budget.limit) * 100) if budget.limit > 0 else 0, 100)
-        })
-    
-    total_expenses = sum(Decimal(str(exp.amount)) for exp in expense_list)
-    total_income = sum(Decimal(str(inc.amount)) for inc in income_list)
-    
-    context = {
-        'investments_count': investments_count,
-        'portfolio_value': portfolio_value,
-        'expense_list': expense_list,
-        'income_list': income_list,
-        'total_expenses': total_expenses,
-        'total_income': total_income,
-        'monthly_income': monthly_income,
-        'budget_categories': budget_categories,
-    }
-    
+    context = cached_summary('dashboard', request.user, lambda: build_dashboard_context(request.user))
     return render(request, 'accounts/dashboard.html', context)
 
 
 @login_required
 def profile_view(request):
-    profile, created = UserProfile.objects.get_or_create(user=request.user)
-    
-    expense_list = Expense.objects.filter(user=request.user).order_by('-date')[:10]
-    income_list = Income.objects.filter(user=request.user).order_by('-date')[:10]
-    
-    investments_count = FinancialGoal.objects.filter(user=request.user).count()
-    
-    portfolio_value = FinancialGoal.objects.filter(user=request.user).aggregate(
-        total=Sum('saved')
-    )['total'] or 0
-    
-    today = datetime.now().date()
-    current_month_start = today.replace(day=1)
-    
-    budget_categories = []
-    budgets = Budget.objects.filter(user=request.user, month__gte=current_month_start)
-    
-    for budget in budgets:
-        spent = Expense.objects.filter(
-            user=request.user,
-            category=budget.category,
-            date__gte=current_month_start
-        ).aggregate(total=Sum('amount'))['total'] or Decimal('0')
-        
-        budget_categories.append({
-            'name': budget.category,
-            'limit': budget.limit,
-            'spent': spent,
-            'is_over': spent > budget.limit,
-            'percent': min(int((spent / budget.limit) * 100) if budget.limit > 0 else 0, 100)
-        })
-    
-    total_budget = budgets.aggregate(total=Sum('limit'))['total'] or Decimal('0')
-    spent_total = sum(Decimal(str(cat['spent'])) for cat in budget_categories)
-    remaining_total = total_budget - spent_total
-    total_budget_percent = int((spent_total / total_budget) * 100) if total_budget > 0 else 0
-    
-    goals = FinancialGoal.objects.filter(user=request.user)
-    
-    monthly_budget = profile.monthly_budget or Decimal('0')
-    lifetime_budget = profile.lifetime_budget or Decimal('0')
-
-    monthly_spent = Expense.objects.filter(
-        user=request.user,
-        date__gte=current_month_start
-    ).aggregate(total=Sum('amount'))['total'] or Decimal('0')
-    
-    monthly_income = Income.objects.filter(
-        user=request.user,
-        date__gte=current_month_start
-    ).aggregate(total=Sum('amount'))['total'] or Decimal('0')
-
-    lifetime_spent = Expense.objects.filter(
-        user=request.user
-    ).aggregate(total=Sum('amount'))['total'] or Decimal('0')
-    
-    lifetime_income = Income.objects.filter(
-        user=request.user
-    ).aggregate(total=Sum('amount'))['total'] or Decimal('0')
-
-    monthly_percent = int((monthly_spent / monthly_budget) * 100) if monthly_budget > 0 else 0
-    lifetime_percent = int((lifetime_spent / lifetime_budget) * 100) if lifetime_budget > 0 else 0
-
-    monthly_remaining = monthly_budget - monthly_spent + monthly_income
-    lifetime_remaining = lifetime_budget - lifetime_spent + lifetime_income
-    
-    monthly_net = monthly_income - monthly_spent
-    
-    context = {
-        'investments_count': investments_count,
-        'portfolio_value': portfolio_value,
-        'expense_list': expense_list,
-        'income_list': income_list,
-        'budget_categories': budget_categories,
-        'total_budget': total_budget,
-        'spent_total': spent_total,
-        'remaining_total': remaining_total,
-        'total_budget_percent': total_budget_percent,
-        'goals': goals,
-        'monthly_budget': monthly_budget,
-        'monthly_spent': monthly_spent,
-        'monthly_income': monthly_income,
-        'monthly_net': monthly_net,
-        'monthly_percent': monthly_percent,
-        'monthly_remaining': monthly_remaining,
-        'lifetime_budget': lifetime_budget,
-        'lifetime_spent': lifetime_spent,
-        'lifetime_income': lifetime_income,
-        'lifetime_percent': lifetime_percent,
-        'lifetime_remaining': lifetime_remaining,
-    }
-    
+    context = cached_summary('profile', request.user, lambda: build_profile_context(request.user))
     return render(request, 'accounts/profile.html', context)
 
 
 @login_required
 def investments_goals_view(request):
-    goals = FinancialGoal.objects.filter(user=request.user)
-    
-    today = datetime.now().date()
-    current_month_start = today.replace(day=1)
-    
-    monthly_income = Income.objects.filter(
-        user=request.user,
-        date__gte=current_month_start
-    ).aggregate(total=Sum('amount'))['total'] or Decimal('0')
-    
-    monthly_spent = Expense.objects.filter(
-        user=request.user,
-        date__gte=current_month_start
-    ).aggregate(total=Sum('amount'))['total'] or Decimal('0')
-    
-    monthly_net = monthly_income - monthly_spent
-    
-    context = {
-        'goals': goals,
-        'monthly_net': monthly_net,
-    }
-    
+    context = cached_summary('goals', request.user, lambda: build_goals_context(request.user))
     return render(request, 'accounts/investments_goals.html', context)
 
 
+# все операции одной лентой
+@login_required
+def ledger_view(request):
+    category = request.GET.get('category') or None
+    source = request.GET.get('source') or None
+    date_from = _parse_date(request.GET.get('date_from'))
+    date_to = _parse_date(request.GET.get('date_to'))
+    with_balance = request.GET.get('balance') == '1'
+
+    entries, next_cursor = get_ledger_page(
+        request.user,
+        after=request.GET.get('after'),
+        category=category,
+        source=source,
+        date_from=date_from,
+        date_to=date_to,
+        with_balance=with_balance,
+    )
+
+    params = request.GET.copy()
+    params.pop('after', None)
+    first_query = params.urlencode()
+    next_query = None
+    if next_cursor:
+        params['after'] = next_cursor
+        next_query = params.urlencode()
+
+    return render(request, 'accounts/ledger.html', {
+        'entries': entries,
+        'next_query': next_query,
+        'first_query': first_query,
+        'is_first_page': not request.GET.get('after'),
+        'categories': Expense.CATEGORIES,
+        'sources': Income.SOURCES,
+        'category': category,
+        'source': source,
+        'date_from': date_from,
+        'date_to': date_to,
+        'with_balance': with_balance,
+    })
+
+
+# массовые действия из истории: отмеченные строки или всё, что подходит под фильтр
+@login_required
+def ledger_bulk_view(request):
+    params = request.POST.get('filters', '')
+    redirect_url = f"{reverse('ledger')}?{params}" if params else reverse('ledger')
+    if request.method != 'POST':
+        return redirect(redirect_url)
+
+    if request.POST.get('scope') == 'filter':
+        filters = QueryDict(params)
+        selection = select_transactions(
+            request.user,
+            category=filters.get('category') or None,
+            source=filters.get('source') or None,
+            date_from=_parse_date(filters.get('date_from')),
+            date_to=_parse_date(filters.get('date_to')),
+        )
+    else:
+        ids = {'expense': [], 'income': []}
+        for value in request.POST.getlist('selected'):
+            kind, _, pk = value.partition(':')
+            if kind in ids and pk.isdigit():
+                ids[kind].append(int(pk))
+        if not ids['expense'] and not ids['income']:
+            messages.error(request, 'Select at least one transaction')
+            return redirect(redirect_url)
+        selection = select_transactions(request.user, ids=ids)
+
+    action = request.POST.get('action')
+    if action == 'delete':
+        counts = bulk_delete_transactions(request.user, selection)
+        messages.success(request, f"Deleted {counts['expense']} expenses and {counts['income']} incomes")
+    elif action == 'recategorize':
+        category = request.POST.get('new_category') or None
+        source = request.POST.get('new_source') or None
+        if category not in dict(Expense.CATEGORIES) and source not in dict(Income.SOURCES):
+            messages.error(request, 'Choose a new category or source')
+            return redirect(redirect_url)
+        counts = bulk_recategorize_transactions(
+            request.user, selection,
+            category=category if category in dict(Expense.CATEGORIES) else None,
+            source=source if source in dict(Income.SOURCES) else None,
+        )
+        messages.success(request, f"Updated {counts['expense']} expenses and {counts['income']} incomes")
+    else:
+        messages.error(request, 'Unknown action')
+    return redirect(redirect_url)
+
+
+# импорт истории из CSV
+@login_required
+def import_transactions_view(request):
+    if request.method == 'POST':
+        upload = request.FILES.get('file')
+        if not upload:
+            messages.error(request, 'Choose a CSV file to import')
+            return render(request, 'accounts/import_transactions.html')
+
+        try:
+            result = import_transactions(request.user, io.TextIOWrapper(upload.file, encoding='utf-8-sig', newline=''))
+        except (UnicodeDecodeError, csv.Error) as e:
+            messages.error(request, f'Could not read the file: {str(e)}')
+            return render(request, 'accounts/import_transactions.html')
+
+        logger.info(f"CSV import for {request.user.username}: {result}")
+        messages.success(request, str(result))
+        for error in result.errors[:5]:
+            messages.warning(request, error)
+        return redirect('ledger')
+
+    return render(request, 'accounts/import_transactions.html')
+
+
+# выгрузка всей истории потоком
+@login_required
+def export_transactions_view(request):
+    export_format = request.GET.get('format', 'csv')
+    if export_format not in EXPORT_FORMATS:
+        return HttpResponse('Unknown export format', status=400)
+
+    generate, content_type = EXPORT_FORMATS[export_format]
+    filename = f'cashly-{request.user.username}-{date.today().isoformat()}.{export_format}'
+    lines = generate(request.user)
+    if isinstance(request, ASGIRequest):
+        lines = aexport_chunks(lines)
+    response = StreamingHttpResponse(lines, content_type=f'{content_type}; charset=utf-8')
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
+def _parse_date(value):
+    try:
+        return date.fromisoformat(value)
+    except (TypeError, ValueError):
+        return None
+
+
+# метрики для Prometheus, только для staff
+@staff_member_required
+def metrics_view(request):
+    return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
 def terms_view(request):
     return render(request, 'accounts/terms.html')
 
 
 @login_required
 def update_budgets_view(request):
-    profile, _ = UserProfile.objects.get_or_create(user=request.user)
+    profile = get_profile(request.user)
     if request.method == 'POST':
         try:
             mb = request.POST.get('monthly_budget', '')
@@ -251,7 +241,7 @@ def update_budgets_view(request):
 
 @login_required
 def edit_profile_view(request):
-    profile, created = UserProfile.objects.get_or_create(user=request.user)
+    profile = get_profile(request.user)
     
     if request.method == 'POST':
         form = EditProfileForm(request.POST, request.FILES, instance=profile, user=request.user)
@@ -267,6 +257,19 @@ def edit_profile_view(request):
     return render(request, 'accounts/edit_profile.html', {'form': form})
 
 
+# удаление аккаунта: сразу деактивируем и разлогиниваем, историю удаляет purge_accounts в фоне
+@login_required
+def delete_account_view(request):
+    if request.method != 'POST':
+        return render(request, 'accounts/delete_account.html')
+
+    user = request.user
+    request_account_purge(user)
+    logout(request)
+    messages.success(request, f'Account {user.username} has been deleted.')
+    return redirect('login')
+
+
 # добавить расход
 @login_required
 def add_expense_view(request):
@@ -347,6 +350,7 @@ def add_income_view(request):
 
 # удалить расход
 @login_required
+@require_POST
 def delete_expense_view(request, expense_id):
     expense = Expense.objects.filter(user=request.user, id=expense_id).first()
     
@@ -361,6 +365,7 @@ def delete_expense_view(request, expense_id):
 
 # удалить доход
 @login_required
+@require_POST
 def delete_income_view(request, income_id):
     income = Income.objects.filter(user=request.user, id=income_id).first()
     
@@ -378,11 +383,25 @@ def register_view(request):
     if request.method == 'POST':
         form = RegisterForm(request.POST)
         if form.is_valid():
-            user = form.save(commit=False)
-            user.is_active = False  # активируем по email
-            user.save()
-            
-            UserProfile.objects.get_or_create(user=user)
+            # письмо кладём в outbox в той же транзакции, отправляет send_outbound_emails
+            with transaction.atomic():
+                user = form.save(commit=False)
+                user.is_active = False  # активируем по email
+                user.save()  # профиль создаёт сигнал create_user_profile
+
+                if settings.EMAIL_CONFIGURED:
+                    message = render_to_string('accounts/email_confirm.html', {
+                        'user': user,
+                        'domain': request.get_host(),
+                        'uid': urlsafe_base64_encode(force_bytes(user.pk)),
+                        'token': email_verification_token.make_token(user),
+                    })
+                    OutboundEmail.objects.create(
+                        to=user.email,
+                        subject='Подтверждение email',
+                        body=message,
+                        from_email=settings.DEFAULT_FROM_EMAIL,
+                    )
 
             if not settings.EMAIL_CONFIGURED:
                 logger.warning("Email not configured. User created but email not sent.")
@@ -395,37 +414,8 @@ def register_view(request):
                     'message': 'Your account has been created but email verification could not be sent due to server configuration. Please contact support.'
                 })
 
-            mail_subject = 'Подтверждение email'
-            domain = request.get_host()
-            message = render_to_string('accounts/email_confirm.html', {
-                'user': user,
-                'domain': domain,
-                'uid': urlsafe_base64_encode(force_bytes(user.pk)),
-                'token': email_verification_token.make_token(user),
-            })
-
-            email = EmailMessage(
-                mail_subject,
-                message,
-                from_email=settings.DEFAULT_FROM_EMAIL,
-                to=[user.email]
-            )
-            
-            try:
-                email.send(fail_silently=False)
-                logger.info(f"Confirmation email sent successfully to {user.email}")
-                return render(request, 'accounts/email_sent.html')
-            except smtplib.SMTPAuthenticationError as e:
-                logger.error(f"SMTP Authentication Error: {str(e)}")
-                messages.error(request, 'Email service authentication failed. Please check server configuration.')
-                return render(request, 'accounts/email_sent.html', {
-                    'email_error': True,
-                    'message': 'Your account has been created but email verification could not be sent. Please contact support.'
-                })
-            except Exception as e:
-                logger.error(f"Email sending failed: {str(e)}")
-                messages.error(request, f'Failed to send confirmation email: {str(e)}')
-                return render(request, 'accounts/register.html', {'form': form})
+            logger.info(f"Confirmation email queued for {user.email}")
+            return render(request, 'accounts/email_sent.html')
     else:
         form = RegisterForm()
 
@@ -479,6 +469,7 @@ def edit_goal_view(request, goal_id):
 
 # удалить цель
 @login_required
+@require_POST
 def delete_goal_view(request, goal_id):
     goal = FinancialGoal.objects.filter(user=request.user, id=goal_id).first()
     
@@ -498,7 +489,7 @@ def activate_email(request, uidb64, token):
     except:
         user = None
 
-    if user and email_verification_token.check_token(user, token):
+    if user and email_verification_token.check_token(user, token) and not purge_requested(user.pk):
         user.is_active = True
         user.save()
         return render(request, 'accounts/email_confirmed.html')
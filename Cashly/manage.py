@@ -6,7 +6,9 @@ import sys
 
 def main():
     """Run administrative tasks."""
-    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'Cashly.settings')
+    # тесты по умолчанию идут с Cashly.test_settings (отдельные тестовые базы шардов и реплики)
+    settings_module = 'Cashly.test_settings' if sys.argv[1:2] == ['test'] else 'Cashly.settings'
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', settings_module)
     try:
         from django.core.management import execute_from_command_line
     except ImportError as exc: